@@ -0,0 +1,67 @@
+"""
+Measures the memory footprint of the kaspa_model objects (TxOut, TxIn, TxScript, Tx).
+The objects are built the way the UTXO set code builds them (see dnld_utxo_set_command), and the
+footprint is measured with tracemalloc, so it includes the objects' fields (bytes, lists, scripts).
+
+Run: python -m kaspy_tools.examples.model_memory_benchmark [count]
+"""
+import os
+import sys
+import tracemalloc
+from kaspy_tools.kaspa_model.tx import Tx, NATIVE_SUBNETWORK, VERSION_1
+from kaspy_tools.kaspa_model.tx_in import TxIn
+from kaspy_tools.kaspa_model.tx_out import TxOut
+from kaspy_tools.kaspa_model.tx_script import TxScript
+
+
+def make_utxo_outputs(count):
+    return [TxOut.tx_out_factory(value=1000 + i,
+                                 script_pub_key=TxScript.parse_tx_script(raw_script=make_p2pkh_script_hex()),
+                                 tx_id=os.urandom(32).hex(), out_index=i % 4) for i in range(count)]
+
+
+def make_inputs(count):
+    return [TxIn.tx_in_factory(previous_tx_id_bytes=os.urandom(32), previous_tx_out_index=i % 4,
+                               sig_script=TxScript.script_sig_factory(os.urandom(64), os.urandom(33), b'\x01'),
+                               sequence_bytes=bytes(8)) for i in range(count)]
+
+
+def make_txs(count):
+    return [Tx.tx_factory(version_bytes=VERSION_1, tx_in_list=make_inputs(2), tx_out_list=make_utxo_outputs(2),
+                          locktime_int=0, subnetwork_id_bytes=NATIVE_SUBNETWORK) for i in range(count)]
+
+
+def make_p2pkh_script_hex():
+    return bytes(TxScript.script_pub_hush_factory(os.urandom(20))).hex()
+
+
+def measure(make_objects, count):
+    """
+    :param make_objects: A function that builds a list of count objects
+    :param count: Number of objects to build
+    :return: The average footprint of an object (in bytes)
+    """
+    tracemalloc.start()
+    start = tracemalloc.take_snapshot()
+    objects = make_objects(count)
+    end = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in end.compare_to(start, 'filename'))
+    del objects
+    return total / count
+
+
+def run_benchmark(count=20000):
+    print('object                         bytes/object   (shallow sizeof)')
+    results = {}
+    for name, make_objects, sample in (
+            ('TxOut (utxo, with script)', make_utxo_outputs, TxOut()),
+            ('TxIn (with sig script)', make_inputs, TxIn()),
+            ('Tx (2 inputs, 2 outputs)', make_txs, Tx())):
+        results[name] = measure(make_objects, count)
+        print('{:<30} {:>12.0f}   ({})'.format(name, results[name], sys.getsizeof(sample)))
+    return results
+
+
+if __name__ == '__main__':
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
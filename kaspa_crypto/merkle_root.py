@@ -2,22 +2,126 @@ from kaspy_tools.utils.general_utils import hash_256
 # old name:
 # def loop_through_txs_hashes_list(txs_hashes_list):
 
+
 class MerkleTree:
+    """
+    A Merkle tree that keeps all of its levels.
+    levels[0] holds the leaves (e.g: tx hashes), and each level holds the hashes of pairs of the level below it.
+    When a level has an odd number of elements, the last one is paired with itself.
+    Appending a leaf or updating a leaf re-hashes only the path from the leaf to the root (O(log n)).
+    """
+
+    def __init__(self, leaves=None):
+        """
+        :param leaves: A list of leaf hashes (bytes). The list is copied, not changed.
+        """
+        self._levels = [list(leaves) if leaves else []]
+        level = self._levels[0]
+        while len(level) > 1:
+            level = [self._hash_pair(level, i) for i in range(0, len(level), 2)]
+            self._levels.append(level)
+
     @classmethod
-    def merkle_root(cls,elements):
-        def get_parent_level(elements):
-            parent_level = []
-            if len(elements) % 2 == 1:
-                elements.append(elements[-1])
-            for i in range(0, len(elements), 2):
-                parent_level.append(hash_256(elements[i] + elements[i+1]))
-            return parent_level
-
-        if len(elements) == 1:
-            return elements[0]
-
-        current_level = elements.copy()
-        while len(current_level) > 1:
-            current_level = get_parent_level(current_level)
-
-        return current_level[0]
+    def merkle_root(cls, elements):
+        """
+        :param elements: A list of leaf hashes (bytes). The list is not changed.
+        :return: The Merkle root (bytes)
+        """
+        return cls(elements).root
+
+    @staticmethod
+    def _hash_pair(level, left_index):
+        left = level[left_index]
+        right = level[left_index + 1] if left_index + 1 < len(level) else left
+        return hash_256(left + right)
+
+    # ========== Get Methods ========== #
+
+    @property
+    def root(self):
+        """
+        :return: The Merkle root (bytes), or None if the tree has no leaves
+        """
+        top_level = self._levels[-1]
+        return top_level[0] if top_level else None
+
+    @property
+    def levels(self):
+        """
+        :return: A list of the levels (lists of hashes), from the leaves up to the root
+        """
+        return self._levels
+
+    def __len__(self):
+        return len(self._levels[0])
+
+    def leaf(self, index):
+        return self._levels[0][index]
+
+    # ========== Update Methods ========== #
+
+    def append(self, leaf):
+        """
+        Add a leaf at the end of the tree, and update the hashes on its path to the root.
+        :param leaf: A leaf hash (bytes)
+        :return: The new root
+        """
+        self._levels[0].append(leaf)
+        return self._update_path(len(self._levels[0]) - 1)
+
+    def update(self, index, leaf):
+        """
+        Replace a leaf, and update the hashes on its path to the root.
+        :param index: The index of the leaf
+        :param leaf: The new leaf hash (bytes)
+        :return: The new root
+        """
+        self._levels[0][index] = leaf
+        return self._update_path(index)
+
+    def _update_path(self, index):
+        level_number = 0
+        while len(self._levels[level_number]) > 1:
+            parent_index = index // 2
+            parent = self._hash_pair(self._levels[level_number], parent_index * 2)
+            if level_number + 1 == len(self._levels):
+                self._levels.append([])
+            parent_level = self._levels[level_number + 1]
+            if parent_index == len(parent_level):
+                parent_level.append(parent)
+            else:
+                parent_level[parent_index] = parent
+            index = parent_index
+            level_number += 1
+        return self.root
+
+    # ========== Inclusion Proofs ========== #
+
+    def proof(self, index):
+        """
+        Build an inclusion proof for a leaf.
+        :param index: The index of the leaf
+        :return: A list of (sibling hash, sibling_is_right) pairs, from the leaf level up to the root
+        """
+        proof = []
+        for level in self._levels[:-1]:
+            sibling_index = index ^ 1
+            if sibling_index >= len(level):     # the last element of an odd level is paired with itself
+                sibling_index = index
+            proof.append((level[sibling_index], sibling_index >= index))
+            index //= 2
+        return proof
+
+    @staticmethod
+    def verify_proof(leaf, proof, root):
+        """
+        Check an inclusion proof (see proof()).
+        :param leaf: The leaf hash (bytes)
+        :param proof: A list of (sibling hash, sibling_is_right) pairs
+        :param root: The expected Merkle root
+        :return: True if the proof leads from leaf to root
+        """
+        current = leaf
+        for sibling, sibling_is_right in proof:
+            current = hash_256(current + sibling) if sibling_is_right else hash_256(sibling + current)
+        return current == root
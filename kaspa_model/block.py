@@ -1,20 +1,130 @@
-from io import BytesIO
+from collections.abc import MutableSequence
 from kaspy_tools.logs import config_logger
 from kaspy_tools.kaspa_model.tx import Tx
+from kaspy_tools.kaspa_model.cached_bytes import CachedBytes
+from kaspy_tools.kaspa_crypto.merkle_root import MerkleTree
 from kaspy_tools.utils import general_utils
 
 KT_logger = config_logger.get_kaspy_tools_logger()
 
 
-class Block:
+class LazyTxList(MutableSequence):
+    """
+    The list of native txs of a lazily parsed block (see Block.parse_block).
+    Holds a table of tx offsets into the raw block, and decodes each Tx only when it is first read.
+    Decoded Tx objects (and Tx objects added later) are kept, so reading again returns the same object.
+    Changes to the list (and to decoded txs) invalidate the cached bytes of the owner block.
+    """
+
+    def __init__(self, block_view, tx_offsets):
+        """
+        :param block_view: A memoryview of the raw block
+        :param tx_offsets: A list of (start, end) offsets, one pair for each native tx in the block
+        """
+        self._block_view = block_view
+        self._tx_offsets = tx_offsets
+        self._tx_objs = [None] * len(tx_offsets)
+        self._owner_block = None    # set by the Block that holds this list
+
+    def __len__(self):
+        return len(self._tx_objs)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        tx_obj = self._tx_objs[index]
+        if tx_obj is None:
+            tx_obj = Tx.parse_tx_at(self._block_view, self._tx_offsets[index][0])[0]
+            self._tx_objs[index] = tx_obj
+            self._link_to_owner(tx_obj)
+        return tx_obj
+
+    def __setitem__(self, index, tx_obj):
+        self._tx_objs[index] = tx_obj
+        self._tx_offsets[index] = None
+        self._invalidate_owner()
+
+    def __delitem__(self, index):
+        del self._tx_objs[index]
+        del self._tx_offsets[index]
+        self._invalidate_owner()
+
+    def insert(self, index, tx_obj):
+        self._tx_objs.insert(index, tx_obj)
+        self._tx_offsets.insert(index, None)
+        self._invalidate_owner()
+
+    def _link_to_owner(self, tx_obj):
+        # decoding does not change the block, so its cached bytes are kept. The decoded tx may be changed by the
+        # caller later: it is linked to the block, so that a change invalidates them
+        if self._owner_block is not None:
+            self._owner_block._link_children((tx_obj,))
+
+    def _invalidate_owner(self):
+        if self._owner_block is not None:
+            self._owner_block.invalidate_bytes()
+
+    def tx_bytes(self, index):
+        """
+        Get the bytes of a single tx.
+        A tx that was never decoded is copied directly from the raw block, without decoding it.
+        :param index: The index of the tx in the list
+        :return: The tx as bytes
+        """
+        if self._tx_objs[index] is None:
+            start, end = self._tx_offsets[index]
+            return self._block_view[start:end].tobytes()
+        return bytes(self._tx_objs[index])
+
+    def tx_size(self, index):
+        """
+        :param index: The index of the tx in the list
+        :return: The serialized size of a single tx (without decoding it)
+        """
+        if self._tx_objs[index] is None:
+            start, end = self._tx_offsets[index]
+            return end - start
+        return self._tx_objs[index].serialized_size()
+
+    def write_tx_into(self, index, buffer, offset):
+        """
+        Write a single tx into a preallocated buffer (see CachedBytes.write_into).
+        A tx that was never decoded is copied directly from the raw block.
+        :param index: The index of the tx in the list
+        :param buffer: A bytearray (or writable memoryview) to write into
+        :param offset: The offset to write at
+        :return: The offset right after the tx
+        """
+        if self._tx_objs[index] is None:
+            start, end = self._tx_offsets[index]
+            return general_utils.write_bytes_into(buffer, offset, self._block_view[start:end])
+        return self._tx_objs[index].write_into(buffer, offset)
+
+    def decoded_txs(self):
+        """
+        :return: A list of the txs that were already decoded into Tx objects
+        """
+        return [tx_obj for tx_obj in self._tx_objs if tx_obj is not None]
+
+    @property
+    def decoded_count(self):
+        """
+        :return: The number of txs that were already decoded into Tx objects
+        """
+        return len(self._tx_objs) - self._tx_objs.count(None)
+
+
+class Block(CachedBytes):
     """
     A kaspanet block.
+    The block body bytes are cached (see CachedBytes). The header is not cached, since it is small and
+    changes on every nonce.
     """
 
     def __init__(self, *, version_bytes=None, num_of_parent_blocks_bytes=None, parent_hashes=None,
                  hash_merkle_root_bytes=None, id_merkle_root_bytes=None, utxo_commitment_bytes=None,
                  timestamp_bytes=None, bits_bytes=None, nonce_bytes=None, num_of_txs_in_block_bytes=None,
-                 coinbase_tx_bytes=None, native_tx_list_of_objs=None):
+                 coinbase_tx_bytes=None, coinbase_tx_obj=None, native_tx_list_of_objs=None):
         """
         A constructor for a block. Due to historical reasons accept most fields in raw bytes form.
         Don't use it to create a new Block object.
@@ -31,8 +141,10 @@ class Block:
         :param num_of_txs_in_block_bytes:  A VarInt value (bytes) specifying the number of txs
                     present in this block (including coinbase).
         :param coinbase_tx_bytes:  The coinbase tx (in bytes)
+        :param coinbase_tx_obj:  The coinbase tx (Tx object)
         :param native_tx_list_of_objs: A list containing bytes representations of all native txs.
         """
+        super().__init__()
         self._version_bytes = version_bytes
         self._version_int = None
         self._number_of_parent_blocks = None
@@ -41,6 +153,7 @@ class Block:
         self._hash_merkle_root_bytes = hash_merkle_root_bytes
         self._id_merkle_root_bytes = id_merkle_root_bytes
         self._utxo_commitment_bytes = utxo_commitment_bytes
+        self._timestamp_int = None
         self._timestamp_bytes = timestamp_bytes
         self._bits_int = None
         self._bits_bytes = bits_bytes
@@ -48,9 +161,12 @@ class Block:
         # self._nonce_int = int.from_bytes(self._nonce_bytes, byteorder='little')
         self._num_of_txs_in_block_int = None
         self._num_of_txs_in_block_bytes = num_of_txs_in_block_bytes
-        self._coinbase_tx_obj = None
+        self._coinbase_tx_obj = coinbase_tx_obj
         self._coinbase_tx_bytes = coinbase_tx_bytes
         self._native_tx_list_of_objs = native_tx_list_of_objs
+        if isinstance(native_tx_list_of_objs, LazyTxList):
+            native_tx_list_of_objs._owner_block = self
+        self._hash_merkle_tree = None   # built by the hash_merkle_tree property
 
     @classmethod
     def block_factory(cls, *, version_int=268435456, version_bytes=None, num_of_parent_blocks=None, parent_hashes=None,
@@ -111,72 +227,124 @@ class Block:
     # ========== Parsing Methods ========== #
 
     @staticmethod
-    def parse_block(block_bytes):
+    def parse_block(block_bytes, lazy=False):
         """
         Parse the block data into "block header" and "block body".
         Returns a Block class object with the parsed information.
-
-        :param block_bytes: The block data as bytes
+        Parsing is zero-copy: it walks offsets over a single memoryview of block_bytes, and every field is kept
+        as a memoryview slice (offset + length) of that buffer. Fields are copied into bytes objects only when
+        they are accessed.
+        In lazy mode only the header is decoded. The body is scanned once into a table of tx offsets, and
+        each Tx is decoded only when coinbase_tx_obj or native_tx_list_of_objs[i] is read (see LazyTxList).
+
+        :param block_bytes: The block data as bytes (or memoryview)
+        :param lazy: Set to True to decode the txs only when they are accessed.
         :return: Block class object
         """
-        block_stream = BytesIO(block_bytes)
-        block_header = Block._parse_block_header(block_stream)
-        block_body = Block._parse_block_body(block_stream)
+        block_view = memoryview(block_bytes)
+        block_header, offset = Block._parse_block_header(block_view)
+        if lazy:
+            block_body, offset = Block._index_block_body(block_view, offset)
+            coinbase_tx_obj, coinbase_tx_bytes = None, block_body[1]
+        else:
+            block_body, offset = Block._parse_block_body(block_view, offset)
+            coinbase_tx_obj, coinbase_tx_bytes = block_body[1], None
         return Block(version_bytes=block_header[0], num_of_parent_blocks_bytes=block_header[1],
                      parent_hashes=block_header[2], hash_merkle_root_bytes=block_header[3],
                      id_merkle_root_bytes=block_header[4], utxo_commitment_bytes=block_header[5],
                      timestamp_bytes=block_header[6], bits_bytes=block_header[7], nonce_bytes=block_header[8],
-                     num_of_txs_in_block_bytes=block_body[0], coinbase_tx_bytes=block_body[1],
-                     native_tx_list_of_objs=block_body[2])
+                     num_of_txs_in_block_bytes=block_body[0], coinbase_tx_obj=coinbase_tx_obj,
+                     coinbase_tx_bytes=coinbase_tx_bytes, native_tx_list_of_objs=block_body[2])
 
     @staticmethod
-    def _parse_block_header(block_bytes_stream):
+    def header_size(block_bytes):
         """
-        Parse the block's header from the provided bytes stream and returns it as a bytes list
+        :param block_bytes: A raw block (bytes or memoryview), or at least its first 5 bytes
+        :return: The size of the block header, in bytes
+        """
+        return 5 + 32 * block_bytes[4] + 116
 
-        :param block_bytes_stream: The bytes stream that holds the block data
-        :return: Block header as a list
+    @staticmethod
+    def header_hash_and_parents(block_bytes):
+        """
+        Hash the header of a raw block without parsing (or copying) the block body.
+        :param block_bytes: A raw block (bytes or memoryview), or at least its header
+        :return: (block hash bytes, as displayed, list of the parent hashes bytes, as serialized)
+        """
+        block_view = memoryview(block_bytes)
+        parent_count = block_view[4]
+        parent_hashes = [bytes(block_view[5 + 32 * index:37 + 32 * index]) for index in range(parent_count)]
+        return general_utils.hash_256(block_view[:Block.header_size(block_view)])[::-1], parent_hashes
+
+    @staticmethod
+    def _parse_block_header(block_view, offset=0):
         """
-        header_parameters = {"version": 4, "numParentBlocks": 1, "parentHashes": 32, "hashMerkleRoot": 32,
-                             "idMerkleRoot": 32, "utxoCommitment": 32, "timeStamp": 8, "bits": 4, "nonce": 8}
+        Parse the block's header from the provided memoryview and returns it as a list of memoryview slices
 
-        version_bytes = block_bytes_stream.read(header_parameters["version"])
-        num_of_parent_blocks = block_bytes_stream.read(header_parameters["numParentBlocks"])
-        num_of_parent_blocks_int = general_utils.int_from_little_endian(num_of_parent_blocks)
-        parent_hashes_to_get = num_of_parent_blocks_int
+        :param block_view: A memoryview of the block data
+        :param offset: The offset where the header starts
+        :return: (Block header as a list, offset right after the header)
+        """
+        version_bytes = block_view[offset:offset + 4]
+        num_of_parent_blocks = block_view[offset + 4:offset + 5]
+        offset += 5
         parent_hashes = []
-        while parent_hashes_to_get != 0:
-            p_hash = block_bytes_stream.read(header_parameters["parentHashes"])
-            parent_hashes.append(p_hash)
-            parent_hashes_to_get -= 1
-
-        hash_merkle_root_bytes = block_bytes_stream.read(header_parameters["hashMerkleRoot"])
-        id_merkle_root_bytes = block_bytes_stream.read(header_parameters["idMerkleRoot"])
-        utxo_commitment_bytes = block_bytes_stream.read(header_parameters["utxoCommitment"])
-        timestamp_bytes = block_bytes_stream.read(header_parameters["timeStamp"])
-        bits_bytes = block_bytes_stream.read(header_parameters["bits"])
-        nonce_bytes = block_bytes_stream.read(header_parameters["nonce"])
+        for i in range(num_of_parent_blocks[0]):
+            parent_hashes.append(block_view[offset:offset + 32])
+            offset += 32
+
+        hash_merkle_root_bytes = block_view[offset:offset + 32]
+        id_merkle_root_bytes = block_view[offset + 32:offset + 64]
+        utxo_commitment_bytes = block_view[offset + 64:offset + 96]
+        timestamp_bytes = block_view[offset + 96:offset + 104]
+        bits_bytes = block_view[offset + 104:offset + 108]
+        nonce_bytes = block_view[offset + 108:offset + 116]
         return [version_bytes, num_of_parent_blocks, parent_hashes, hash_merkle_root_bytes, id_merkle_root_bytes,
-                utxo_commitment_bytes, timestamp_bytes, bits_bytes, nonce_bytes]
+                utxo_commitment_bytes, timestamp_bytes, bits_bytes, nonce_bytes], offset + 116
 
     @staticmethod
-    def _parse_block_body(block_bytes_stream):
+    def _parse_block_body(block_view, offset):
         """
-        Parse the block's body bytes from the provided stream and returns it as a bytes list
+        Parse the block's body from the provided memoryview and returns it as a list
 
-        :param block_bytes_stream: The bytes stream that holds the block body data
-        :return: Block body as a list
+        :param block_view: A memoryview of the block data
+        :param offset: The offset where the body starts
+        :return: (Block body as a list, offset right after the body)
         """
-        num_of_txs_in_block_int, num_of_txs_in_block_bytes = general_utils.read_varint(block_bytes_stream)
+        num_of_txs_in_block_int, num_of_txs_in_block_bytes, offset = general_utils.read_varint_at(block_view, offset)
 
-        coinbase_tx_obj = Tx.parse_tx(block_bytes_stream)
+        coinbase_tx_obj, offset = Tx.parse_tx_at(block_view, offset)
 
         native_tx_list_of_objs = []
         for i in range(num_of_txs_in_block_int - 1):
-            native_tx_obj = Tx.parse_tx(block_bytes_stream)
+            native_tx_obj, offset = Tx.parse_tx_at(block_view, offset)
             native_tx_list_of_objs.append(native_tx_obj)
 
-        return [num_of_txs_in_block_bytes, coinbase_tx_obj, native_tx_list_of_objs]
+        return [num_of_txs_in_block_bytes, coinbase_tx_obj, native_tx_list_of_objs], offset
+
+    @staticmethod
+    def _index_block_body(block_view, offset):
+        """
+        Scan the block's body without decoding it, and build a table of tx offsets.
+
+        :param block_view: A memoryview of the block data
+        :param offset: The offset where the body starts
+        :return: ([txs count as bytes, coinbase tx as a memoryview, LazyTxList of native txs],
+                  offset right after the body)
+        """
+        num_of_txs_in_block_int, num_of_txs_in_block_bytes, offset = general_utils.read_varint_at(block_view, offset)
+
+        coinbase_end = Tx.skip_tx_at(block_view, offset)
+        coinbase_tx_bytes = block_view[offset:coinbase_end]
+        offset = coinbase_end
+
+        tx_offsets = []
+        for i in range(num_of_txs_in_block_int - 1):
+            tx_end = Tx.skip_tx_at(block_view, offset)
+            tx_offsets.append((offset, tx_end))
+            offset = tx_end
+
+        return [num_of_txs_in_block_bytes, coinbase_tx_bytes, LazyTxList(block_view, tx_offsets)], offset
 
     # ========== Rebuilding Methods ========== #
 
@@ -211,6 +379,7 @@ class Block:
         """
         if (self._version_bytes == None) and (self._version_int != None):
             self.version_bytes = self._version_int.to_bytes(4, byteorder='little')
+        self._version_bytes = general_utils.materialize_bytes(self._version_bytes)
         return self._version_bytes
 
     @property
@@ -221,7 +390,7 @@ class Block:
         """
         if not self._number_of_parent_blocks_bytes:
             self._number_of_parent_blocks_bytes = self.number_of_parent_blocks.to_bytes(1, byteorder='little')
-
+        self._number_of_parent_blocks_bytes = general_utils.materialize_bytes(self._number_of_parent_blocks_bytes)
         return self._number_of_parent_blocks_bytes
 
     @property
@@ -230,6 +399,8 @@ class Block:
         Gets parent hash value.
         :return: A list with the hashes (as bytes)
         """
+        if self._parent_hashes:
+            self._parent_hashes = [general_utils.materialize_bytes(p_hash) for p_hash in self._parent_hashes]
         return self._parent_hashes
 
     @property
@@ -238,6 +409,7 @@ class Block:
         Gets the Merkle root value of txs in this block.
         :return: Bytes representation of Merkle root
         """
+        self._hash_merkle_root_bytes = general_utils.materialize_bytes(self._hash_merkle_root_bytes)
         return self._hash_merkle_root_bytes
 
     @property
@@ -246,6 +418,7 @@ class Block:
         Gets the Merkle root value of txs accepted in this block.
         :return: A bytes representation of Merkle root.
         """
+        self._id_merkle_root_bytes = general_utils.materialize_bytes(self._id_merkle_root_bytes)
         return self._id_merkle_root_bytes
 
     @property
@@ -254,6 +427,7 @@ class Block:
         Get UTXO commitment
         :return: A bytes value of the UTXO commitment.
         """
+        self._utxo_commitment_bytes = general_utils.materialize_bytes(self._utxo_commitment_bytes)
         return self._utxo_commitment_bytes
 
     @property
@@ -274,6 +448,7 @@ class Block:
         """
         if (not self._timestamp_bytes) and (self._timestamp_int != None):
             self._timestamp_bytes = (self._timestamp_int).to_bytes(8, byteorder='little')
+        self._timestamp_bytes = general_utils.materialize_bytes(self._timestamp_bytes)
         return self._timestamp_bytes
 
     @property
@@ -284,6 +459,7 @@ class Block:
         """
         if (not self._bits_bytes) and (self._bits_int != None):
             self._bits_bytes = (self._bits_int).to_bytes(4, byteorder='little')
+        self._bits_bytes = general_utils.materialize_bytes(self._bits_bytes)
         return self._bits_bytes
 
     @property
@@ -302,6 +478,7 @@ class Block:
         Get the 'nonce' value
         :return: 'nonce as bytes
         """
+        self._nonce_bytes = general_utils.materialize_bytes(self._nonce_bytes)
         return self._nonce_bytes
 
     @property
@@ -345,7 +522,8 @@ class Block:
         :return: A VarInt value
         """
         if (self._num_of_txs_in_block_int == None) and (self._num_of_txs_in_block_bytes != None):
-            self._num_of_txs_in_block_int = general_utils.read_varint(BytesIO(self._num_of_txs_in_block_bytes))
+            self._num_of_txs_in_block_int = general_utils.read_varint_at(memoryview(self._num_of_txs_in_block_bytes),
+                                                                         0)[0]
         return self._num_of_txs_in_block_int
 
     @property
@@ -356,6 +534,7 @@ class Block:
         """
         if (self._num_of_txs_in_block_bytes == None) and (self._num_of_txs_in_block_int != None):
             self._num_of_txs_in_block_bytes = general_utils.write_varint(self._num_of_txs_in_block_int)
+        self._num_of_txs_in_block_bytes = general_utils.materialize_bytes(self._num_of_txs_in_block_bytes)
         return self._num_of_txs_in_block_bytes
 
     @property
@@ -365,7 +544,9 @@ class Block:
         :return: coinbase Tx as a Tx object
         """
         if (self._coinbase_tx_obj == None) and (self._coinbase_tx_bytes != None):
-            self._coinbase_tx_obj = Tx.parse_tx(self._coinbase_tx_bytes)
+            self._coinbase_tx_obj = Tx.parse_tx_at(memoryview(self._coinbase_tx_bytes), 0)[0]
+            # the tx may be changed by the caller: link it to the block, so that a change invalidates the block
+            self._link_children((self._coinbase_tx_obj,))
         return self._coinbase_tx_obj
 
     @property
@@ -376,6 +557,7 @@ class Block:
         """
         if (self._coinbase_tx_bytes == None) and (self._coinbase_tx_obj != None):
             self._coinbase_tx_bytes = bytes(self._coinbase_tx_obj)
+        self._coinbase_tx_bytes = general_utils.materialize_bytes(self._coinbase_tx_bytes)
         return self._coinbase_tx_bytes
 
     @property
@@ -515,6 +697,7 @@ class Block:
         """
         self._num_of_txs_in_block_int = num_of_txs_in_block_int
         self._num_of_txs_in_block_bytes = general_utils.write_varint(self._num_of_txs_in_block_int)
+        self.invalidate_bytes()
 
     @num_of_txs_in_block_bytes.setter
     def num_of_txs_in_block_bytes(self, num_of_txs_in_block_bytes):
@@ -524,6 +707,8 @@ class Block:
         :return: None
         """
         self._num_of_txs_in_block_bytes = num_of_txs_in_block_bytes
+        self._num_of_txs_in_block_int = None
+        self.invalidate_bytes()
 
     @coinbase_tx_obj.setter
     def coinbase_tx_obj(self, coinbase_tx_obj):
@@ -532,7 +717,14 @@ class Block:
         :param coinbase_tx_obj:
         :return: None
         """
+        old_coinbase_tx_obj = self._coinbase_tx_obj
+        merkle_tree = self._hash_merkle_tree
         self._coinbase_tx_obj = coinbase_tx_obj
+        self._coinbase_tx_bytes = None      # computed again from the new object
+        self._replace_child(old_coinbase_tx_obj, coinbase_tx_obj)
+        if merkle_tree is not None and coinbase_tx_obj is not None:    # update the hash merkle root
+            merkle_tree.update(0, self._add_merkle_leaf_tx(coinbase_tx_obj))
+            self._set_hash_merkle_tree(merkle_tree)
 
     @coinbase_tx_bytes.setter
     def coinbase_tx_bytes(self, coinbase_tx_bytes):
@@ -541,7 +733,11 @@ class Block:
         :param coinbase_tx_obj:
         :return: None
         """
+        if self._coinbase_tx_obj is not None:
+            self._coinbase_tx_obj._remove_parent(self)
+        self._coinbase_tx_obj = None        # decoded again from the new bytes
         self._coinbase_tx_bytes = coinbase_tx_bytes
+        self.invalidate_bytes()
 
     @native_tx_list_of_objs.setter
     def native_tx_list_of_objs(self, native_tx_list_of_objs):
@@ -550,12 +746,62 @@ class Block:
         :param native_tx_list_of_objs:
         :return:
         """
+        old_native_tx_list_of_objs = self._native_tx_list_of_objs
+        if isinstance(old_native_tx_list_of_objs, LazyTxList):
+            old_native_tx_list_of_objs._owner_block = None
+            old_native_tx_list_of_objs = old_native_tx_list_of_objs._tx_objs   # don't decode the txs
+        if old_native_tx_list_of_objs:
+            for tx in old_native_tx_list_of_objs:
+                if tx is not None:
+                    tx._remove_parent(self)
         self._native_tx_list_of_objs = native_tx_list_of_objs
+        if isinstance(native_tx_list_of_objs, LazyTxList):
+            native_tx_list_of_objs._owner_block = self
+        self.invalidate_bytes()
 
     def add_native_transaction(self, tx_obj):
+        """
+        Add a native tx at the end of the block.
+        If the hash merkle tree was already built (see hash_merkle_tree), the hash merkle root is updated
+        incrementally (O(log n)).
+        :param tx_obj: A Tx object
+        :return: None
+        """
+        merkle_tree = self._hash_merkle_tree
         self.num_of_txs_in_block_int += 1
         temp = self.num_of_txs_in_block_bytes   # to update it
         self.native_tx_list_of_objs.append(tx_obj)
+        self.invalidate_bytes()
+        if merkle_tree is not None:
+            merkle_tree.append(self._add_merkle_leaf_tx(tx_obj))
+            self._set_hash_merkle_tree(merkle_tree)
+
+    # ========== Hash Merkle Tree ========== #
+
+    @property
+    def hash_merkle_tree(self):
+        """
+        The Merkle tree of the txs in this block (coinbase first), built on first access.
+        While the tree exists, add_native_transaction and the coinbase_tx_obj setter keep it (and
+        hash_merkle_root_bytes) up to date. Any other change to the txs drops it, so it is built again.
+        :return: A MerkleTree object
+        """
+        if self._hash_merkle_tree is None:
+            native_txs = self._native_tx_list_of_objs or []
+            leaves = [self._add_merkle_leaf_tx(tx) for tx in [self.coinbase_tx_obj] + list(native_txs)]
+            self._hash_merkle_tree = MerkleTree(leaves)
+        return self._hash_merkle_tree
+
+    def _add_merkle_leaf_tx(self, tx_obj):
+        """
+        Link a tx to this block (so changes in the tx drop the Merkle tree), and return its Merkle leaf.
+        """
+        tx_obj._add_parent(self)
+        return general_utils.hash_256(tx_obj.get_tx_bytes_for_hash_merkle_root())
+
+    def _set_hash_merkle_tree(self, merkle_tree):
+        self._hash_merkle_tree = merkle_tree
+        self._hash_merkle_root_bytes = merkle_tree.root
 
 
     # def get_block_header_list(self):
@@ -581,8 +827,12 @@ class Block:
         """
         :return: Block body bytes as a list
         """
-        coinbase_tx_list = self._coinbase_tx_obj.get_tx_bytes()
+        coinbase_tx_list = self.coinbase_tx_obj.get_tx_bytes()
         native_txs_list = []
+        if isinstance(self._native_tx_list_of_objs, LazyTxList):  # don't decode txs just to encode them again
+            for i in range(len(self._native_tx_list_of_objs)):
+                native_txs_list.append(self._native_tx_list_of_objs.tx_bytes(i))
+            return [self.num_of_txs_in_block_bytes, coinbase_tx_list, native_txs_list]
         for tx in self._native_tx_list_of_objs:
             native_tx_bytes = tx.get_tx_bytes()
             native_txs_list.append(native_tx_bytes)
@@ -590,11 +840,90 @@ class Block:
 
     def get_block_body_bytes_array(self):
         """
-        :return: Block body bytes as an array
+        The block body is written in a single pass into one buffer of the exact size (see CachedBytes).
+        The bytes are cached until the block (or one of its txs) is changed.
+        :return: Block body bytes
+        """
+        if self._serialized_bytes is not None:
+            return self._serialized_bytes
+        buffer = bytearray(self._body_size())
+        self._write_body_into(buffer, 0)
+        return self._store_bytes(bytes(buffer), self._children())
+
+    # ========== Serialization (see CachedBytes) ========== #
+
+    def _header_size(self):
+        return 4 + 1 + 32 * len(self.parent_hashes) + 32 * 3 + 8 + 4 + 8
+
+    def _write_header_into(self, buffer, offset):
+        offset = general_utils.write_bytes_into(buffer, offset, self.version_bytes)
+        offset = general_utils.write_bytes_into(buffer, offset, self.number_of_parent_blocks_bytes)
+        for parent_hash in self.parent_hashes:
+            offset = general_utils.write_bytes_into(buffer, offset, parent_hash)
+        offset = general_utils.write_bytes_into(buffer, offset, self.hash_merkle_root_bytes)
+        offset = general_utils.write_bytes_into(buffer, offset, self.id_merkle_root_bytes)
+        offset = general_utils.write_bytes_into(buffer, offset, self.utxo_commitment_bytes)
+        offset = general_utils.write_bytes_into(buffer, offset, self.timestamp_bytes)
+        offset = general_utils.write_bytes_into(buffer, offset, self.bits_bytes)
+        return general_utils.write_bytes_into(buffer, offset, self.nonce_bytes)
+
+    def _body_size(self):
+        if self._serialized_bytes is not None:
+            return len(self._serialized_bytes)
+        if self._coinbase_tx_obj is None:   # not decoded, use the raw coinbase
+            size = len(self.num_of_txs_in_block_bytes) + len(self.coinbase_tx_bytes)
+        else:
+            size = len(self.num_of_txs_in_block_bytes) + self._coinbase_tx_obj.serialized_size()
+        native_txs = self._native_tx_list_of_objs
+        if isinstance(native_txs, LazyTxList):  # don't decode txs just to encode them again
+            for i in range(len(native_txs)):
+                size += native_txs.tx_size(i)
+        else:
+            for tx in native_txs:
+                size += tx.serialized_size()
+        return size
+
+    def _write_body_into(self, buffer, offset):
+        if self._serialized_bytes is not None:
+            return general_utils.write_bytes_into(buffer, offset, self._serialized_bytes)
+        offset = general_utils.write_bytes_into(buffer, offset, self.num_of_txs_in_block_bytes)
+        if self._coinbase_tx_obj is None:
+            offset = general_utils.write_bytes_into(buffer, offset, self.coinbase_tx_bytes)
+        else:
+            offset = self._coinbase_tx_obj.write_into(buffer, offset)
+        native_txs = self._native_tx_list_of_objs
+        if isinstance(native_txs, LazyTxList):
+            for i in range(len(native_txs)):
+                offset = native_txs.write_tx_into(i, buffer, offset)
+        else:
+            for tx in native_txs:
+                offset = tx.write_into(buffer, offset)
+        return offset
+
+    def _children(self):
+        native_txs = self._native_tx_list_of_objs
+        if isinstance(native_txs, LazyTxList):
+            native_txs = native_txs.decoded_txs()
+        if self._coinbase_tx_obj is None:
+            return list(native_txs)
+        return [self._coinbase_tx_obj] + list(native_txs)
+
+    def serialized_size(self):
+        """
+        :return: The exact size (in bytes) of the serialized block
+        """
+        return self._header_size() + self._body_size()
+
+    def write_into(self, buffer, offset=0):
+        """
+        Write the whole block (header and body) into a preallocated buffer, in a single pass.
+        e.g: buffer = bytearray(block.serialized_size()); block.write_into(buffer)
+        :param buffer: A bytearray (or writable memoryview) with at least serialized_size() bytes after offset
+        :param offset: The offset to write at
+        :return: The offset right after the block
         """
-        block_body_list = self.get_block_body_list()
-        block_body_bytes_array = general_utils.build_element_from_list(block_body_list)
-        return block_body_bytes_array
+        offset = self._write_header_into(buffer, offset)
+        return self._write_body_into(buffer, offset)
 
     @property
     def block_txs_list_as_bytes(self):
@@ -605,7 +934,7 @@ class Block:
         """
         txs_list = []
         # first append the coinbase tx
-        txs_list.append(self._coinbase_tx_obj.get_tx_bytes_for_hash_merkle_root())
+        txs_list.append(self.coinbase_tx_obj.get_tx_bytes_for_hash_merkle_root())
         for tx in self._native_tx_list_of_objs:
             # native_tx_bytes = tx.get_tx_bytes_for_hash_merkle_root()
             native_tx_bytes = tx.get_tx_bytes_for_hash_merkle_root()
@@ -616,3 +945,13 @@ class Block:
         block_header = self.block_header_bytes
         block_body = self.get_block_body_bytes_array()
         return block_header + block_body
+
+    def invalidate_bytes(self):
+        """
+        Drop the cached body bytes, and the coinbase bytes when they can be built again from the coinbase object.
+        :return: None
+        """
+        if self._coinbase_tx_obj is not None:
+            self._coinbase_tx_bytes = None
+        self._hash_merkle_tree = None
+        super().invalidate_bytes()
@@ -0,0 +1,144 @@
+"""
+CachedBytes is the base class of the model objects that memoize their serialized form (Block, Tx, TxIn, TxOut
+and TxScript).
+An object stores its bytes the first time it is serialized, and links itself as a parent of the child objects
+that were serialized into it (e.g: a Tx is a parent of its TxIn objects, a TxIn is a parent of its sig_script).
+Setters call invalidate_bytes(), which drops the cached bytes of the object and of all its parents, so only the
+changed parts are serialized again.
+
+Serialization is single pass (the write_into() protocol): serialized_size() returns the exact size, so a buffer
+is allocated once, and write_into(buffer, offset) writes the fields directly into it. A child is written into
+its parent's buffer (its cached bytes are copied, if it has them), so no intermediate bytes objects are built.
+Subclasses implement _fields_size(), _write_fields_into() and _children().
+
+The model classes use __slots__ (no per-object __dict__), since big DAGs and UTXO sets hold millions of them.
+A subclass that adds attributes must list them in its own __slots__.
+"""
+
+
+class CachedBytes:
+    __slots__ = ('_serialized_bytes', '_parents')
+
+    def __init__(self):
+        self._serialized_bytes = None
+        # None, a single parent, or a set of parents (most objects have a single parent, and a set is big)
+        self._parents = None
+
+    # ========== Serialization (write_into protocol) ========== #
+
+    def _fields_size(self):
+        """
+        :return: The exact size (in bytes) of the serialized object, computed from its fields
+        """
+        raise NotImplementedError
+
+    def _write_fields_into(self, buffer, offset):
+        """
+        Write the fields of the object into buffer.
+        :param buffer: A bytearray (or writable memoryview) with at least _fields_size() bytes after offset
+        :param offset: The offset to write at
+        :return: The offset right after the object
+        """
+        raise NotImplementedError
+
+    def _children(self):
+        """
+        :return: The CachedBytes objects that are serialized into this object
+        """
+        return ()
+
+    def serialized_size(self):
+        """
+        :return: The exact size (in bytes) of the serialized object
+        """
+        if self._serialized_bytes is not None:
+            return len(self._serialized_bytes)
+        return self._fields_size()
+
+    def write_into(self, buffer, offset=0):
+        """
+        Write the serialized object into a preallocated buffer.
+        :param buffer: A bytearray (or writable memoryview) with at least serialized_size() bytes after offset
+        :param offset: The offset to write at
+        :return: The offset right after the object
+        """
+        if self._serialized_bytes is not None:
+            end = offset + len(self._serialized_bytes)
+            buffer[offset:end] = self._serialized_bytes
+            return end
+        return self._write_fields_into(buffer, offset)
+
+    def __bytes__(self):
+        """
+        Convert the object to bytes. The result is cached until the object (or one of its children) is changed.
+        :return: The bytes representation of the object
+        """
+        if self._serialized_bytes is not None:
+            return self._serialized_bytes
+        buffer = bytearray(self._fields_size())
+        self._write_fields_into(buffer, 0)
+        return self._store_bytes(bytes(buffer), self._children())
+
+    # ========== Dirty tracking ========== #
+
+    def _add_parent(self, parent):
+        parents = self._parents
+        if parents is None:
+            self._parents = parent
+        elif type(parents) is set:
+            parents.add(parent)
+        elif parents is not parent:
+            self._parents = {parents, parent}
+
+    def _remove_parent(self, parent):
+        parents = self._parents
+        if parents is parent:
+            self._parents = None
+        elif type(parents) is set:
+            parents.discard(parent)
+
+    def _store_bytes(self, serialized_bytes, children=()):
+        """
+        Keep the serialized form of this object, and link it to the children it was built from.
+        :param serialized_bytes: The serialized form (bytes)
+        :param children: The objects (CachedBytes) that were serialized into serialized_bytes
+        :return: serialized_bytes
+        """
+        self._link_children(children)
+        self._serialized_bytes = serialized_bytes
+        return serialized_bytes
+
+    def _link_children(self, children):
+        """
+        Link this object as a parent of children. A child that has no cached bytes was written field by field
+        (see write_into), so its own children are linked to it as well.
+        """
+        for child in children:
+            if child is not None:
+                child._add_parent(self)
+                if child._serialized_bytes is None:
+                    child._link_children(child._children())
+
+    def _replace_child(self, old_child, new_child):
+        """
+        Call from setters that replace a child object (e.g: TxIn.sig_script).
+        Unlinks the old child and invalidates the cached bytes.
+        """
+        if old_child is not None and old_child is not new_child:
+            old_child._remove_parent(self)
+        self.invalidate_bytes()
+
+    def invalidate_bytes(self):
+        """
+        Drop the cached serialized form of this object, and of every object that contains it.
+        :return: None
+        """
+        self._serialized_bytes = None
+        parents = self._parents
+        if parents is None:
+            return
+        if type(parents) is set:
+            for parent in parents:
+                parent.invalidate_bytes()
+        else:
+            parents.invalidate_bytes()
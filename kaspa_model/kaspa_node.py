@@ -1,11 +1,17 @@
 """
 A definition of a "node", a running instance of kaspad program.
 Includes add relevant data: ip address, port number, passwords etc.
+Each node owns a pooled keep-alive HTTP session, so json-rpc requests reuse their TCP (and TLS) connections.
 """
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = 10      # max number of kept-alive connections to a node
 
 class KaspaNode:
     def __init__(self, *, conn_name=None, ip_addr:str=None, domain_name:str=None, port_number:int=None, tls:bool=None,
-                 username:str='', password:str='', cert_file_path=None):
+                 username:str='', password:str='', cert_file_path=None, pool_size:int=DEFAULT_POOL_SIZE):
         """
         Initializes a new KaspaNode instance.
         :param ip_addr: Ip address, dotted decimal notation as a string. example: '127.0.0.1'
@@ -15,6 +21,7 @@ class KaspaNode:
         :param username: User name as a string. Example:  'mike'
         :param password: password as a string.  Example: '73mnklU%h409'
         :param cert_file_path: full path name: '~/kaspanet/automation_testing/cert_files/rpc.cert'
+        :param pool_size: Max number of kept-alive connections to this node (for concurrent requests)
         """
         self._conn_name = conn_name
         self._ip_addr = ip_addr
@@ -28,11 +35,62 @@ class KaspaNode:
         self._username = username
         self._password = password
         self._cert_file_path = cert_file_path
+        self._pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()     # the session is used (and created) by several threads
+
+    @property
+    def conn_name(self):
+        return self._conn_name
 
     @property
     def cert_file_path(self):
         return self._cert_file_path
 
+    @property
+    def pool_size(self):
+        return self._pool_size
+
+    @property
+    def session(self):
+        """
+        The keep-alive session used for all the json-rpc requests to this node (created on first use).
+        Thread safe: threads that use the node at the same time share one session.
+        :return: requests.Session object
+        """
+        session = self._session
+        if session is None:
+            with self._session_lock:
+                if self._session is None:
+                    new_session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size)
+                    new_session.mount('http://', adapter)
+                    new_session.mount('https://', adapter)
+                    self._session = new_session
+                session = self._session
+        return session
+
+    def close(self):
+        """
+        Close the connections of the session (a new session is created on the next request).
+        :return: None
+        """
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def __getstate__(self):
+        # a session (or a lock) can't be sent to another process: the copy creates its own
+        state = self.__dict__.copy()
+        state['_session'] = None
+        del state['_session_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._session_lock = threading.Lock()
+
     @property
     def updated_url(self):
         if self._domain_name:
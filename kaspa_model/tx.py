@@ -4,6 +4,7 @@ from kaspy_tools.utils import general_utils
 from kaspy_tools.kaspa_model.tx_in import TxIn
 from kaspy_tools.kaspa_model.tx_out import TxOut
 from kaspy_tools.kaspa_model.tx_payload import TxPayload
+from kaspy_tools.kaspa_model.cached_bytes import CachedBytes
 
 KT_logger = config_logger.get_kaspy_tools_logger()
 
@@ -15,17 +16,22 @@ VERSION_1 = (1).to_bytes(4, byteorder='little')  # convert int to 32 bites littl
 LOCKTIME_NO_LOCK = bytes(8)
 
 
-class Tx:
+class Tx(CachedBytes):
     """
     This object holds all required methods to handle all types of Txs.
         :param version:
         :param num_of_txs_in:  (int) the number of tx inputs
         :param tx_in_list:  A list of inputs (e.g: [('---tx--hash---', output-number, 'script-sig'), (....),...]  )
     """
+    __slots__ = ('_version_bytes', '_number_of_tx_inputs_bytes', '_tx_input_list', '_number_of_tx_outputs_bytes',
+                 '_tx_output_list', '_locktime_bytes', '_locktime_int', '_subnetwork_id_bytes', '_gas_bytes',
+                 '_payload_hash_bytes', '_payload_length_bytes', '_payload_length_int', '_payload_bytes',
+                 '_payload_obj', '_txid')
 
     def __init__(self, *, version_bytes=None, number_of_tx_inputs_bytes=None, tx_input_list=None,
                  number_of_tx_outputs_bytes=None, tx_output_list=None, locktime_bytes=None, subnetwork_id_bytes=None,
                  gas_bytes=None, payload_hash_bytes=None, payload_length_bytes=None, payload_bytes=None):
+        super().__init__()
         self._version_bytes = version_bytes
         self._number_of_tx_inputs_bytes = number_of_tx_inputs_bytes
         self._tx_input_list = tx_input_list
@@ -46,6 +52,14 @@ class Tx:
     @classmethod
     def tx_factory(cls, *, version_bytes=None, tx_in_list=None, tx_out_list=None, locktime_int=None,
                    subnetwork_id_bytes=None, gas_bytes=None, payload_hash=None, payload=None):
+        """
+        Build a new transaction.
+        payload_hash and payload are only serialized for a non native subnetwork, so native transactions
+        (e.g: make_transactions_command) serialize the same with or without them.
+        :param payload_hash: (bytes) The payload hash of a non native transaction, or None
+        :param payload: (bytes) The payload of a non native transaction, or None. The payload length is set from it.
+        :return: A Tx object
+        """
         new_tx = cls()
         new_tx.version_bytes = version_bytes
         new_tx.tx_input_list = tx_in_list
@@ -53,8 +67,10 @@ class Tx:
         new_tx.locktime_int = locktime_int
         new_tx.subnetwork_id_bytes = subnetwork_id_bytes
         new_tx.gas_bytes = gas_bytes
-        new_tx._payload_hash = payload_hash
-        new_tx._payload = payload
+        new_tx._payload_hash_bytes = payload_hash
+        new_tx._payload_bytes = payload
+        if payload is not None:
+            new_tx._payload_length_bytes = general_utils.write_varint(len(payload))
         return new_tx
 
     # ========== Parsing Methods ========== #
@@ -100,6 +116,76 @@ class Tx:
                       gas_bytes=gas_bytes, payload_hash_bytes=payload_hash_bytes,
                       payload_length_bytes=payload_length_bytes, payload_bytes=payload_bytes)
 
+    @staticmethod
+    def parse_tx_at(buffer_view, offset):
+        """
+        Zero-copy version of parse_tx: parse a "Tx" that starts at offset of a memoryview.
+        All fields (and the fields of inputs and outputs) are kept as memoryview slices of buffer_view,
+        and are copied into bytes objects only when accessed.
+
+        :param buffer_view: A memoryview of the buffer holding the tx (usually a whole block)
+        :param offset: The offset where the tx starts
+        :return: (Tx class object, offset right after the tx)
+        """
+        version_bytes = buffer_view[offset:offset + 4]
+        number_of_txs_inputs_int, number_of_txs_inputs_bytes, offset = general_utils.read_varint_at(buffer_view,
+                                                                                                    offset + 4)
+        tx_input_list = []
+        for i in range(number_of_txs_inputs_int):  # loops through all txs in
+            tx_in, offset = TxIn.parse_tx_in_at(buffer_view, offset)
+            tx_input_list.append(tx_in)
+        number_of_tx_outputs_int, number_of_tx_outputs_bytes, offset = general_utils.read_varint_at(buffer_view,
+                                                                                                    offset)
+        tx_output_list = []
+        for i in range(number_of_tx_outputs_int):  # loops through all txs out
+            tx_out, offset = TxOut.parse_tx_out_at(buffer_view, offset)
+            tx_output_list.append(tx_out)
+        locktime_bytes = buffer_view[offset:offset + 8]
+        subnetwork_id_bytes = buffer_view[offset + 8:offset + 28]
+        offset += 28
+        if subnetwork_id_bytes == NATIVE_SUBNETWORK:
+            return Tx(version_bytes=version_bytes,
+                      number_of_tx_inputs_bytes=number_of_txs_inputs_bytes, tx_input_list=tx_input_list,
+                      number_of_tx_outputs_bytes=number_of_tx_outputs_bytes, tx_output_list=tx_output_list,
+                      locktime_bytes=locktime_bytes, subnetwork_id_bytes=subnetwork_id_bytes), offset
+        else:
+            gas_bytes = buffer_view[offset:offset + 8]
+            payload_hash_bytes = buffer_view[offset + 8:offset + 40]
+            payload_length_int, payload_length_bytes, offset = general_utils.read_varint_at(buffer_view, offset + 40)
+            payload_bytes = buffer_view[offset:offset + payload_length_int]
+            return Tx(version_bytes=version_bytes,
+                      number_of_tx_inputs_bytes=number_of_txs_inputs_bytes, tx_input_list=tx_input_list,
+                      number_of_tx_outputs_bytes=number_of_tx_outputs_bytes, tx_output_list=tx_output_list,
+                      locktime_bytes=locktime_bytes, subnetwork_id_bytes=subnetwork_id_bytes,
+                      gas_bytes=gas_bytes, payload_hash_bytes=payload_hash_bytes,
+                      payload_length_bytes=payload_length_bytes,
+                      payload_bytes=payload_bytes), offset + payload_length_int
+
+    @staticmethod
+    def skip_tx_at(buffer_view, offset):
+        """
+        Find where a "Tx" that starts at offset ends, without decoding it.
+        Only the varints (counts and lengths) are read, no objects are created.
+
+        :param buffer_view: A memoryview of the buffer holding the tx
+        :param offset: The offset where the tx starts
+        :return: The offset right after the tx
+        """
+        number_of_txs_inputs_int, _, offset = general_utils.read_varint_at(buffer_view, offset + 4)
+        for i in range(number_of_txs_inputs_int):
+            sig_script_length_int, _, offset = general_utils.read_varint_at(buffer_view, offset + 36)
+            offset += sig_script_length_int + 8  # script + sequence
+        number_of_tx_outputs_int, _, offset = general_utils.read_varint_at(buffer_view, offset)
+        for i in range(number_of_tx_outputs_int):
+            script_pub_key_len_int, _, offset = general_utils.read_varint_at(buffer_view, offset + 8)
+            offset += script_pub_key_len_int
+        subnetwork_id_bytes = buffer_view[offset + 8:offset + 28]
+        offset += 28
+        if subnetwork_id_bytes != NATIVE_SUBNETWORK:
+            payload_length_int, _, offset = general_utils.read_varint_at(buffer_view, offset + 40)
+            offset += payload_length_int
+        return offset
+
     # ========== Get properties ========== #
 
     @property
@@ -107,6 +193,7 @@ class Tx:
         """
         :return: Version as bytes
         """
+        self._version_bytes = general_utils.materialize_bytes(self._version_bytes)
         return self._version_bytes
 
     @property
@@ -116,7 +203,7 @@ class Tx:
         """
         if (self._number_of_tx_inputs_bytes == None) and (self._tx_input_list != None):
             self._number_of_tx_inputs_bytes = general_utils.write_varint(len(self._tx_input_list))
-
+        self._number_of_tx_inputs_bytes = general_utils.materialize_bytes(self._number_of_tx_inputs_bytes)
         return self._number_of_tx_inputs_bytes
 
 
@@ -135,7 +222,7 @@ class Tx:
         """
         if (self._number_of_tx_outputs_bytes == None) and (self._tx_output_list != None):
             self._number_of_tx_outputs_bytes = general_utils.write_varint(len(self._tx_output_list))
-
+        self._number_of_tx_outputs_bytes = general_utils.materialize_bytes(self._number_of_tx_outputs_bytes)
         return self._number_of_tx_outputs_bytes
 
 
@@ -153,6 +240,7 @@ class Tx:
         """
         if (self._locktime_bytes == None) and (self._locktime_int != None):
             self._locktime_bytes = (self._locktime_int).to_bytes(8, byteorder='little')
+        self._locktime_bytes = general_utils.materialize_bytes(self._locktime_bytes)
         return self._locktime_bytes
 
     @property
@@ -167,28 +255,33 @@ class Tx:
         """
         :return: Subnetwork ID as bytes
         """
+        self._subnetwork_id_bytes = general_utils.materialize_bytes(self._subnetwork_id_bytes)
         return self._subnetwork_id_bytes
 
     @property
     def gas_bytes(self):
+        self._gas_bytes = general_utils.materialize_bytes(self._gas_bytes)
         return self._gas_bytes
 
     @property
     def payload_hash_bytes(self):
+        self._payload_hash_bytes = general_utils.materialize_bytes(self._payload_hash_bytes)
         return self._payload_hash_bytes
 
     @property
     def payload_length_bytes(self):
+        self._payload_length_bytes = general_utils.materialize_bytes(self._payload_length_bytes)
         return self._payload_length_bytes
 
     @property
     def payload_length_int(self):
         if (self._payload_length_int == None) and (self._payload_length_bytes != None):
-            self._payload_length_int = int.from_bytes(self._payload_length_bytes, byteorder='little')
+            self._payload_length_int = general_utils.read_varint_at(memoryview(self._payload_length_bytes), 0)[0]
         return self._payload_length_int
 
     @property
     def payload_bytes(self):
+        self._payload_bytes = general_utils.materialize_bytes(self._payload_bytes)
         return self._payload_bytes
 
     @property
@@ -202,6 +295,7 @@ class Tx:
     def version_bytes(self, version_bytes):
         """ Sets variable "_version_bytes" to the received value"""
         self._version_bytes = version_bytes
+        self.invalidate_bytes()
 
 
     @tx_input_list.setter
@@ -211,7 +305,10 @@ class Tx:
         :param tx_in_list: list with new input objects
         :return:
         """
+        self._replace_children(self._tx_input_list, tx_input_list)
         self._tx_input_list = tx_input_list
+        self._number_of_tx_inputs_bytes = None    # computed again from the new list
+        self.invalidate_bytes()
 
     @tx_output_list.setter
     def tx_output_list(self, tx_output_list):
@@ -220,22 +317,38 @@ class Tx:
         :param tx_out_list:
         :return:
         """
+        self._replace_children(self._tx_output_list, tx_output_list)
         self._tx_output_list = tx_output_list
+        self._number_of_tx_outputs_bytes = None    # computed again from the new list
+        self.invalidate_bytes()
 
 
     @locktime_int.setter
     def locktime_int(self, locktime_int):
         """ Sets variable "_locktime" to the received value"""
         self._locktime_int = locktime_int
+        self._locktime_bytes = None    # computed again from the new locktime
+        self.invalidate_bytes()
 
     @subnetwork_id_bytes.setter
     def subnetwork_id_bytes(self, subnetwork_id_bytes):
         self._subnetwork_id_bytes = subnetwork_id_bytes
+        self.invalidate_bytes()
 
     @gas_bytes.setter
     def gas_bytes(self, gas_bytes):
         """ Sets variable "_gas_bytes" to the received value"""
         self._gas_bytes = gas_bytes
+        self.invalidate_bytes()
+
+    @payload_bytes.setter
+    def payload_bytes(self, payload_bytes):
+        """ Sets the payload, and the payload length and payload hash that depend on it"""
+        self._payload_bytes = payload_bytes
+        self._payload_length_bytes = general_utils.write_varint(len(payload_bytes))
+        self._payload_length_int = len(payload_bytes)
+        self._payload_hash_bytes = general_utils.hash_256(payload_bytes)
+        self.invalidate_bytes()
 
     @payload_obj.setter
     def payload_obj(self, payload_obj):
@@ -254,7 +367,7 @@ class Tx:
         tx_list.extend([[self.number_of_tx_outputs_bytes]])
         for output in self._tx_output_list:
             tx_list.append(bytes(output))
-        tx_list.extend([[self._locktime_bytes], [self.subnetwork_id_bytes]])
+        tx_list.extend([[self.locktime_bytes], [self.subnetwork_id_bytes]])
         if self.subnetwork_id_bytes != NATIVE_SUBNETWORK:
             tx_list.extend([[self.gas_bytes], [self.payload_hash_bytes], [self.payload_length_bytes], [self.payload_bytes]])
         tx_bytes = general_utils.flatten_nested_iterable(tx_list)
@@ -297,45 +410,69 @@ class Tx:
     #     return tx_bytes
 
     def get_tx_bytes_for_hash_merkle_root(self):
-        ret_bytes = b''
-        ret_bytes += self.version_bytes
-        ret_bytes += self.number_of_tx_inputs_bytes     # computed if needed
+        """
+        The hash merkle root form of a tx is the full form, with an empty payload.
+        It is cut from the (cached) full form, instead of serializing the tx again.
+        :return: Tx bytes in the format required for calculating the hash merkle root
+        """
+        tx_bytes = bytes(self)
+        if self.subnetwork_id_bytes == NATIVE_SUBNETWORK:
+            return tx_bytes
+        payload_part_len = len(self.payload_length_bytes) + len(self.payload_bytes)
+        return tx_bytes[:len(tx_bytes) - payload_part_len] + b'\x00'
+
+    def _replace_children(self, old_children, new_children):
+        """ Unlinks the objects of old_children that are not in new_children (used by the list setters)"""
+        if old_children:
+            new_ids = {id(child) for child in new_children} if new_children else set()
+            for child in old_children:
+                if id(child) not in new_ids:
+                    child._remove_parent(self)
+
+    # ========== Serialization (see CachedBytes) ========== #
+
+    def _fields_size(self):
+        size = len(self.version_bytes) + len(self.number_of_tx_inputs_bytes)     # computed if needed
         for tx_in in self.tx_input_list:
-            ret_bytes += bytes(tx_in)
-
-        ret_bytes += self.number_of_tx_outputs_bytes     # computed if needed
+            size += tx_in.serialized_size()
+        size += len(self.number_of_tx_outputs_bytes)     # computed if needed
         for tx_out in self.tx_output_list:
-            ret_bytes += bytes(tx_out)
-
-        ret_bytes += self.locktime_bytes
-        ret_bytes += self.subnetwork_id_bytes
+            size += tx_out.serialized_size()
+        size += len(self.locktime_bytes) + len(self.subnetwork_id_bytes)
         if self.subnetwork_id_bytes != NATIVE_SUBNETWORK:
-            ret_bytes += self.gas_bytes
-            ret_bytes += self.payload_hash_bytes
-            ret_bytes += b'\x00'
+            size += len(self.gas_bytes) + len(self.payload_hash_bytes) + len(self.payload_length_bytes) + \
+                    len(self.payload_bytes)
+        return size
 
-        return ret_bytes
-
-    def __bytes__(self):
-        ret_bytes = b''
-        ret_bytes += self.version_bytes
-        ret_bytes += self.number_of_tx_inputs_bytes     # computed if needed
+    def _write_fields_into(self, buffer, offset):
+        offset = general_utils.write_bytes_into(buffer, offset, self.version_bytes)
+        offset = general_utils.write_bytes_into(buffer, offset, self.number_of_tx_inputs_bytes)
         for tx_in in self.tx_input_list:
-            ret_bytes += bytes(tx_in)
+            offset = tx_in.write_into(buffer, offset)
 
-        ret_bytes += self.number_of_tx_outputs_bytes     # computed if needed
+        offset = general_utils.write_bytes_into(buffer, offset, self.number_of_tx_outputs_bytes)
         for tx_out in self.tx_output_list:
-            ret_bytes += bytes(tx_out)
+            offset = tx_out.write_into(buffer, offset)
 
-        ret_bytes += self.locktime_bytes
-        ret_bytes += self.subnetwork_id_bytes
+        offset = general_utils.write_bytes_into(buffer, offset, self.locktime_bytes)
+        offset = general_utils.write_bytes_into(buffer, offset, self.subnetwork_id_bytes)
         if self.subnetwork_id_bytes != NATIVE_SUBNETWORK:
-            ret_bytes += self.gas_bytes
-            ret_bytes += self.payload_hash_bytes
-            ret_bytes += self.payload_length_bytes
-            ret_bytes += self.payload_bytes
+            offset = general_utils.write_bytes_into(buffer, offset, self.gas_bytes)
+            offset = general_utils.write_bytes_into(buffer, offset, self.payload_hash_bytes)
+            offset = general_utils.write_bytes_into(buffer, offset, self.payload_length_bytes)
+            offset = general_utils.write_bytes_into(buffer, offset, self.payload_bytes)
+        return offset
+
+    def _children(self):
+        return self.tx_input_list + self.tx_output_list
 
-        return ret_bytes
+    def invalidate_bytes(self):
+        """
+        Drop the cached serialized form (and the stored txid, which depends on it).
+        :return: None
+        """
+        self._txid = None
+        super().invalidate_bytes()
 
     def compute_txid(self, store=False, in_hex=True, coinbase=False):
         """
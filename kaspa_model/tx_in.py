@@ -1,6 +1,7 @@
 from kaspy_tools.logs import config_logger
 from kaspy_tools.utils import general_utils
 from kaspy_tools.kaspa_model.tx_script import TxScript
+from kaspy_tools.kaspa_model.cached_bytes import CachedBytes
 
 KT_logger = config_logger.get_kaspy_tools_logger()
 
@@ -8,13 +9,16 @@ NATIVE_SUBNETWORK_ID = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
 TX_IN_SEQUENCE = bytes(8)
 
 
-class TxIn:
+class TxIn(CachedBytes):
     """
     This object holds all required methods to handle all types of TxIns.
     At times, we should keep several TxScript objects here:
     - a referenced script_pub_key from a referenced output object.
     - an empty script (also needed for the signing
     """
+    __slots__ = ('_previous_tx_id_bytes', '_previous_tx_out_index', '_previous_tx_out_index_bytes',
+                 '_sig_script_length_bytes', '_sig_script', '_sequence_bytes', '_private_key',
+                 '_signed_script', '_empty_script', '_script_pub_key')
 
     def __init__(self, previous_tx_id_bytes=None, previous_tx_out_index_bytes=None, sig_script_length_bytes=0,
                  sig_scipt_obj=None, sequence_bytes=None, private_key=None):
@@ -27,7 +31,9 @@ class TxIn:
         :param sequence_bytes: The sequence parameter
         :param private_key:  The private key that this input "knows"
         """
+        super().__init__()
         self._previous_tx_id_bytes = previous_tx_id_bytes
+        self._previous_tx_out_index = None
         self._previous_tx_out_index_bytes = previous_tx_out_index_bytes  # re-named to previous_tx_index
         self._sig_script_length_bytes = sig_script_length_bytes  # re-added
         self._sig_script = sig_scipt_obj
@@ -59,6 +65,26 @@ class TxIn:
                     sequence_bytes=sequence_bytes)
         return new_TxIn
 
+    @staticmethod
+    def parse_tx_in_at(buffer_view, offset):
+        """
+        Zero-copy version of parse_tx_in: parse a "tx in" that starts at offset of a memoryview.
+        Fields are kept as memoryview slices, and are copied only when accessed.
+        :param buffer_view: A memoryview of the buffer holding the tx in.
+        :param offset: The offset where the tx in starts.
+        :return: (TxIn object, offset right after the tx in)
+        """
+        previous_tx_id_bytes = buffer_view[offset:offset + 32]
+        previous_tx_out_index_bytes = buffer_view[offset + 32:offset + 36]
+        sig_script_length_int, sig_script_length_bytes, offset = general_utils.read_varint_at(buffer_view, offset + 36)
+        script_end = offset + sig_script_length_int
+        sig_scipt_obj = TxScript.parse_tx_script(raw_script=buffer_view[offset:script_end])
+        sequence_bytes = buffer_view[script_end:script_end + 8]
+        new_TxIn = TxIn(previous_tx_id_bytes=previous_tx_id_bytes, previous_tx_out_index_bytes=previous_tx_out_index_bytes,
+                    sig_script_length_bytes=sig_script_length_bytes, sig_scipt_obj=sig_scipt_obj,
+                    sequence_bytes=sequence_bytes)
+        return new_TxIn, script_end + 8
+
 
     @classmethod
     def tx_in_factory(cls, *, previous_tx_id_bytes=None, previous_tx_out_index=None, sig_script=None,
@@ -91,6 +117,7 @@ class TxIn:
 
     @property
     def previous_tx_id_bytes(self):
+        self._previous_tx_id_bytes = general_utils.materialize_bytes(self._previous_tx_id_bytes)
         return self._previous_tx_id_bytes
 
     @property
@@ -101,10 +128,12 @@ class TxIn:
     def previous_tx_out_index_bytes(self):
         if (self._previous_tx_out_index_bytes == None) and (self._previous_tx_out_index != None):
             self._previous_tx_out_index_bytes = (self._previous_tx_out_index).to_bytes(4, byteorder='little')
+        self._previous_tx_out_index_bytes = general_utils.materialize_bytes(self._previous_tx_out_index_bytes)
         return self._previous_tx_out_index_bytes
 
     @property
     def sequence_bytes(self):
+        self._sequence_bytes = general_utils.materialize_bytes(self._sequence_bytes)
         return self._sequence_bytes
 
 
@@ -133,14 +162,18 @@ class TxIn:
     @previous_tx_id_bytes.setter
     def previous_tx_id_bytes(self, previous_tx_id_bytes):
         self._previous_tx_id_bytes = previous_tx_id_bytes
+        self.invalidate_bytes()
 
     @previous_tx_out_index.setter
     def previous_tx_out_index(self, previous_tx_out_index):
         self._previous_tx_out_index = previous_tx_out_index
+        self._previous_tx_out_index_bytes = None    # computed again from the new index
+        self.invalidate_bytes()
 
     @previous_tx_out_index_bytes.setter
     def previous_tx_out_index_bytes(self, previous_tx_out_index_bytes):
         self._previous_tx_out_index_bytes = previous_tx_out_index_bytes
+        self.invalidate_bytes()
 
 
     @script_pub_key.setter
@@ -157,11 +190,14 @@ class TxIn:
 
     @sig_script.setter
     def sig_script(self, sig_script):
+        old_sig_script = self._sig_script
         self._sig_script = sig_script
+        self._replace_child(old_sig_script, sig_script)
 
     @sequence_bytes.setter
     def sequence_bytes(self, sequence_bytes):
         self._sequence_bytes = sequence_bytes
+        self.invalidate_bytes()
 
 
     @private_key.setter
@@ -201,18 +237,23 @@ class TxIn:
         ret_bytes += self.sequence_bytes
         return ret_bytes
 
-    def __bytes__(self):
+    # ========== Serialization (see CachedBytes) ========== #
+
+    def _fields_size(self):
+        script_size = self._sig_script.serialized_size()
+        return 32 + 4 + general_utils.varint_size(script_size) + script_size + 8
+
+    def _write_fields_into(self, buffer, offset):
         """
-        Convert this instance of tx_in to bytes, and returns the bytes object.
-        :return: The bytes representation of this tx_in object
+        Write this tx_in into buffer: previous tx id, previous out index, script length (varint), the
+        coinbase or script bytes and the sequence.
         """
-        ret_bytes = b''
-        tx_id_bytes = self.previous_tx_id_bytes
-        ret_bytes += tx_id_bytes
-        ret_bytes += self.previous_tx_out_index_bytes
-        # coinbase or script
-        script_bytes = bytes(self.sig_script)  # compute coinbase or script bytes
-        ret_bytes += general_utils.write_varint(len(script_bytes))  # coinbase or script len (varint)
-        ret_bytes += script_bytes  # add coinbase or script bytes
-        ret_bytes += self.sequence_bytes
-        return ret_bytes
+        buffer[offset:offset + 32] = self.previous_tx_id_bytes
+        buffer[offset + 32:offset + 36] = self.previous_tx_out_index_bytes
+        offset = general_utils.write_varint_into(buffer, offset + 36, self._sig_script.serialized_size())
+        offset = self._sig_script.write_into(buffer, offset)
+        buffer[offset:offset + 8] = self.sequence_bytes
+        return offset + 8
+
+    def _children(self):
+        return (self._sig_script,)
@@ -1,16 +1,21 @@
 from kaspy_tools.logs import config_logger
 from kaspy_tools.utils import general_utils
+from kaspy_tools.kaspa_model.cached_bytes import CachedBytes
 
 KT_logger = config_logger.get_kaspy_tools_logger()
 
-class TxOut:
+class TxOut(CachedBytes):
     """
     This object holds all required methods to handle all types of TxOuts.
     """
+    __slots__ = ('_value', '_value_bytes', '_script_pub_key_len', '_script_pub_key_len_bytes',
+                 '_script_pub_key_bytes', '_script_pub_key', '_tx_id', '_out_index')
     def __init__(self, value_bytes=None, script_pub_key_len_bytes=0, script_pub_key_bytes=None, script_pub_key=None,
                  tx_id=None, out_index=None):
+        super().__init__()
         self._value=None
         self._value_bytes = value_bytes
+        self._script_pub_key_len = None
         self._script_pub_key_len_bytes = script_pub_key_len_bytes  # re-added
         self._script_pub_key_bytes = script_pub_key_bytes
         self._script_pub_key = script_pub_key
@@ -33,6 +38,22 @@ class TxOut:
         script_pub_key = block_bytes_stream.read(script_pub_key_len_int)
         return TxOut(value, script_pub_key_len_bytes, script_pub_key)
 
+    @staticmethod
+    def parse_tx_out_at(buffer_view, offset):
+        """
+        Zero-copy version of parse_tx_out: parse a "tx out" that starts at offset of a memoryview.
+        Fields are kept as memoryview slices, and are copied only when accessed.
+
+        :param buffer_view: A memoryview of the buffer holding the tx out
+        :param offset: The offset where the tx out starts
+        :return: (TxOut object, offset right after the tx out)
+        """
+        value = buffer_view[offset:offset + 8]
+        script_pub_key_len_int, script_pub_key_len_bytes, offset = general_utils.read_varint_at(buffer_view, offset + 8)
+        script_end = offset + script_pub_key_len_int
+        script_pub_key = buffer_view[offset:script_end]
+        return TxOut(value, script_pub_key_len_bytes, script_pub_key), script_end
+
     @classmethod
     def tx_out_factory(cls, *, value=0, script_pub_key=None, tx_id=None, out_index=None):
         new_tx_out = cls()
@@ -52,23 +73,34 @@ class TxOut:
     def set_value(self, value):
         """ Sets variable "_value" to the received value"""
         self._value = value
+        self._value_bytes = None    # computed again from the new value
+        self.invalidate_bytes()
 
     def set_value_bytes(self, value_bytes):
         """ Sets variable "_value" to the received value"""
         self._value_bytes = value_bytes
+        self.invalidate_bytes()
 
 
     def set_script_pub_key_len(self, script_pub_key_len):
         """ Sets variable "_script_pub_key_len" to the received value"""
         self._script_pub_key_len = script_pub_key_len
+        self._script_pub_key_len_bytes = None
+        self.invalidate_bytes()
 
 
     def set_script_pub_key(self, script_pub_key):
+        old_script_pub_key = self._script_pub_key
         self._script_pub_key = script_pub_key
+        self._script_pub_key_bytes = None   # computed again from the new script
+        self._script_pub_key_len_bytes = None
+        self._replace_child(old_script_pub_key, script_pub_key)
 
     def set_script_pub_key_bytes(self, script_pub_key_bytes):
         """ Sets variable "_script_pub_key" to the received value"""
         self._script_pub_key_bytes = script_pub_key_bytes
+        self._script_pub_key_len_bytes = None
+        self.invalidate_bytes()
 
     def set_tx_id(self, tx_id):
         self._tx_id = tx_id
@@ -91,6 +123,7 @@ class TxOut:
         """
         if not self._value_bytes:
             self._value_bytes = (self._value).to_bytes(8, byteorder='little')
+        self._value_bytes = general_utils.materialize_bytes(self._value_bytes)
         return self._value_bytes
 
 
@@ -105,7 +138,8 @@ class TxOut:
         :return: script_pub_key_len as bytes
         """
         if not self._script_pub_key_len_bytes:
-            self._script_pub_key_len_bytes = general_utils.write_varint(self._script_pub_key_len)
+            self._script_pub_key_len_bytes = general_utils.write_varint(len(self.get_script_pub_key_bytes()))
+        self._script_pub_key_len_bytes = general_utils.materialize_bytes(self._script_pub_key_len_bytes)
         return self._script_pub_key_len_bytes
 
 
@@ -122,6 +156,7 @@ class TxOut:
         if not self._script_pub_key_bytes:
             self._script_pub_key_bytes = bytes(self._script_pub_key)
             self._script_pub_key_len = len(self._script_pub_key_bytes)
+        self._script_pub_key_bytes = general_utils.materialize_bytes(self._script_pub_key_bytes)
         return self._script_pub_key_bytes
 
 
@@ -145,15 +180,33 @@ class TxOut:
 
 
 
-    def __bytes__(self):
+    # ========== Serialization (see CachedBytes) ========== #
+
+    def _fields_size(self):
+        return 8 + len(self.get_script_pub_key_len_bytes()) + len(self.get_script_pub_key_bytes())
+
+    def _write_fields_into(self, buffer, offset):
         """
-        Convert this instance of tx_out to bytes, and returns the bytes object.
-        :return: The bytes representation of this tx_out object
+        Write this tx_out into buffer: value, script_pub_key length (varint) and script_pub_key.
         """
-        ret_bytes = b''
-        ret_bytes += self.get_value_bytes()
-        script_bytes = self.get_script_pub_key_bytes()
+        buffer[offset:offset + 8] = self.get_value_bytes()
         script_len_bytes = self.get_script_pub_key_len_bytes()
-        ret_bytes += script_len_bytes
-        ret_bytes += script_bytes
-        return ret_bytes
\ No newline at end of file
+        script_bytes = self.get_script_pub_key_bytes()
+        offset += 8 + len(script_len_bytes)
+        buffer[offset - len(script_len_bytes):offset] = script_len_bytes
+        end = offset + len(script_bytes)
+        buffer[offset:end] = script_bytes
+        return end
+
+    def _children(self):
+        return (self._script_pub_key,)
+
+    def invalidate_bytes(self):
+        """
+        Drop the cached serialized form, including the script bytes when they were built from a script object.
+        :return: None
+        """
+        if self._script_pub_key is not None:
+            self._script_pub_key_bytes = None
+            self._script_pub_key_len_bytes = None
+        super().invalidate_bytes()
\ No newline at end of file
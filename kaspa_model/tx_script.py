@@ -1,6 +1,7 @@
 from io import BytesIO
 from kaspy_tools.logs import config_logger
 from kaspy_tools.kaspa_model.tx_script_codes import op_codes_to_bytes, bytes_to_op_codes
+from kaspy_tools.kaspa_model.cached_bytes import CachedBytes
 from kaspy_tools.utils import general_utils
 
 KT_logger = config_logger.get_kaspy_tools_logger()
@@ -11,11 +12,29 @@ SIGHASH_NONE = b'\x02'
 SIGHASH_SINGLE = b'\x03'
 SIGHASH_ANYONECANPAY = b'\x04'
 
-class TxScript:
+# opcode byte -> op name, for the single byte opcodes (any other byte is the length of a data push)
+OP_NAMES_BY_BYTE = [None] * 256
+for _op_value, _op_name in bytes_to_op_codes.items():
+    if len(_op_value) == 1:
+        OP_NAMES_BY_BYTE[_op_value[0]] = _op_name
+SINGLE_BYTES = [bytes((i,)) for i in range(256)]
+
+# P2PKH: OP_DUP OP_HASH160 <20 bytes pub hash> OP_EQUALVERIFY OP_CHECKSIG
+P2PKH_SCRIPT_SIZE = 25
+P2PKH_PREFIX = op_codes_to_bytes['OP_DUP'] + op_codes_to_bytes['OP_HASH160'] + b'\x14'
+P2PKH_SUFFIX = op_codes_to_bytes['OP_EQUALVERIFY'] + op_codes_to_bytes['OP_CHECKSIG']
+
+
+class TxScript(CachedBytes):
+    __slots__ = ('_script_stack_op', '_script_stack_bytes', '_pub_hash_bytes', '_raw_script')
+
     def __init__(self, script_stack_op=None, script_stack_bytes=None):
+        super().__init__()
 
         self._script_stack_op = script_stack_op or []
         self._script_stack_bytes = script_stack_bytes or []
+        self._pub_hash_bytes = None
+        self._raw_script = None     # raw bytes of a parsed script, until it is tokenized (see _tokenize)
 
 
     @classmethod
@@ -24,23 +43,69 @@ class TxScript:
             script_bytes = bytes.fromhex(raw_script)
         elif type(raw_script) is BytesIO:
             script_bytes = raw_script.read(length)
-        else:               # type(raw_script) is bytes
+        else:               # type(raw_script) is bytes (or a memoryview, when parsed by the zero-copy parser)
             script_bytes = raw_script
         new_script = cls()
+        # The script is kept raw, and is tokenized only when its tokens are needed (see _tokenize).
+        # P2PKH scripts (the common case) are matched in one go, and their pub hash is sliced directly.
+        new_script._raw_script = script_bytes
+        if cls.is_p2pkh_script(script_bytes):
+            new_script._pub_hash_bytes = script_bytes[3:23]
+        return new_script
+
+    @staticmethod
+    def is_p2pkh_script(script_bytes):
+        """
+        :param script_bytes: Raw script (bytes or memoryview)
+        :return: True if the script is OP_DUP OP_HASH160 <20 bytes> OP_EQUALVERIFY OP_CHECKSIG
+        """
+        return (len(script_bytes) == P2PKH_SCRIPT_SIZE and script_bytes[:3] == P2PKH_PREFIX
+                and script_bytes[23:] == P2PKH_SUFFIX)
+
+    @staticmethod
+    def get_token_at(script_bytes, offset, last_op=None):
+        """
+        Offset based tokenizer: read the token that starts at offset, without slicing the rest of the script.
+        :param script_bytes: Raw script (bytes or memoryview)
+        :param offset: The offset of the token
+        :param last_op: The string name of the last token seen in this script (e.g: 'OP_HASH160')
+        :return: (opcode, value), offset of the next token, pub-hash (or None)
+        """
+        op_byte = script_bytes[offset]
+        op_name = OP_NAMES_BY_BYTE[op_byte]
+        if op_name is not None:
+            return (op_name, SINGLE_BYTES[op_byte]), offset + 1, None
+        data_end = offset + 1 + op_byte     # data: the op byte is the data length
+        just_data = script_bytes[offset + 1:data_end]
+        return ('data', just_data), data_end, just_data if last_op == 'OP_HASH160' else None
+
+    def _tokenize(self):
+        """
+        Build the token stacks of a parsed script from its raw bytes (done once, on first use).
+        :return: None
+        """
+        script_bytes = self._raw_script
+        if script_bytes is None:
+            return
+        self._raw_script = None
+        script_stack_op = self._script_stack_op = []
+        script_stack_bytes = self._script_stack_bytes = []
+        offset = 0
+        script_len = len(script_bytes)
         last_op = None
-        while script_bytes:
-            op_pair, script_bytes, pub_hash_bytes = cls.get_token(script_bytes, last_op)
-            last_op = op_pair[0]
-            new_script.script_push(op_pair[0], op_pair[1])
+        while offset < script_len:
+            (last_op, op_value), offset, pub_hash_bytes = self.get_token_at(script_bytes, offset, last_op)
+            script_stack_op.append(last_op)
+            script_stack_bytes.append(op_value)
             if pub_hash_bytes:
-                new_script.set_pub_hash(pub_hash_bytes)
-        return new_script
+                self._pub_hash_bytes = pub_hash_bytes
 
     @classmethod
     def get_token(cls, script_bytes, last_op=None):
         """
         This is a tokenizer, part of the parsing of script given in bytes.
         Call it with script bytes, and it will return the next token + rest of scripts.
+        (Kept for compatibility: get_token_at does the same without copying the rest of the script.)
         If the last token was OP_HASH160, this means that the current data is the has, so it
         returns this also.
         :param script_bytes: A bytes object with raw rest-of-script
@@ -54,18 +119,8 @@ class TxScript:
                 b'\x14\xda\x17E\xe9\xb5I\xbd\x0b\xfa\x1aV\x99q\xc7~\xba0\xcdZK\x87',
                 b'\xda\x17E\xe9\xb5I\xbd\x0b\xfa\x1aV\x99q\xc7~\xba0\xcdZK'
         """
-        pub_hash_bytes = None
-        if script_bytes[:1] in bytes_to_op_codes:
-            checked_byte = script_bytes[0:1]
-            op_pair = (bytes_to_op_codes[checked_byte], checked_byte)
-            return op_pair, script_bytes[1:], pub_hash_bytes
-        else:   # data
-            data_len = script_bytes[0]
-            just_data = script_bytes[1:data_len+1]
-            op_pair = ('data', just_data)
-            if last_op == 'OP_HASH160':
-                pub_hash_bytes = just_data
-            return op_pair, script_bytes[data_len+1:], pub_hash_bytes
+        op_pair, next_offset, pub_hash_bytes = cls.get_token_at(script_bytes, 0, last_op)
+        return op_pair, script_bytes[next_offset:], pub_hash_bytes
 
 
     @classmethod
@@ -102,33 +157,59 @@ class TxScript:
         # mesure just the length of sig, without the extra byte.
         # len_sig = len(sig[:-1]).to_bytes(1, byteorder='little')
         len_sig = len(sig).to_bytes(1, byteorder='little')
+        self._tokenize()
         self._script_stack_bytes.append(len_sig + sig)
         self._script_stack_op.append('<sig>')
+        self.invalidate_bytes()
 
     def script_push(self, op_name, op_value):
+        self._tokenize()
         self._script_stack_op.append(op_name)
         self._script_stack_bytes.append(op_value)
+        self.invalidate_bytes()
 
     def script_pop(self):
+        self._tokenize()
         op_name = self._script_stack_op.pop()
         op_value = self._script_stack_bytes.pop()
+        self.invalidate_bytes()
         return op_name, op_value
 
     #****************    get methods  *************************
 
     def get_pubhash_bytes(self):
         # get it without the length byte
+        if self._pub_hash_bytes is None:
+            self._tokenize()
+        self._pub_hash_bytes = general_utils.materialize_bytes(self._pub_hash_bytes)
         return self._pub_hash_bytes
 
-    def __bytes__(self):
-        ret_bytes = b''
-        for token in self._script_stack_bytes:
-            if token in bytes_to_op_codes:
-                ret_bytes += token
+    # ****************    serialization (see CachedBytes)  *************************
+
+    def _fields_size(self):
+        if self._raw_script is not None:
+            return len(self._raw_script)
+        size = 0
+        for op_name, token in zip(self._script_stack_op, self._script_stack_bytes):
+            if op_name in op_codes_to_bytes:     # opcode, otherwise data (which may look like an opcode byte)
+                size += len(token)
             else:
-                ret_bytes += (len(token)).to_bytes(1, byteorder='little')
-                ret_bytes += token
-        return ret_bytes
+                size += 1 + len(token)     # length byte + data
+        return size
+
+    def _write_fields_into(self, buffer, offset):
+        if self._raw_script is not None:
+            end = offset + len(self._raw_script)
+            buffer[offset:end] = self._raw_script
+            return end
+        for op_name, token in zip(self._script_stack_op, self._script_stack_bytes):
+            if op_name not in op_codes_to_bytes:
+                buffer[offset] = len(token)
+                offset += 1
+            end = offset + len(token)
+            buffer[offset:end] = token
+            offset = end
+        return offset
 
     # def __add__(self,other):
     #     new_stack_bytes = self._script_stack_bytes + other._script_stack_bytes
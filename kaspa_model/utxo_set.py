@@ -0,0 +1,192 @@
+"""
+UtxoSet holds the unspent outputs computed from a DAG (see dnld_utxo_set_command).
+Each utxo is kept as an entry: {'output': TxOut object, 'used': bool}, where 'used' means the utxo
+was already chosen as an input of a new transaction.
+
+The set is indexed three ways:
+  - by outpoint (tx_id, out_index):  spending and lookup are O(1)
+  - by owner (public key hash):      all the unspent utxos of an owner
+  - free list per owner:             the unspent utxos of an owner that are not used yet, so choosing
+                                     inputs costs O(inputs), not O(utxos x addresses)
+
+add and spend can record what they did into a journal (a list), so that rollback(journal) undoes them, in
+exact reverse order.
+"""
+from kaspy_tools.logs import config_logger
+
+KT_logger = config_logger.get_kaspy_tools_logger()
+
+JOURNAL_ADD = 'add'         # (JOURNAL_ADD, outpoint, the entry it overwrote or None)
+JOURNAL_SPEND = 'spend'     # (JOURNAL_SPEND, the spent entry)
+
+
+class UtxoSet:
+    def __init__(self):
+        self._utxos = {}            # (tx_id, out_index) -> entry
+        self._by_owner = {}         # pub hash -> {(tx_id, out_index): entry}
+        self._free_by_owner = {}    # pub hash -> {(tx_id, out_index): entry}, only entries not used yet
+
+    # ========== Update Methods ========== #
+
+    def add(self, tx_out, journal=None):
+        """
+        Add an unspent output. An entry with the same outpoint is replaced.
+        :param tx_out: A TxOut object, with tx_id and out_index set
+        :param journal: A list to record the change into (see rollback), or None
+        :return: The new entry
+        """
+        outpoint = (tx_out.get_tx_id(), tx_out.get_out_index())
+        entry = {'output': tx_out, 'used': False}
+        overwritten = self.spend(outpoint)
+        if journal is not None:
+            journal.append((JOURNAL_ADD, outpoint, overwritten))
+        self._utxos[outpoint] = entry
+        owner = self.owner_of(entry)
+        if owner is not None:
+            self._by_owner.setdefault(owner, {})[outpoint] = entry
+            self._free_by_owner.setdefault(owner, {})[outpoint] = entry
+        return entry
+
+    def restore(self, entry):
+        """
+        Put back an entry that was removed by spend (e.g: when a spending block is rolled back).
+        :param entry: An entry returned by spend
+        :return: The entry
+        """
+        outpoint = self.outpoint_of(entry)
+        self._utxos[outpoint] = entry
+        owner = self.owner_of(entry)
+        if owner is not None:
+            self._by_owner.setdefault(owner, {})[outpoint] = entry
+            if not entry['used']:
+                self._free_by_owner.setdefault(owner, {})[outpoint] = entry
+        return entry
+
+    def spend(self, outpoint, journal=None):
+        """
+        Remove an output that was spent by a transaction input.
+        :param outpoint: (tx_id, out_index)
+        :param journal: A list to record the change into (see rollback), or None
+        :return: The removed entry, or None if outpoint is not in the set
+        """
+        entry = self._utxos.pop(outpoint, None)
+        if entry is None:
+            return None
+        if journal is not None:
+            journal.append((JOURNAL_SPEND, entry))
+        owner = self.owner_of(entry)
+        if owner is not None:
+            self._remove_from_index(self._by_owner, owner, outpoint)
+            self._remove_from_index(self._free_by_owner, owner, outpoint)
+        return entry
+
+    def rollback(self, journal):
+        """
+        Undo the changes recorded in a journal by add and spend, last change first.
+        :param journal: A list of journal records
+        :return: None
+        """
+        for record in reversed(journal):
+            if record[0] == JOURNAL_ADD:
+                _, outpoint, overwritten = record
+                self.spend(outpoint)
+                if overwritten is not None:
+                    self.restore(overwritten)
+            else:
+                self.restore(record[1])
+
+    def mark_used(self, entry):
+        """
+        Mark an entry as chosen for a new transaction (it stays unspent).
+        :param entry: An entry of this set
+        :return: None
+        """
+        entry['used'] = True
+        owner = self.owner_of(entry)
+        if owner is not None:
+            self._remove_from_index(self._free_by_owner, owner, self.outpoint_of(entry))
+
+    def release(self, entry):
+        """
+        Undo mark_used: the entry can be chosen again.
+        :param entry: An entry of this set
+        :return: None
+        """
+        entry['used'] = False
+        outpoint = self.outpoint_of(entry)
+        owner = self.owner_of(entry)
+        if owner is not None and self._utxos.get(outpoint) is entry:
+            self._free_by_owner.setdefault(owner, {})[outpoint] = entry
+
+    @staticmethod
+    def _remove_from_index(index, owner, outpoint):
+        owner_entries = index.get(owner)
+        if owner_entries is not None:
+            owner_entries.pop(outpoint, None)
+            if not owner_entries:
+                del index[owner]
+
+    # ========== Get Methods ========== #
+
+    @staticmethod
+    def outpoint_of(entry):
+        tx_out = entry['output']
+        return tx_out.get_tx_id(), tx_out.get_out_index()
+
+    @staticmethod
+    def owner_of(entry):
+        """
+        :return: The public key hash (bytes) that an entry pays to, or None for non P2PKH scripts
+        """
+        return entry['output'].get_script_pub_key().get_pubhash_bytes()
+
+    def get(self, outpoint, default=None):
+        return self._utxos.get(outpoint, default)
+
+    def utxos_of(self, pub_hash):
+        """
+        :param pub_hash: A public key hash (bytes)
+        :return: A list of the unspent entries that pay to pub_hash
+        """
+        return list(self._by_owner.get(pub_hash, {}).values())
+
+    def take_unused(self, count, pub_hashes):
+        """
+        Choose up to count unused entries that pay to one of pub_hashes, and mark them as used.
+        :param count: Number of entries to choose
+        :param pub_hashes: Public key hashes of owners whose private keys are known
+        :return: (list of chosen entries, total value of these entries)
+        """
+        chosen = []
+        total_value = 0
+        for pub_hash in pub_hashes:
+            free_entries = self._free_by_owner.get(pub_hash)
+            while free_entries and len(chosen) < count:
+                outpoint = next(iter(free_entries))     # oldest first, like the order of the set
+                entry = free_entries.pop(outpoint)
+                entry['used'] = True
+                chosen.append(entry)
+                total_value += entry['output'].get_value()
+            if free_entries is not None and not free_entries:
+                del self._free_by_owner[pub_hash]
+            if len(chosen) == count:
+                break
+        return chosen, total_value
+
+    def entries(self):
+        """
+        :return: A list of all the entries, in the order they were added
+        """
+        return list(self._utxos.values())
+
+    def __len__(self):
+        return len(self._utxos)
+
+    def __contains__(self, outpoint):
+        return outpoint in self._utxos
+
+    def __getitem__(self, outpoint):
+        return self._utxos[outpoint]
+
+    def __iter__(self):
+        return iter(self._utxos.values())
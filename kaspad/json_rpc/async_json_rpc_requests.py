@@ -0,0 +1,219 @@
+"""
+An asyncio version of json_rpc_requests: AsyncJsonRpcClient has the same request methods (same names, arguments
+and return values), as coroutines, so many requests can be in flight against one node at the same time.
+
+    client = AsyncJsonRpcClient(conn, concurrency=32)
+    responses = await asyncio.gather(*(client.get_block_request(block_hash) for block_hash in hashes))
+    client.close()
+
+- concurrency:  a semaphore bounds the number of requests in flight.
+- keep-alive:   the default transport (SessionTransport) sends through the pooled keep-alive session of the node
+                (see KaspaNode.session), from a thread pool of concurrency threads.
+- transport:    any object with an async send(payload) method can be used instead, e.g: LocalTransport, which
+                hands the requests to a python function (a local stand-in for kaspad, for tests).
+"""
+import asyncio
+import itertools
+import json
+from concurrent.futures import ThreadPoolExecutor
+from kaspy_tools import kaspy_tools_constants
+from kaspy_tools.logs import config_logger
+from kaspy_tools.kaspa_model.kaspa_address import KaspaAddress
+from kaspy_tools.kaspad.json_rpc.json_rpc_requests import DEFAULT_BATCH_SIZE
+
+KT_logger = config_logger.get_kaspy_tools_logger()
+
+DEFAULT_CONCURRENCY = 16
+
+
+# ========== Transports ========== #
+
+class SessionTransport:
+    """
+    Sends requests with the keep-alive session of a KaspaNode, from a thread pool (requests is blocking).
+    """
+
+    def __init__(self, conn, concurrency=DEFAULT_CONCURRENCY, timeout=kaspy_tools_constants.REQUEST_TIMEOUT):
+        """
+        :param conn: A KaspaNode. Its pool_size should be at least concurrency, so that connections are reused
+        :param concurrency: Number of threads (requests that can be sent at the same time)
+        :param timeout: Timeout of each request, in seconds
+        """
+        self._conn = conn
+        self._timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='json_rpc')
+        if conn.pool_size < concurrency:
+            KT_logger.warning('connection pool (%d) smaller than concurrency (%d)', conn.pool_size, concurrency)
+
+    def _post(self, payload_json):
+        response = self._conn.session.post(self._conn.updated_url, data=payload_json,
+                                           headers={'content-type': 'application/json'},
+                                           verify=self._conn.cert_file_path, timeout=self._timeout)
+        return response, response.json()
+
+    async def send(self, payload):
+        """
+        :param payload: A json-rpc request (dict) or batch (list of dicts)
+        :return: (transport response object, response_json)
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._post, json.dumps(payload))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+class LocalTransport:
+    """
+    Hands the requests to a python function instead of a node: a local stand-in for kaspad (for tests).
+    """
+
+    def __init__(self, handler):
+        """
+        :param handler: A function (or coroutine function) that gets a json-rpc request (dict) and returns its
+                        response_json. Batches are split into their requests.
+        """
+        self._handler = handler
+
+    async def _handle(self, request):
+        response_json = self._handler(request)
+        if asyncio.iscoroutine(response_json):
+            response_json = await response_json
+        return response_json
+
+    async def send(self, payload):
+        # the requests go through json, like a real transport, so handlers can't share objects with the caller
+        payload = json.loads(json.dumps(payload))
+        if isinstance(payload, list):
+            return None, [await self._handle(request) for request in payload]
+        return None, await self._handle(payload)
+
+    def close(self):
+        pass
+
+
+# ========== Client ========== #
+
+class AsyncJsonRpcClient:
+    def __init__(self, conn=None, *, concurrency=DEFAULT_CONCURRENCY, transport=None):
+        """
+        :param conn: A KaspaNode (not needed if a transport is given)
+        :param concurrency: Max number of requests in flight
+        :param transport: A transport object (default: SessionTransport of conn)
+        """
+        self._transport = transport if transport is not None else SessionTransport(conn, concurrency)
+        self._concurrency = concurrency
+        self._semaphore = None      # created in the running event loop, on first use
+        self._request_ids = itertools.count(1)
+
+    def close(self):
+        self._transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def _send(self, payload):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        async with self._semaphore:
+            return await self._transport.send(payload)
+
+    async def call(self, method, params):
+        """
+        Send a single json-rpc request, with a unique id.
+        :param method: The json-rpc method name (e.g: 'getBlock')
+        :param params: A list of the method params
+        :return: (transport response object, response_json)
+        """
+        payload = {"method": method, "params": params, "jsonrpc": "2.0", "id": next(self._request_ids)}
+        return await self._send(payload)
+
+    async def batch_request(self, calls, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Async version of json_rpc_requests.batch_request. The chunks are sent concurrently (up to concurrency).
+        :param calls: A list of (method, params) tuples
+        :param batch_size: Max number of calls per request
+        :return: A list of response_json, one per call, in the order of calls
+        """
+        chunks = [[{"method": method, "params": params, "jsonrpc": "2.0", "id": next(self._request_ids)}
+                   for method, params in calls[chunk_start:chunk_start + batch_size]]
+                  for chunk_start in range(0, len(calls), batch_size)]
+        chunk_responses = await asyncio.gather(*(self._send(chunk) for chunk in chunks))
+        responses = []
+        for payloads, (_, response_json) in zip(chunks, chunk_responses):
+            if not isinstance(response_json, list):    # the whole batch was rejected: a single error response
+                responses.extend(dict(response_json, id=payload['id']) for payload in payloads)
+                continue
+            responses_by_id = {call_response.get('id'): call_response for call_response in response_json}
+            for payload in payloads:
+                responses.append(responses_by_id.get(payload['id']) or
+                                 {'result': None, 'id': payload['id'],
+                                  'error': {'code': None, 'message': 'No response for this call in the batch'}})
+        return responses
+
+    # ========== Requests (see json_rpc_requests) ========== #
+
+    async def submit_block_request(self, hex_block, options=None):
+        params = [hex_block] if options is None else [hex_block, {"workId": "Jimmy"}]
+        response, response_json = await self.call("submitBlock", params)
+        KT_logger.debug('Submit block: %s', str(response_json['result']))
+        return response, response_json
+
+    async def get_block_request(self, block_hash, sub_network=None, verbose_tx=False):
+        if sub_network is None:
+            params = [block_hash, True, verbose_tx]
+        else:
+            params = [block_hash, True, False, sub_network]
+        return (await self.call("getBlock", params))[1]
+
+    async def get_best_block_request(self):
+        return (await self.call("getBestBlock", []))[1]
+
+    async def get_block_dag_info_request(self):
+        return (await self.call("getBlockDagInfo", []))[1]
+
+    async def generate_request(self, num_blocks):
+        return (await self.call("generate", [num_blocks]))[1]
+
+    async def get_block_template_request(self, pay_address=None, netprefix='kaspadev'):
+        if pay_address is None:        # that means we just need a template not for submitting
+            pay_address = KaspaAddress().get_address(prefix=netprefix)
+        else:
+            pay_address = pay_address.get_address(prefix=netprefix)
+        response, response_json = await self.call("getBlockTemplate", [{"payAddress": pay_address}])
+        if response_json['result'] is None:
+            KT_logger.error('template request failed: %s', str(response_json['error']))
+        return response_json
+
+    async def get_chain_from_block(self, start_hash=None, include_blocks=False):
+        return (await self.call("getChainFromBlock", [include_blocks, start_hash]))[1]
+
+    async def get_blocks(self, requested_blocks_count):
+        """
+        :return: (raw blocks list, verbose blocks list). The pages are requested one after the other.
+        """
+        all_raw_blocks = []
+        all_verbose_blocks = []
+        next_hash = None
+        while True:
+            response, response_json = await self.call("getBlocks", [True, True, next_hash])
+            all_verbose_blocks.extend(response_json['result']['verboseBlocks'])
+            all_raw_blocks.extend(response_json['result']['rawBlocks'])
+            next_hash = all_verbose_blocks[-1]['hash']
+            if len(all_verbose_blocks) >= requested_blocks_count:
+                return all_raw_blocks[:requested_blocks_count], all_verbose_blocks[:requested_blocks_count]
+            if len(response_json['result']['verboseBlocks']) < 3:
+                return all_raw_blocks, all_verbose_blocks
+
+    async def submit_raw_tx(self, tx_hex, options=None):
+        params = [tx_hex] if options is None else [tx_hex, {"workId": "Jimmy"}]
+        return await self.call("sendRawTransaction", params)
+
+    async def get_mempool_entry_request(self, tx_id):
+        return (await self.call("getMempoolEntry", [tx_id]))[1]
+
+    async def get_peer_info_request(self):
+        return (await self.call("getPeerInfo", []))[1]
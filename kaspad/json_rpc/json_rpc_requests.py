@@ -1,15 +1,26 @@
 """
 This module holds the methods that handle all the JSON-RPC requests for the automation project.
+All requests go through the pooled keep-alive session of the node (conn.session, see KaspaNode).
 """
 import sys
 from kaspy_tools import kaspy_tools_constants
 from kaspy_tools.logs import config_logger
 from kaspy_tools.kaspa_model.kaspa_address import KaspaAddress
-import requests
+from kaspy_tools.kaspa_model.block import Block
+from kaspy_tools.utils import json_stream
+import itertools
 import json
+import queue
+import threading
+from collections import deque
 
 KT_logger = config_logger.get_kaspy_tools_logger()
 
+DEFAULT_BATCH_SIZE = 100     # calls per http request, in batch requests
+PREFETCH_BLOCKS = 1000       # blocks read ahead by iter_blocks
+LAST_PAGE_SIZE = 3           # a getBlocks page with fewer blocks than this is the last one
+_batch_ids = itertools.count(1)
+
 def submit_block_request(hex_block, options=None, conn=None):
     """
     submitting a pre-defined block in hex string formant to the node via JSON-RPC.
@@ -40,8 +51,8 @@ def submit_block_request(hex_block, options=None, conn=None):
         }
     payload_json = json.dumps(payload)
 
-    response = requests.post(conn.updated_url, data=payload_json, headers=headers,
-                             verify=conn.cert_file_path)
+    response = conn.session.post(conn.updated_url, data=payload_json, headers=headers,
+                                 verify=conn.cert_file_path)
     response_json = response.json()
     KT_logger.debug('Submit block: %s', str(response_json['result']))
     return response, response_json
@@ -78,8 +89,8 @@ def get_block_request(block_hash, sub_network=None, conn=None, verbose_tx=False)
         }
     payload_json = json.dumps(payload)
 
-    response = requests.post(conn.updated_url, data=payload_json, headers=headers,
-                             verify=conn.cert_file_path)
+    response = conn.session.post(conn.updated_url, data=payload_json, headers=headers,
+                                 verify=conn.cert_file_path)
     response_json = response.json()
     return response_json
 
@@ -103,8 +114,8 @@ def get_best_block_request(conn=None):
     }
     payload_json = json.dumps(payload)
 
-    response = requests.post(conn.updated_url, data=payload_json, headers=headers,
-                             verify=conn.cert_file_path)
+    response = conn.session.post(conn.updated_url, data=payload_json, headers=headers,
+                                 verify=conn.cert_file_path)
     response_json = response.json()
     return response_json
 
@@ -129,8 +140,8 @@ def get_block_dag_info_request(conn=None):
     }
     payload_json = json.dumps(payload)
 
-    response = requests.post(conn.updated_url, data=payload_json, headers=headers,
-                             verify=conn.cert_file_path)
+    response = conn.session.post(conn.updated_url, data=payload_json, headers=headers,
+                                 verify=conn.cert_file_path)
     response_json = response.json()
     return response_json
 
@@ -152,8 +163,8 @@ def generate_request(num_blocks, conn=None):
     }
     payload_json = json.dumps(payload)
 
-    response = requests.post(conn.updated_url, data=payload_json, headers=headers,
-                             verify=conn.cert_file_path)
+    response = conn.session.post(conn.updated_url, data=payload_json, headers=headers,
+                                 verify=conn.cert_file_path)
     response_json = response.json()
     return response_json
 
@@ -188,8 +199,8 @@ def get_block_template_request(conn, pay_address=None, netprefix='kaspadev',
     payload_json = json.dumps(payload)
 
     try:
-        response = requests.get(conn.updated_url, data=payload_json, headers=headers,
-                                 verify=conn.cert_file_path, timeout=timeout)
+        response = conn.session.get(conn.updated_url, data=payload_json, headers=headers,
+                                     verify=conn.cert_file_path, timeout=timeout)
     except:
         errs = sys.exc_info()
 
@@ -211,8 +222,8 @@ def get_chain_from_block(start_hash=None, conn=None, include_blocks=False):
     }
     payload_json = json.dumps(payload)
 
-    response = requests.post(conn.updated_url, data=payload_json, headers=headers,
-                             verify=conn.cert_file_path)
+    response = conn.session.post(conn.updated_url, data=payload_json, headers=headers,
+                                 verify=conn.cert_file_path)
     response_json = response.json()
     return response_json
 
@@ -221,41 +232,157 @@ def get_blocks(requested_blocks_count, conn=None):
     """
     This function returns a list of blocks, in binary-hex encoding and verbose encoding.
     The blocks are taken from a node specified in node_url.
+    (Use iter_blocks to process the blocks while they are downloaded, without keeping all of them.)
         :param node_url: The url of a kaspad node.
         :param requested_blocks_count specify the number of requested blocks
     :return: (raw blocks list, verbose blocks list)   None in each part if not requested.
     """
-
     all_raw_blocks = []
     all_verbose_blocks = []
-    blocks_count = 0
+    for raw_block, verbose_block in iter_blocks(requested_blocks_count, conn=conn):
+        all_raw_blocks.append(raw_block)
+        all_verbose_blocks.append(verbose_block)
+    return all_raw_blocks, all_verbose_blocks
+
+
+def stream_blocks_page(low_hash=None, conn=None, include_raw=True, projection=None, include_verbose=True):
+    """
+    Get one page of blocks (getBlocks), starting after low_hash.
+    The response is decoded incrementally (see utils.json_stream): blocks are yielded while the body is read,
+    and only one block is decoded at a time.
+    Memory: when only raw blocks (or only verbose blocks) are requested, each block is yielded as soon as it is
+    decoded, so one block is kept at a time. When both are requested, a pair is yielded only when both of its
+    blocks were decoded: the array that comes first in the response (rawBlocks, in kaspad's key order) is kept
+    until the other array is read, so up to a whole page of blocks is buffered. Request only the raw blocks
+    (include_verbose=False) to keep the memory bound.
+    :param low_hash: The hash of the last block of the previous page (None for the first page)
+    :param include_raw: False to not request the raw blocks (None is yielded instead)
+    :param projection: Fields of the verbose blocks to keep (see json_stream.project), None to keep all of them
+    :param include_verbose: False to not request the verbose blocks (None is yielded instead)
+    :return: A generator of (raw block hex, verbose block) tuples
+    """
     headers = {'content-type': 'application/json'}
-    next_hash = None
-    # Params in the next jsonrpc means:  False - do not include binary representation , True-include verbose data
-    payload = {"method": "getBlocks", "params": [True, True, None],  # Always get raw AND verbose
+    # Params in the next jsonrpc means:  include binary representation?, include verbose data?
+    payload = {"method": "getBlocks", "params": [include_raw, include_verbose, low_hash],
                "jsonrpc": "2.0",
                "id": 0}
+    payload_json = json.dumps(payload)
 
-    while True:
-        if next_hash is not None:
-            payload['params'][2] = next_hash
-        payload_json = json.dumps(payload)
+    response = conn.session.get(conn.updated_url, data=payload_json, headers=headers, auth=('user', 'pass'),
+                                verify=conn.cert_file_path, stream=True)
+    raw_blocks = deque()
+    verbose_blocks = deque()
+    try:
+        for path, element in json_stream.iter_json_arrays(response.iter_content(json_stream.DEFAULT_CHUNK_SIZE),
+                                                          {('result', 'rawBlocks'), ('result', 'verboseBlocks')},
+                                                          {('error',)}):
+            if path == ('error',):
+                if element is not None:
+                    raise RuntimeError(f'getBlocks failed: {element}')
+            elif path[-1] == 'rawBlocks':
+                raw_blocks.append(element)
+            else:
+                verbose_blocks.append(element if projection is None else json_stream.project(element, projection))
+            # with a single array requested this yields every block as soon as it is decoded
+            while (verbose_blocks or not include_verbose) and (raw_blocks or not include_raw):
+                yield (raw_blocks.popleft() if include_raw else None,
+                       verbose_blocks.popleft() if include_verbose else None)
+    finally:
+        response.close()
+
+
+def raw_block_hash(raw_block):
+    """
+    :param raw_block: A raw block, as hex (as returned by getBlocks)
+    :return: The block hash as hex (like the 'hash' of a verbose block). Only the header is decoded and hashed.
+    """
+    header_hex_size = 2 * Block.header_size(bytes.fromhex(raw_block[:10]))
+    return Block.header_hash_and_parents(bytes.fromhex(raw_block[:header_hex_size]))[0].hex()
 
-        response = requests.get(conn.updated_url, data=payload_json, headers=headers, auth=('user', 'pass'),
-                                verify=conn.cert_file_path)
-        response_json = response.json()
-        all_verbose_blocks.extend(response_json['result']['verboseBlocks'])
-        all_raw_blocks.extend(response_json['result']['rawBlocks'])
-        next_hash = all_verbose_blocks[-1]['hash']
-
-        blocks_count += len(response_json['result']['verboseBlocks'])
-        if blocks_count >= requested_blocks_count:
-            all_verbose_blocks = all_verbose_blocks[:requested_blocks_count]
-            all_raw_blocks = all_raw_blocks[:requested_blocks_count]
-            break
-        if len(response_json['result']['verboseBlocks']) < 3:
-            break
-    return all_raw_blocks, all_verbose_blocks
+
+def _prefetch_blocks(block_queue, stop_event, conn, include_raw, projection, include_verbose=True):
+    """
+    The body of the prefetch thread of iter_blocks: fetch the pages one after the other, into block_queue.
+    Puts the (raw, verbose) blocks, None after the last page, or the exception that stopped it.
+    """
+    low_hash = None
+    try:
+        while not stop_event.is_set():
+            page_size = 0
+            for raw_block, verbose_block in stream_blocks_page(low_hash, conn=conn, include_raw=include_raw,
+                                                               projection=projection,
+                                                               include_verbose=include_verbose):
+                block_queue.put((raw_block, verbose_block))
+                low_hash = verbose_block['hash'] if include_verbose else raw_block_hash(raw_block)
+                page_size += 1
+                if stop_event.is_set():
+                    return
+            if page_size < LAST_PAGE_SIZE:
+                break
+        block_queue.put(None)
+    except Exception as error:
+        block_queue.put(error)
+
+
+def iter_blocks(requested_blocks_count=None, conn=None, prefetch_blocks=PREFETCH_BLOCKS, include_raw=True,
+                projection=None, include_verbose=True):
+    """
+    A generator of the node blocks: memory does not grow with the DAG size.
+    While blocks are consumed, a background thread already fetches the next ones (up to prefetch_blocks ahead),
+    decoding the responses incrementally.
+    :param requested_blocks_count: Max number of blocks to yield (None for all of them)
+    :param conn: The node connection
+    :param prefetch_blocks: Number of blocks read ahead
+    :param include_raw: False to not download the raw blocks (None is yielded instead)
+    :param projection: Fields of the verbose blocks to keep (see json_stream.project), None to keep all of them.
+                       'hash' is always needed (to request the next page)
+    :param include_verbose: False to not download the verbose blocks (None is yielded instead). The next pages are
+                            then requested with hashes computed from the raw block headers
+    :return: A generator of (raw block hex, verbose block) tuples
+    """
+    if not (include_raw or include_verbose):
+        raise ValueError('iter_blocks: at least one of include_raw and include_verbose must be set')
+    block_queue = queue.Queue(maxsize=prefetch_blocks)
+    stop_event = threading.Event()
+    prefetch_thread = threading.Thread(target=_prefetch_blocks,
+                                       args=(block_queue, stop_event, conn, include_raw, projection, include_verbose),
+                                       daemon=True)
+    prefetch_thread.start()
+    blocks_count = 0
+    try:
+        while requested_blocks_count is None or blocks_count < requested_blocks_count:
+            block = block_queue.get()
+            if block is None:
+                break
+            if isinstance(block, Exception):
+                raise block
+            yield block
+            blocks_count += 1
+    finally:
+        stop_event.set()
+        while prefetch_thread.is_alive():    # unblock the thread if it waits on a full queue
+            try:
+                block_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def iter_verbose_blocks(requested_blocks_count=None, conn=None, projection=None):
+    """
+    Like iter_blocks, but yields only the verbose blocks (the raw blocks are not downloaded).
+    """
+    for raw_block, verbose_block in iter_blocks(requested_blocks_count, conn=conn, include_raw=False,
+                                                projection=projection):
+        yield verbose_block
+
+
+def iter_raw_blocks(requested_blocks_count=None, conn=None):
+    """
+    Like iter_blocks, but yields only the raw blocks, as hex (the verbose blocks are not downloaded, so kaspad
+    does not have to serialize them).
+    """
+    for raw_block, verbose_block in iter_blocks(requested_blocks_count, conn=conn, include_verbose=False):
+        yield raw_block
 
 
 def submit_raw_tx(tx_hex, options=None, conn=None):
@@ -288,8 +415,8 @@ def submit_raw_tx(tx_hex, options=None, conn=None):
         }
     payload_json = json.dumps(payload)
 
-    response = requests.post(conn.updated_url, data=payload_json, headers=headers,
-                             verify=conn.cert_file_path)
+    response = conn.session.post(conn.updated_url, data=payload_json, headers=headers,
+                                 verify=conn.cert_file_path)
     response_json = response.json()
     return response, response_json
 
@@ -317,8 +444,8 @@ def get_mempool_entry_request(tx_id, conn=None):
 
     payload_json = json.dumps(payload)
 
-    response = requests.post(conn.updated_url, data=payload_json, headers=headers,
-                             verify=conn.cert_file_path)
+    response = conn.session.post(conn.updated_url, data=payload_json, headers=headers,
+                                 verify=conn.cert_file_path)
     response_json = response.json()
     return response_json
 
@@ -336,8 +463,85 @@ def get_peer_info_request(conn=None):
 
     payload_json = json.dumps(payload)
 
-    response = requests.get(conn.updated_url, data=payload_json, headers=headers,
-                            verify=conn.cert_file_path)
+    response = conn.session.get(conn.updated_url, data=payload_json, headers=headers,
+                                verify=conn.cert_file_path)
     response_json = response.json()
     return response_json
-    pass
\ No newline at end of file
+    pass
+
+# ========== Batch Requests ========== #
+
+def batch_request(calls, conn=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Send many json-rpc calls, batch_size calls per http request (a json-rpc batch).
+    Each call gets a unique id, and the responses are matched back to the calls by id.
+    The calls are sent in order, so a call may depend on the previous ones (e.g: submitting a parent block first).
+
+    :param calls: A list of (method, params) tuples. Example: [('getBlock', [block_hash, True, False]), ...]
+    :param conn: The node connection
+    :param batch_size: Max number of calls per http request
+    :return: A list of response_json (result, error, id), one per call, in the order of calls
+    """
+    headers = {'content-type': 'application/json'}
+    responses = []
+    for chunk_start in range(0, len(calls), batch_size):
+        payloads = [{"method": method, "params": params, "jsonrpc": "2.0", "id": next(_batch_ids)}
+                    for method, params in calls[chunk_start:chunk_start + batch_size]]
+        response = conn.session.post(conn.updated_url, data=json.dumps(payloads), headers=headers,
+                                     verify=conn.cert_file_path)
+        response_json = response.json()
+        if not isinstance(response_json, list):    # the whole batch was rejected: a single error response
+            KT_logger.error('batch request failed: %s', str(response_json.get('error')))
+            responses.extend(dict(response_json, id=payload['id']) for payload in payloads)
+            continue
+        responses_by_id = {call_response.get('id'): call_response for call_response in response_json}
+        for payload in payloads:
+            call_response = responses_by_id.get(payload['id'])
+            if call_response is None:
+                call_response = {'result': None, 'id': payload['id'],
+                                 'error': {'code': None, 'message': 'No response for this call in the batch'}}
+            responses.append(call_response)
+    return responses
+
+
+def submit_blocks_batch(hex_blocks, conn=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Batch version of submit_block_request.
+
+    :param hex_blocks: A list of blocks in hexadecimal string (parents before children)
+    :return: A list of response_json, one per block
+    """
+    return batch_request([("submitBlock", [hex_block]) for hex_block in hex_blocks], conn=conn,
+                         batch_size=batch_size)
+
+
+def get_blocks_batch(block_hashes, conn=None, verbose_tx=False, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Batch version of get_block_request.
+
+    :param block_hashes: A list of block hashes in string format
+    :return: A list of response_json, one per block hash
+    """
+    return batch_request([("getBlock", [block_hash, True, verbose_tx]) for block_hash in block_hashes], conn=conn,
+                         batch_size=batch_size)
+
+
+def submit_raw_txs_batch(txs_hex, conn=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Batch version of submit_raw_tx.
+
+    :param txs_hex: A list of txs in hexadecimal string
+    :return: A list of response_json, one per tx
+    """
+    return batch_request([("sendRawTransaction", [tx_hex]) for tx_hex in txs_hex], conn=conn,
+                         batch_size=batch_size)
+
+
+def get_mempool_entries_batch(tx_ids, conn=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Batch version of get_mempool_entry_request.
+
+    :param tx_ids: A list of tx ids in string format
+    :return: A list of response_json, one per tx id
+    """
+    return batch_request([("getMempoolEntry", [tx_id]) for tx_id in tx_ids], conn=conn, batch_size=batch_size)
@@ -1,14 +1,39 @@
+"""
+Build (or restore) a very big DAG.
+
+generate_very_big_dag can be interrupted and resumed:
+- every checkpoint_interval blocks, the builder nodes are stopped and their volume is copied into
+  checkpoint_dag_dir (with the miner address), and the build state file is updated. The volume is copied into
+  new_checkpoint_dag_dir first, and only then replaces the previous checkpoint, so an interrupted copy never
+  leaves a partial checkpoint.
+- after every batch of blocks, the build state file (build_state_file, under the volumes directory) is updated
+  with the progress metrics (see BuildProgress), so a long build can be monitored by reading it.
+- generate_very_big_dag(resume=True) restores the last checkpoint (if there is one) and continues from there.
+"""
 from _datetime import datetime
+import json
+import os
 import time
 from kaspy_tools.kaspa_model.kaspa_address import KaspaAddress
 from kaspy_tools.kaspad.kaspa_dags.dag_tools import dag_make, save_restore_dags
+from kaspy_tools.kaspy_tools_constants import VOLUMES_DIR_PATH
 from kaspy_tools.local_run.run_local_services import run_services, docker_compose_utils
 from kaspy_tools.kaspad.json_rpc import json_rpc_requests
+from kaspy_tools.kaspad.utilities import block_pipeline
+from kaspy_tools.logs import config_logger
+
+KT_logger = config_logger.get_kaspy_tools_logger()
 
 big_dag_block_count = 1000000
 very_big_dag_dir = 'very_big_dag'
 very_big_work_dir = 'build'
 use_dir = 'kaspad'
+checkpoint_dag_dir = 'very_big_dag_checkpoint'
+new_checkpoint_dag_dir = checkpoint_dag_dir + '_new'      # the checkpoint being copied
+old_checkpoint_dag_dir = checkpoint_dag_dir + '_old'      # the previous checkpoint, while it is replaced
+build_state_file = 'very_big_dag_build.json'
+checkpoint_interval = 50000         # blocks between volume checkpoints
+batch_floors = 500                  # blocks between progress updates
 
 def get_big_dag(*, block_count=big_dag_block_count):
     if not save_restore_dags.volume_dir_exist(very_big_dag_dir):
@@ -20,27 +45,209 @@ def get_big_dag(*, block_count=big_dag_block_count):
 
 
 def prepare_for_big_dag():
+    stop_builders()
+    save_restore_dags.clear_dag_files(work_dir=very_big_work_dir, dag_dir=very_big_dag_dir)
+    start_builders()
+
+def stop_builders():
     run_services.stop_docker_compose_services('kaspad-builder-1', 'kaspad-builder-2')
     run_services.docker_compose_rm('kaspad-builder-1', 'kaspad-builder-2')
-    save_restore_dags.clear_dag_files(work_dir=very_big_work_dir, dag_dir=very_big_dag_dir)
-    run_services.run_docker_compose('kaspad-builder-1', 'kaspad-builder-2', kaspanet='simnet')
 
-def generate_very_big_dag(*, block_count):
-    miner_addr = KaspaAddress()
-    prepare_for_big_dag()
+def start_builders():
+    """
+    Start the builder nodes (on the current volume), and return a connection to the first one.
+    """
+    run_services.run_docker_compose('kaspad-builder-1', 'kaspad-builder-2', kaspanet='simnet')
     time.sleep(5)
-    conn = docker_compose_utils.get_cons_from_docker_compose()['kaspad-builder-1']
+    return docker_compose_utils.get_cons_from_docker_compose()['kaspad-builder-1']
+
+
+# ========== Progress & Checkpoints ========== #
+
+class BuildProgress:
+    """
+    Progress metrics of a DAG build. Times from previous runs (before a resume) are included in the totals.
+    """
+
+    def __init__(self, target_blocks, start_blocks, previous=None):
+        """
+        :param target_blocks: Number of blocks to reach
+        :param start_blocks: Number of blocks when this run started
+        :param previous: The progress dictionary (as_dict) of the previous run, when resuming
+        """
+        previous = previous or {}
+        self.target_blocks = target_blocks
+        self.start_blocks = start_blocks
+        self.blocks = start_blocks
+        self.previous_elapsed = previous.get('elapsed', 0.0)
+        self.mining_time = previous.get('mining_time', 0.0)
+        self.rpc_time = previous.get('rpc_time', 0.0)
+        self.run_start = time.perf_counter()
+
+    def update(self, blocks, mining_time, rpc_time):
+        """
+        :param blocks: The current number of blocks of the DAG
+        :param mining_time: Time spent building and mining blocks since the last update (seconds)
+        :param rpc_time: Time spent in requests to the node since the last update (seconds)
+        With a pipeline, the stages overlap: these are the times spent in each stage, not wall clock times.
+        """
+        self.blocks = blocks
+        self.mining_time += mining_time
+        self.rpc_time += rpc_time
+
+    def as_dict(self):
+        """
+        :return: A dictionary of the metrics: blocks, target_blocks, percent, blocks_per_second (this run),
+                 elapsed (all runs), run_elapsed, mining_time, rpc_time (seconds), eta_seconds (None until known)
+        """
+        run_elapsed = time.perf_counter() - self.run_start
+        blocks_per_second = (self.blocks - self.start_blocks) / run_elapsed if run_elapsed > 0 else 0.0
+        remaining_blocks = max(self.target_blocks - self.blocks, 0)
+        return {'blocks': self.blocks, 'target_blocks': self.target_blocks,
+                'percent': 100.0 * self.blocks / self.target_blocks if self.target_blocks else 100.0,
+                'blocks_per_second': blocks_per_second,
+                'elapsed': self.previous_elapsed + run_elapsed, 'run_elapsed': run_elapsed,
+                'mining_time': self.mining_time, 'rpc_time': self.rpc_time,
+                'eta_seconds': remaining_blocks / blocks_per_second if blocks_per_second > 0 else None,
+                'time': datetime.now().isoformat(timespec='seconds')}
+
+
+def _build_state_path():
+    return os.path.join(os.path.expanduser(VOLUMES_DIR_PATH), build_state_file)
+
+
+def load_build_state():
+    """
+    :return: The build state dictionary (see save_build_state), or None if there is no build in progress
+    """
+    try:
+        with open(_build_state_path(), 'r') as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        return None
+
+
+def save_build_state(state):
+    """
+    Save the build state: target_blocks, checkpoint (blocks and time of the last volume checkpoint, or None) and
+    progress (BuildProgress.as_dict). The file is replaced atomically.
+    """
+    file_name = _build_state_path()
+    with open(file_name + '.tmp', 'w') as state_file:
+        json.dump(state, state_file, indent=2)
+    os.replace(file_name + '.tmp', file_name)
+
+
+def checkpoint_volume(state, blocks, miner_address):
+    """
+    Stop the builders, copy their volume into checkpoint_dag_dir, and start them again.
+    The volume is copied into new_checkpoint_dag_dir, which is then renamed to checkpoint_dag_dir. The state file
+    is updated only after the rename, so until then the previous checkpoint stays usable.
+    :return: A new connection to the builder
+    """
+    stop_builders()
+    # a partial copy of an interrupted checkpoint
+    save_restore_dags.clear_dag_files(dag_dir=new_checkpoint_dag_dir)
+    save_restore_dags.save_volume_files(work_dir=very_big_work_dir, dag_dir=new_checkpoint_dag_dir,
+                                        miner_address=miner_address)
+    if save_restore_dags.volume_dir_exist(checkpoint_dag_dir):
+        save_restore_dags.move_volume_files(from_dir=checkpoint_dag_dir, to_dir=old_checkpoint_dag_dir)
+    save_restore_dags.move_volume_files(from_dir=new_checkpoint_dag_dir, to_dir=checkpoint_dag_dir)
+    save_restore_dags.save_miner_address(miner_address=miner_address, dir_name=checkpoint_dag_dir)
+    state['checkpoint'] = {'blocks': blocks, 'time': datetime.now().isoformat(timespec='seconds')}
+    save_build_state(state)
+    save_restore_dags.clear_dag_files(dag_dir=old_checkpoint_dag_dir)
+    KT_logger.info(f'big dag checkpoint: {blocks} blocks')
+    return start_builders()
+
+
+def recover_checkpoint():
+    """
+    Finish the renames of a checkpoint that was interrupted (see checkpoint_volume): if checkpoint_dag_dir is
+    missing, the previous checkpoint is moved back from old_checkpoint_dag_dir.
+    Partial copies in new_checkpoint_dag_dir are left for the next checkpoint to clear.
+    """
+    if not save_restore_dags.volume_dir_exist(checkpoint_dag_dir) and \
+            save_restore_dags.volume_dir_exist(old_checkpoint_dag_dir):
+        save_restore_dags.move_volume_files(from_dir=old_checkpoint_dag_dir, to_dir=checkpoint_dag_dir)
+        KT_logger.info('big dag: the previous checkpoint was restored after an interrupted checkpoint')
+
+
+def resume_from_checkpoint():
+    """
+    Restore the builders volume from checkpoint_dag_dir.
+    :return: The miner address of the checkpoint
+    """
+    stop_builders()
+    save_restore_dags.restore_volume_files(dag_dir=checkpoint_dag_dir, work_dir=very_big_work_dir)
+    return save_restore_dags.load_miner_address(dir_name=checkpoint_dag_dir)
+
+
+# ========== Generation ========== #
+
+def generate_very_big_dag(*, block_count, pipelined=False, mining_processes=None, resume=True,
+                          checkpoint_every=checkpoint_interval, on_progress=None):
+    """
+    :param block_count: Number of blocks of the DAG
+    :param pipelined: True to produce the blocks with a block_pipeline.BlockPipeline (template fetching, mining
+                      and submission overlap), instead of floors of dag_make
+    :param mining_processes: Number of mining processes of the pipeline (default: number of CPUs)
+    :param resume: True to continue from the last checkpoint of an interrupted build (if there is one)
+    :param checkpoint_every: Number of blocks between volume checkpoints
+    :param on_progress: A function that gets the progress metrics (BuildProgress.as_dict) after every batch
+    :return: The miner address
+    """
+    save_restore_dags.unlock_volumes_dir()
+    state = load_build_state() if resume else None
+    if state is not None:
+        recover_checkpoint()
+    if state is not None and state.get('checkpoint') and save_restore_dags.volume_dir_exist(checkpoint_dag_dir):
+        miner_addr = resume_from_checkpoint()
+        conn = start_builders()
+        KT_logger.info(f'big dag: resuming from checkpoint {state["checkpoint"]}')
+    else:
+        miner_addr = KaspaAddress()
+        prepare_for_big_dag()
+        conn = docker_compose_utils.get_cons_from_docker_compose()['kaspad-builder-1']
+        state = {'target_blocks': block_count, 'checkpoint': None, 'progress': None}
+    state['target_blocks'] = block_count
+
+    rpc_start = time.perf_counter()
     current_blocks_count = json_rpc_requests.get_block_dag_info_request(conn=conn)['result']['blocks']
-    t0 = datetime.now()
+    progress = BuildProgress(block_count, current_blocks_count, previous=state['progress'])
+    progress.update(current_blocks_count, 0.0, time.perf_counter() - rpc_start)
+    last_checkpoint_blocks = state['checkpoint']['blocks'] if state['checkpoint'] else current_blocks_count
+    pipeline = block_pipeline.BlockPipeline(conn, mining_processes=mining_processes) if pipelined else None
     while current_blocks_count < block_count:
-        dag_make.make_dag(floors=500, min_width=1, max_width=1, conn=conn)
+        if pipelined:
+            pipeline.run(min(batch_floors, block_count - current_blocks_count))
+            stage_time = {name: counters['total_latency'] for name, counters in pipeline.stats().items()}
+            mining_time = stage_time['build'] + stage_time['mine']
+            rpc_time = stage_time['template'] + stage_time['submit']
+        else:
+            timings = {}
+            dag_make.make_dag(floors=batch_floors, min_width=1, max_width=1, conn=conn, timings=timings)
+            mining_time = timings['build']
+            rpc_time = timings['submit']
+        rpc_start = time.perf_counter()
         current_blocks_count = json_rpc_requests.get_block_dag_info_request(conn=conn)['result']['blocks']
-        t_now = datetime.now()
-        print(f'blocks: {current_blocks_count} time: {t_now-t0}')
-    current_blocks_count = json_rpc_requests.get_block_dag_info_request(conn=conn)['result']['blocks']
-    run_services.stop_docker_compose_services('kaspad-builder-1', 'kaspad-builder-2')
-    run_services.docker_compose_rm('kaspad-builder-1', 'kaspad-builder-2')
+        progress.update(current_blocks_count, mining_time, rpc_time + time.perf_counter() - rpc_start)
+        state['progress'] = progress.as_dict()
+        save_build_state(state)
+        KT_logger.info(f'big dag progress: {state["progress"]}')
+        if on_progress is not None:
+            on_progress(state['progress'])
+        if current_blocks_count < block_count and current_blocks_count - last_checkpoint_blocks >= checkpoint_every:
+            conn = checkpoint_volume(state, current_blocks_count, miner_addr)
+            last_checkpoint_blocks = current_blocks_count
+            if pipelined:
+                pipeline = block_pipeline.BlockPipeline(conn, mining_processes=mining_processes)
+    stop_builders()
     save_restore_dags.save_volume_files(dag_dir=very_big_dag_dir, work_dir=very_big_work_dir, miner_address=miner_addr)
+    # the build is complete: the checkpoint is not needed anymore
+    save_restore_dags.clear_dag_files(dag_dir=checkpoint_dag_dir)
+    save_restore_dags.clear_dag_files(work_dir=new_checkpoint_dag_dir, dag_dir=old_checkpoint_dag_dir)
+    os.remove(_build_state_path())
     return miner_addr
 
 
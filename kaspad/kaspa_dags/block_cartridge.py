@@ -0,0 +1,606 @@
+"""
+A binary block cartridge: a file of raw blocks, indexed by block hash, read through mmap.
+Blocks are only appended (CartridgeWriter). When the writer is closed, a topological order of the blocks, their
+external parents and a hash index are written after the blocks. Opening a cartridge (BlockCartridge) reads only
+its trailer: a block is found by hash in O(1) (one probe of an open addressing hash table, on average), and only
+that block is read from the map.
+
+Crash safety: a new cartridge is written into a temporary file, that replaces the previous file on close.
+Appending truncates the cartridge at the end of its blocks, appends the new blocks, and writes the order, external
+parents, index and trailer again on close: the existing blocks are not read or copied. A cartridge whose append
+was interrupted has no trailer (BlockCartridge refuses it): CartridgeWriter(file_name, append=True) recovers its
+complete blocks by scanning them.
+
+File layout (all numbers little endian):
+    header           HEADER_FORMAT: magic, version, reserved
+    blocks           for each block: length (u32) + the raw block
+    end of blocks    a zero length (u32), so that a scan of the blocks knows where they end
+    topological      block count x u64: the offsets of the blocks, parents before children
+    external         external parent count x 32 bytes: the parents of blocks that are not in the cartridge
+    index            slot count x (block hash (32 bytes) + offset (u64)): a hash table, empty slots have offset 0.
+                     The slot of a hash is its last 8 bytes (as a number) modulo the slot count (a power of 2),
+                     or the next free slot (linear probing). The last bytes are used because the first bytes of
+                     a block hash are zeros (proof of work)
+    trailer          TRAILER_FORMAT: blocks end, block count, external parent count, index offset, slot count,
+                     magic
+
+Block hashes are stored as displayed (like the 'hash' of a verbose block), as bytes.
+"""
+import mmap
+import os
+import struct
+from kaspy_tools.logs import config_logger
+from kaspy_tools.kaspa_model.block import Block
+
+KT_logger = config_logger.get_kaspy_tools_logger()
+
+CARTRIDGE_MAGIC = b'KTCART\x00\x00'
+CARTRIDGE_VERSION = 2
+HEADER_FORMAT = struct.Struct('<8sII')          # magic, version, reserved
+TRAILER_FORMAT = struct.Struct('<QQQQQ8s')      # blocks end, block count, external count, index offset, slot count,
+                                                # magic
+SLOT_FORMAT = struct.Struct('<32sQ')            # block hash, offset
+LENGTH_FORMAT = struct.Struct('<I')
+OFFSET_FORMAT = struct.Struct('<Q')
+HASH_SIZE = 32
+EMPTY_OFFSET = 0                                # no block starts at 0 (the header is there)
+END_OF_BLOCKS = LENGTH_FORMAT.pack(0)
+
+
+def _as_hash_bytes(block_hash):
+    """
+    :param block_hash: A block hash, as hex or bytes (as displayed)
+    :return: The hash as bytes
+    """
+    return bytes.fromhex(block_hash) if isinstance(block_hash, str) else bytes(block_hash)
+
+
+def _slot_count(block_count):
+    """
+    :return: The number of slots of the index: a power of 2, at least twice the number of blocks
+    """
+    slot_count = 1
+    while slot_count < 2 * block_count:
+        slot_count *= 2
+    return slot_count
+
+
+def _first_slot(hash_bytes, slot_count):
+    return int.from_bytes(hash_bytes[-8:], 'little') & (slot_count - 1)
+
+
+def block_hash_and_parents(block_bytes):
+    """
+    Parse only what the cartridge needs from a raw block: the header.
+    :return: (block hash bytes, list of parent hashes bytes), as displayed
+    """
+    block_hash, parent_hashes = Block.header_hash_and_parents(block_bytes)
+    return block_hash, [parent_hash[::-1] for parent_hash in parent_hashes]
+
+
+def topological_order(block_hashes, parents):
+    """
+    Order blocks so that the parents come before their children (parents that are not in block_hashes are
+    ignored). Blocks that are already in order keep their order.
+    :param block_hashes: A list of block hashes, in append order
+    :param parents: A list of the parent hashes lists, of each block
+    :return: A list of indexes into block_hashes
+    """
+    index_of = {block_hash: index for index, block_hash in enumerate(block_hashes)}
+    children = [[] for _ in block_hashes]
+    missing_parents = [0] * len(block_hashes)
+    for index, block_parents in enumerate(parents):
+        for parent_hash in block_parents:
+            parent_index = index_of.get(parent_hash)
+            if parent_index is not None:
+                children[parent_index].append(index)
+                missing_parents[index] += 1
+    # a stack of the ready blocks, in reverse append order, so that ready blocks are taken in append order
+    ready = [index for index in reversed(range(len(block_hashes))) if missing_parents[index] == 0]
+    order = []
+    while ready:
+        index = ready.pop()
+        order.append(index)
+        for child_index in reversed(children[index]):
+            missing_parents[child_index] -= 1
+            if missing_parents[child_index] == 0:
+                ready.append(child_index)
+    if len(order) != len(block_hashes):
+        raise ValueError('The blocks have a parents cycle')
+    return order
+
+
+class BlockGraph:
+    """
+    The parent/child graph of a set of blocks.
+    """
+
+    def __init__(self, blocks=()):
+        """
+        :param blocks: An iterable of raw blocks (bytes or hex). They are kept (as bytes), see from_cartridge to
+                       read them from a cartridge instead
+        """
+        self.hashes = []
+        self.children = []
+        self.parents = []               # indexes of the parents (in the set) of each block
+        self.missing_parents = []       # number of parents (in the set) that were not accepted yet
+        self._blocks = []               # the raw blocks, or their offsets in self._cartridge
+        self._cartridge = None
+        self._in_topological_order = False
+        parents = []
+        index_of = {}
+        for block in blocks:
+            block_bytes = bytes.fromhex(block) if isinstance(block, str) else bytes(block)
+            block_hash, block_parents = block_hash_and_parents(block_bytes)
+            if block_hash in index_of:
+                continue
+            index_of[block_hash] = len(self.hashes)
+            self._blocks.append(block_bytes)
+            self.hashes.append(block_hash)
+            parents.append(block_parents)
+        self._link(parents, index_of)
+
+    @classmethod
+    def from_cartridge(cls, cartridge):
+        """
+        The graph of the blocks of a cartridge, in its stored topological order. Only the block hashes and the
+        parent indexes are kept: a block is read from the cartridge map when it is needed (block_bytes), so the
+        cartridge must stay open while the graph is used.
+        :param cartridge: An open BlockCartridge
+        :return: A BlockGraph
+        """
+        graph = cls()
+        graph._cartridge = cartridge
+        graph._in_topological_order = True
+        parents = []
+        index_of = {}
+        for offset in cartridge.offsets():
+            block_hash, block_parents = cartridge.hash_and_parents_at(offset)
+            index_of[block_hash] = len(graph.hashes)
+            graph._blocks.append(offset)
+            graph.hashes.append(block_hash)
+            parents.append(block_parents)
+        graph._link(parents, index_of)
+        return graph
+
+    def _link(self, parents, index_of):
+        """
+        Set the parent and child indexes of the blocks.
+        :param parents: The parent hashes of each block
+        :param index_of: A dictionary: block hash -> index
+        """
+        self.children = [[] for _ in self.hashes]
+        self.parents = [[] for _ in self.hashes]
+        for index, block_parents in enumerate(parents):
+            for parent_hash in block_parents:
+                parent_index = index_of.get(parent_hash)
+                if parent_index is not None:
+                    self.children[parent_index].append(index)
+                    self.parents[index].append(parent_index)
+        self.missing_parents = [len(block_parents) for block_parents in self.parents]
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def block_bytes(self, index):
+        """
+        :return: The raw block (bytes) at index
+        """
+        if self._cartridge is not None:
+            return self._cartridge.block_at(self._blocks[index])
+        return self._blocks[index]
+
+    def block_hex(self, index):
+        """
+        :return: The raw block at index, as hex (e.g: for submitBlock)
+        """
+        return self.block_bytes(index).hex()
+
+    def topological_order(self):
+        """
+        :return: The indexes of the blocks, parents before children (see topological_order)
+        """
+        if self._in_topological_order:
+            return range(len(self.hashes))
+        return topological_order(self.hashes, [[self.hashes[parent_index] for parent_index in block_parents]
+                                               for block_parents in self.parents])
+
+    def roots(self):
+        """
+        :return: The indexes of the blocks that have no parents in the set
+        """
+        return [index for index, missing in enumerate(self.missing_parents) if missing == 0]
+
+    def accept(self, index):
+        """
+        Mark a block as accepted.
+        :return: The indexes of its children that became ready (all their parents were accepted)
+        """
+        ready = []
+        for child_index in self.children[index]:
+            self.missing_parents[child_index] -= 1
+            if self.missing_parents[child_index] == 0:
+                ready.append(child_index)
+        return ready
+
+    def descendants(self, index):
+        """
+        :return: The indexes of all the descendants of a block
+        """
+        found = set()
+        stack = list(self.children[index])
+        while stack:
+            child_index = stack.pop()
+            if child_index not in found:
+                found.add(child_index)
+                stack.extend(self.children[child_index])
+        return found
+
+
+# ========== Writer ========== #
+
+class CartridgeWriter:
+    """
+    Appends blocks to a cartridge. Use as a context manager, or call close() (which writes the order and index).
+    abort() (or an exception in the with block) drops the blocks added by this writer, and keeps the previous
+    cartridge.
+    """
+
+    def __init__(self, file_name, append=False):
+        """
+        :param file_name: The cartridge file
+        :param append: True to add blocks to an existing cartridge (a new cartridge is created if there is none).
+                       A cartridge that was not closed (an interrupted append) is recovered: its complete blocks
+                       are kept.
+        """
+        self._file_name = file_name
+        self._index_entries = []        # (block hash, offset) of all the blocks
+        self._known_hashes = set()
+        self._stored_order = []         # offsets of the blocks that were in the cartridge, in their stored order
+        self._external_parents = set()  # parents (not in the cartridge) of the blocks that were in the cartridge
+        self._new_hashes = []
+        self._new_parents = []
+        self._new_offsets = []
+        if append and os.path.exists(file_name):
+            self._temp_file_name = None
+            self._file = open(file_name, 'r+b')
+            try:
+                try:
+                    blocks_end = self._load_cartridge()
+                except ValueError:
+                    blocks_end = self._recover_blocks()
+            except Exception:
+                self._file.close()
+                raise
+            self._file.truncate(blocks_end)
+            self._file.seek(blocks_end)
+        else:
+            # a new cartridge replaces the previous file only when it is complete
+            self._temp_file_name = file_name + '.tmp'
+            self._file = open(self._temp_file_name, 'wb')
+            self._file.write(HEADER_FORMAT.pack(CARTRIDGE_MAGIC, CARTRIDGE_VERSION, 0))
+        # what abort() goes back to
+        self._append_start = self._file.tell()
+        self._append_count = len(self._index_entries)
+        self._append_new_count = len(self._new_hashes)
+
+    def _load_cartridge(self):
+        """
+        Read the index, order and external parents of the cartridge (not its blocks).
+        :return: The end of the blocks
+        """
+        with BlockCartridge(self._file_name) as cartridge:
+            self._index_entries = list(cartridge.index_entries())
+            self._stored_order = list(cartridge.offsets())
+            self._external_parents = set(cartridge.external_parents())
+            blocks_end = cartridge.blocks_end
+        self._known_hashes = {block_hash for block_hash, _ in self._index_entries}
+        return blocks_end
+
+    def _recover_blocks(self):
+        """
+        Scan the blocks of a cartridge that was not closed. The complete blocks are kept, as if they were added
+        by this writer.
+        :return: The end of the last complete block
+        """
+        self._file.seek(0)
+        magic, version, _ = HEADER_FORMAT.unpack(self._file.read(HEADER_FORMAT.size).ljust(HEADER_FORMAT.size,
+                                                                                            b'\x00'))
+        if magic != CARTRIDGE_MAGIC or version != CARTRIDGE_VERSION:
+            raise ValueError(f'{self._file_name} is not a block cartridge (version {CARTRIDGE_VERSION})')
+        offset = HEADER_FORMAT.size
+        while True:
+            length_bytes = self._file.read(LENGTH_FORMAT.size)
+            if len(length_bytes) < LENGTH_FORMAT.size or length_bytes == END_OF_BLOCKS:
+                break
+            block_bytes = self._file.read(LENGTH_FORMAT.unpack(length_bytes)[0])
+            if len(block_bytes) < LENGTH_FORMAT.unpack(length_bytes)[0]:      # a partially written block
+                break
+            block_hash, block_parents = block_hash_and_parents(block_bytes)
+            if block_hash not in self._known_hashes:
+                self._add_new_entry(block_hash, block_parents, offset)
+            offset += LENGTH_FORMAT.size + len(block_bytes)
+        KT_logger.warning(f'block cartridge: {self._file_name} was not closed, recovered {len(self)} blocks')
+        return offset
+
+    def _add_new_entry(self, block_hash, block_parents, offset):
+        self._index_entries.append((block_hash, offset))
+        self._known_hashes.add(block_hash)
+        self._new_hashes.append(block_hash)
+        self._new_parents.append(block_parents)
+        self._new_offsets.append(offset)
+
+    def __len__(self):
+        return len(self._index_entries)
+
+    def add_block(self, block):
+        """
+        Append a block (blocks that are already in the cartridge are skipped).
+        :param block: A raw block, as bytes or hex
+        :return: The block hash (bytes), or None if the block was already in the cartridge
+        """
+        block_bytes = bytes.fromhex(block) if isinstance(block, str) else bytes(block)
+        block_hash, block_parents = block_hash_and_parents(block_bytes)
+        if block_hash in self._known_hashes:
+            return None
+        offset = self._file.tell()
+        self._file.write(LENGTH_FORMAT.pack(len(block_bytes)))
+        self._file.write(block_bytes)
+        self._add_new_entry(block_hash, block_parents, offset)
+        return block_hash
+
+    def add_blocks(self, blocks):
+        """
+        :param blocks: An iterable of raw blocks (bytes or hex)
+        :return: Number of blocks added
+        """
+        return sum(self.add_block(block) is not None for block in blocks)
+
+    def _parents_at(self, offset):
+        """
+        :return: The parent hashes (bytes, as displayed) of the block at offset, read from its header
+        """
+        self._file.seek(offset + LENGTH_FORMAT.size + 4)
+        parent_count = self._file.read(1)[0]
+        parents_bytes = self._file.read(HASH_SIZE * parent_count)
+        return [parents_bytes[start:start + HASH_SIZE][::-1] for start in range(0, len(parents_bytes), HASH_SIZE)]
+
+    def _block_order(self):
+        """
+        :return: The offsets of all the blocks, parents before children
+        """
+        new_order = [self._new_offsets[index] for index in topological_order(self._new_hashes, self._new_parents)]
+        if self._external_parents.isdisjoint(self._new_hashes):
+            # no new block is a parent of a stored block: the stored order stays valid
+            return self._stored_order + new_order
+        # a new block is a parent of a stored block: order all the blocks again (their parents are read)
+        hash_of = {offset: block_hash for block_hash, offset in self._index_entries}
+        stored_parents = [self._parents_at(offset) for offset in self._stored_order]
+        order = topological_order([hash_of[offset] for offset in self._stored_order] + self._new_hashes,
+                                  stored_parents + self._new_parents)
+        all_offsets = self._stored_order + self._new_offsets
+        return [all_offsets[index] for index in order]
+
+    def _write_tail(self):
+        """
+        Write the end of blocks marker, the order, the external parents, the index and the trailer after the
+        blocks, and make the file durable.
+        """
+        block_order = self._block_order()       # (may read the blocks: the file position is set after it)
+        self._file.seek(0, os.SEEK_END)
+        blocks_end = self._file.tell()
+        self._file.write(END_OF_BLOCKS)
+        self._file.write(b''.join(OFFSET_FORMAT.pack(offset) for offset in block_order))
+
+        external_parents = (self._external_parents | {parent_hash for block_parents in self._new_parents
+                                                      for parent_hash in block_parents}) - self._known_hashes
+        self._file.write(b''.join(sorted(external_parents)))
+
+        slot_count = _slot_count(len(self._index_entries))
+        slots = [None] * slot_count
+        for block_hash, offset in self._index_entries:
+            slot = _first_slot(block_hash, slot_count)
+            while slots[slot] is not None:
+                slot = (slot + 1) & (slot_count - 1)
+            slots[slot] = (block_hash, offset)
+        index_offset = self._file.tell()
+        empty_slot = SLOT_FORMAT.pack(bytes(HASH_SIZE), EMPTY_OFFSET)
+        self._file.write(b''.join(empty_slot if slot is None else SLOT_FORMAT.pack(*slot) for slot in slots))
+        self._file.write(TRAILER_FORMAT.pack(blocks_end, len(self._index_entries), len(external_parents),
+                                             index_offset, slot_count, CARTRIDGE_MAGIC))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+
+    def close(self):
+        """
+        Write the topological order, the external parents, the index and the trailer (a new cartridge then
+        replaces the previous file).
+        """
+        if self._file is None:
+            return
+        self._write_tail()
+        if self._temp_file_name is not None:
+            os.replace(self._temp_file_name, self._file_name)
+        KT_logger.debug(f'block cartridge: {len(self)} blocks -> {self._file_name}')
+
+    def abort(self):
+        """
+        Drop the blocks added by this writer: the cartridge stays as it was before.
+        """
+        if self._file is None:
+            return
+        if self._temp_file_name is not None:
+            self._file.close()
+            self._file = None
+            os.remove(self._temp_file_name)
+            return
+        self._file.truncate(self._append_start)
+        del self._index_entries[self._append_count:]
+        del self._new_hashes[self._append_new_count:]
+        del self._new_parents[self._append_new_count:]
+        del self._new_offsets[self._append_new_count:]
+        self._known_hashes = {block_hash for block_hash, _ in self._index_entries}
+        self._write_tail()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def save_blocks_cartridge(blocks, file_name, append=False):
+    """
+    Write blocks into a cartridge.
+    :param blocks: An iterable of raw blocks (bytes or hex), e.g: json_rpc_requests.iter_raw_blocks(conn=conn)
+    :param file_name: The cartridge file
+    :param append: True to add the blocks to an existing cartridge
+    :return: Number of blocks in the cartridge
+    """
+    with CartridgeWriter(file_name, append=append) as writer:
+        writer.add_blocks(blocks)
+        return len(writer)
+
+
+# ========== Reader ========== #
+
+class BlockCartridge:
+    """
+    Read a cartridge written by CartridgeWriter. Use as a context manager, or call close().
+    """
+
+    def __init__(self, file_name):
+        self._file = open(file_name, 'rb')
+        self._map = None
+        if os.fstat(self._file.fileno()).st_size < HEADER_FORMAT.size + TRAILER_FORMAT.size:
+            self.close()
+            raise ValueError(f'{file_name} is not a block cartridge (or was not closed)')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _ = HEADER_FORMAT.unpack_from(self._map, 0)
+        self.blocks_end, self._count, self._external_count, self._index_offset, self._slot_count, trailer_magic = \
+            TRAILER_FORMAT.unpack_from(self._map, len(self._map) - TRAILER_FORMAT.size)
+        if magic != CARTRIDGE_MAGIC or version != CARTRIDGE_VERSION or trailer_magic != CARTRIDGE_MAGIC:
+            self.close()
+            raise ValueError(f'{file_name} is not a block cartridge (version {CARTRIDGE_VERSION}), or was not closed')
+        self._topological_offset = self.blocks_end + len(END_OF_BLOCKS)
+        self._external_offset = self._topological_offset + self._count * OFFSET_FORMAT.size
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # ========== Lookup Methods ========== #
+
+    def __len__(self):
+        return self._count
+
+    def offset_of(self, block_hash):
+        """
+        :param block_hash: A block hash, as hex or bytes (as displayed)
+        :return: The offset of the block in the cartridge, or None if it is not there
+        """
+        hash_bytes = _as_hash_bytes(block_hash)
+        slot = _first_slot(hash_bytes, self._slot_count)
+        while True:
+            slot_offset = self._index_offset + slot * SLOT_FORMAT.size
+            offset = OFFSET_FORMAT.unpack_from(self._map, slot_offset + HASH_SIZE)[0]
+            if offset == EMPTY_OFFSET:
+                return None
+            if self._map[slot_offset:slot_offset + HASH_SIZE] == hash_bytes:
+                return offset
+            slot = (slot + 1) & (self._slot_count - 1)
+
+    def __contains__(self, block_hash):
+        return self.offset_of(block_hash) is not None
+
+    def hash_and_parents_at(self, offset):
+        """
+        Read only the header of the block at offset (see block_hash_and_parents).
+        :return: (block hash bytes, list of parent hashes bytes), as displayed
+        """
+        with memoryview(self._map) as map_view:
+            block_view = map_view[offset + LENGTH_FORMAT.size:]
+            try:
+                return block_hash_and_parents(block_view)
+            finally:
+                block_view.release()
+
+    def block_at(self, offset):
+        """
+        :return: The raw block (bytes) at offset
+        """
+        block_length = LENGTH_FORMAT.unpack_from(self._map, offset)[0]
+        return self._map[offset + LENGTH_FORMAT.size:offset + LENGTH_FORMAT.size + block_length]
+
+    def get(self, block_hash, default=None):
+        """
+        :param block_hash: A block hash, as hex or bytes (as displayed)
+        :return: The raw block (bytes), or default if it is not in the cartridge
+        """
+        offset = self.offset_of(block_hash)
+        return default if offset is None else self.block_at(offset)
+
+    def __getitem__(self, block_hash):
+        offset = self.offset_of(block_hash)
+        if offset is None:
+            raise KeyError(block_hash)
+        return self.block_at(offset)
+
+    def offsets(self):
+        """
+        :return: An iterator of the block offsets, in topological order
+        """
+        for position in range(self._count):
+            yield OFFSET_FORMAT.unpack_from(self._map, self._topological_offset + position * OFFSET_FORMAT.size)[0]
+
+    def external_parents(self):
+        """
+        :return: A list of the parent hashes (bytes, as displayed) of blocks, that are not in the cartridge
+                 (e.g: the genesis)
+        """
+        return [self._map[start:start + HASH_SIZE]
+                for start in range(self._external_offset, self._external_offset + self._external_count * HASH_SIZE,
+                                   HASH_SIZE)]
+
+    def __iter__(self):
+        """
+        :return: An iterator of the raw blocks (bytes), in topological order (parents before children)
+        """
+        for offset in self.offsets():
+            yield self.block_at(offset)
+
+    def iter_hex_blocks(self):
+        """
+        :return: An iterator of the raw blocks as hex (e.g: for submitBlock), in topological order
+        """
+        for offset in self.offsets():
+            yield self.block_at(offset).hex()
+
+    def index_entries(self):
+        """
+        :return: An iterator of (block hash (bytes), offset) of the blocks, in index order
+        """
+        for slot in range(self._slot_count):
+            block_hash, offset = SLOT_FORMAT.unpack_from(self._map, self._index_offset + slot * SLOT_FORMAT.size)
+            if offset != EMPTY_OFFSET:
+                yield block_hash, offset
+
+    def hashes(self):
+        """
+        :return: An iterator of the hashes (bytes) of the blocks, in index order
+        """
+        for block_hash, _ in self.index_entries():
+            yield block_hash
@@ -0,0 +1,224 @@
+"""
+A block replay engine: submits saved blocks to one or more nodes, at a controlled rate, and measures the nodes.
+
+    report = replay_blocks('dag.cart', [conn], rate=200, window=16)
+    print(report['nodes'][0]['latency']['p99'], report['nodes'][0]['throughput'])
+
+- blocks:   a block cartridge (see block_cartridge), a block stream file (see dag_synthesizer), a text file of hex
+            blocks (one per line), or any iterable of raw blocks (bytes or hex). They are submitted in topological
+            order (in the order they are read, when it already is one). A cartridge is submitted in its stored
+            topological order, and each block is read from its map only when it is submitted: only the block
+            hashes and parent indexes are kept in memory (see BlockGraph.from_cartridge).
+- rate:     blocks per second (every block is sent to every node), or None for as fast as possible.
+- window:   max number of submitBlock requests in flight per node. A block is sent to a node only after the
+            submissions of its parents (that are in the replayed set) to that node completed, so the node never
+            gets a block before its parents. Each node is fed by its own task: a slow node does not hold back the
+            others.
+- report:   for each node, the number of submitted and rejected blocks, the throughput (blocks per second,
+            over the whole replay) and the submitBlock latency percentiles.
+"""
+import asyncio
+import contextlib
+import time
+from kaspy_tools.logs import config_logger
+from kaspy_tools.kaspad.json_rpc.async_json_rpc_requests import AsyncJsonRpcClient
+from kaspy_tools.kaspad.kaspa_dags import block_cartridge
+from kaspy_tools.kaspad.kaspa_dags.block_cartridge import BlockGraph
+from kaspy_tools.kaspad.kaspa_dags.dag_tools import dag_synthesizer
+
+KT_logger = config_logger.get_kaspy_tools_logger()
+
+DEFAULT_WINDOW = 8
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+# ========== Block sources ========== #
+
+def is_cartridge(file_name):
+    """
+    :return: True if file_name is a block cartridge (by its magic)
+    """
+    with open(file_name, 'rb') as saved_file:
+        return saved_file.read(len(block_cartridge.CARTRIDGE_MAGIC)) == block_cartridge.CARTRIDGE_MAGIC
+
+
+def iter_saved_blocks(file_name):
+    """
+    Read the blocks of a saved file, whatever its format (cartridge, block stream, or hex lines).
+    :param file_name: The file
+    :return: A generator of raw blocks (hex)
+    """
+    with open(file_name, 'rb') as saved_file:
+        magic = saved_file.read(len(block_cartridge.CARTRIDGE_MAGIC))
+    if magic == block_cartridge.CARTRIDGE_MAGIC:
+        with block_cartridge.BlockCartridge(file_name) as cartridge:
+            yield from cartridge.iter_hex_blocks()
+    elif magic == dag_synthesizer.BLOCK_STREAM_MAGIC:
+        for block_bytes in dag_synthesizer.iter_block_stream(file_name):
+            yield block_bytes.hex()
+    else:
+        with open(file_name, 'r') as saved_file:
+            for line in saved_file:
+                if line.strip():
+                    yield line.strip()
+
+
+def iter_hex_blocks(blocks):
+    """
+    :param blocks: A saved blocks file name (see iter_saved_blocks), or an iterable of raw blocks (bytes or hex)
+    :return: A generator of raw blocks (hex)
+    """
+    if isinstance(blocks, str):
+        yield from iter_saved_blocks(blocks)
+        return
+    for block in blocks:
+        yield block if isinstance(block, str) else bytes(block).hex()
+
+
+@contextlib.contextmanager
+def open_block_graph(blocks):
+    """
+    :param blocks: Saved blocks (see the module doc), or a BlockGraph
+    :return: A context manager of the BlockGraph of the blocks. A cartridge stays open until the context exits,
+             its blocks are read from the map when they are needed
+    """
+    if isinstance(blocks, BlockGraph):
+        yield blocks
+    elif isinstance(blocks, str) and is_cartridge(blocks):
+        with block_cartridge.BlockCartridge(blocks) as cartridge:
+            yield BlockGraph.from_cartridge(cartridge)
+    else:
+        yield BlockGraph(iter_hex_blocks(blocks))
+
+
+# ========== Measurements ========== #
+
+def latency_percentiles(latencies, percentiles=LATENCY_PERCENTILES):
+    """
+    :param latencies: A list of latencies (seconds)
+    :param percentiles: The percentiles to compute
+    :return: A dictionary: 'p<percentile>' -> latency (nearest rank), plus 'mean' and 'max'
+    """
+    if not latencies:
+        return {}
+    ordered = sorted(latencies)
+    result = {f'p{percentile}': ordered[max(0, -(-percentile * len(ordered) // 100) - 1)]
+              for percentile in percentiles}
+    result['mean'] = sum(ordered) / len(ordered)
+    result['max'] = ordered[-1]
+    return result
+
+
+class ReplayStats:
+    """
+    The submissions to one node.
+    """
+
+    def __init__(self, node_name):
+        self.node_name = node_name
+        self.latencies = []
+        self.rejected = 0
+        self.errors = {}        # error message -> count
+
+    def record(self, latency, error=None):
+        self.latencies.append(latency)
+        if error is not None:
+            self.rejected += 1
+            self.errors[error] = self.errors.get(error, 0) + 1
+
+    def report(self, elapsed):
+        """
+        :param elapsed: Time the node took to process all the blocks (seconds)
+        :return: A dictionary of the measurements
+        """
+        return {'node': self.node_name, 'submitted': len(self.latencies), 'rejected': self.rejected,
+                'elapsed': elapsed,
+                'throughput': len(self.latencies) / elapsed if elapsed > 0 else 0.0,
+                'latency': latency_percentiles(self.latencies), 'errors': dict(self.errors)}
+
+
+# ========== Replay ========== #
+
+async def _submit(client, block_hex, stats, window, completed):
+    submit_start = time.perf_counter()
+    try:
+        response, response_json = await client.submit_block_request(block_hex)
+        error = response_json.get('error') or response_json['result']
+        stats.record(time.perf_counter() - submit_start, None if error is None else str(error))
+    except Exception as exception:
+        stats.record(time.perf_counter() - submit_start, f'{type(exception).__name__}: {exception}')
+    finally:
+        window.release()
+        completed.set()
+
+
+async def _feed_node(graph, order, client, stats, window, rate, schedule_start):
+    """
+    Submit all the blocks to one node, in order, with at most window requests in flight.
+    :return: The time (time.perf_counter) when the node completed
+    """
+    loop = asyncio.get_running_loop()
+    node_window = asyncio.Semaphore(window)
+    completed = [asyncio.Event() for _ in range(len(graph))]
+    pending = set()
+    for position, index in enumerate(order):
+        if rate:
+            delay = schedule_start + position / rate - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        for parent_index in graph.parents[index]:
+            await completed[parent_index].wait()
+        await node_window.acquire()
+        task = asyncio.create_task(_submit(client, graph.block_hex(index), stats, node_window, completed[index]))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    await asyncio.gather(*pending)
+    return time.perf_counter()
+
+
+async def replay_blocks_async(blocks, clients, *, rate=None, window=DEFAULT_WINDOW, node_names=None):
+    """
+    Async version of replay_blocks, with AsyncJsonRpcClient objects (one per node).
+    :param blocks: Saved blocks (see the module doc), or a BlockGraph
+    :param clients: A list of AsyncJsonRpcClient
+    :param rate: Blocks per second, or None for as fast as possible
+    :param window: Max number of requests in flight, per node
+    :param node_names: Names of the nodes in the report (default: their index)
+    :return: The replay report (see replay_blocks)
+    """
+    node_names = node_names or [str(index) for index in range(len(clients))]
+    node_stats = [ReplayStats(node_name) for node_name in node_names]
+    with open_block_graph(blocks) as graph:
+        order = graph.topological_order()
+        start_time = time.perf_counter()
+        schedule_start = asyncio.get_running_loop().time()
+        end_times = await asyncio.gather(*(_feed_node(graph, order, client, stats, window, rate, schedule_start)
+                                           for client, stats in zip(clients, node_stats)))
+    elapsed = time.perf_counter() - start_time
+    report = {'blocks': len(graph), 'elapsed': elapsed, 'rate': rate, 'window': window,
+              'nodes': [stats.report(end_time - start_time) for stats, end_time in zip(node_stats, end_times)]}
+    for node_report in report['nodes']:
+        KT_logger.info(f'replay to node {node_report["node"]}: {node_report["submitted"]} blocks '
+                       f'({node_report["rejected"]} rejected) in {node_report["elapsed"]:.3f} s, '
+                       f'{node_report["throughput"]:.1f} blocks/s, latency {node_report["latency"]}')
+    return report
+
+
+def replay_blocks(blocks, conns, *, rate=None, window=DEFAULT_WINDOW):
+    """
+    Submit saved blocks to one or more nodes (every block to every node), and measure the submissions.
+    :param blocks: A saved blocks file name, or an iterable of raw blocks (bytes or hex), in submit order
+    :param conns: A list of node connections (KaspaNode)
+    :param rate: Blocks per second, or None for as fast as possible
+    :param window: Max number of submitBlock requests in flight, per node
+    :return: A report dictionary: blocks, elapsed (seconds), rate, window, and nodes: a list of the node reports
+             (node, submitted, rejected, elapsed, throughput, latency percentiles, errors)
+    """
+    clients = [AsyncJsonRpcClient(conn, concurrency=window) for conn in conns]
+    try:
+        return asyncio.run(replay_blocks_async(blocks, clients, rate=rate, window=window,
+                                               node_names=[conn.conn_name or str(index)
+                                                           for index, conn in enumerate(conns)]))
+    finally:
+        for client in clients:
+            client.close()
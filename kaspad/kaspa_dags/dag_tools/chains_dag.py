@@ -4,18 +4,20 @@ from kaspy_tools.local_run.run_local_services import run_services
 from kaspy_tools.kaspad.utilities import block_generator
 from kaspy_tools.kaspad.json_rpc import json_rpc_requests
 from kaspy_tools.kaspad.kaspa_dags.dag_tools import save_restore_dags
+from kaspy_tools.kaspad.kaspa_dags import block_cartridge
 from kaspy_tools.logs import config_logger
 
 KT_logger = config_logger.get_kaspy_tools_logger()
 
-def make_and_submit_single_chain(*, floors=None, pay_address, conn):
+def make_and_submit_single_chain(*, floors=None, pay_address, conn, mining_processes=1):
     if not floors:
         floors=[]
     for f in floors:
         floor_blocks = []
         for b in range(f):
             new_block, block_hash = block_generator.generate_valid_block_from_template(conn=conn, native_txs=[],
-                                                                                       pay_address=pay_address)
+                                                                                       pay_address=pay_address,
+                                                                                       mining_processes=mining_processes)
             floor_blocks.append(new_block)
         for block in floor_blocks:
             response, response_json = json_rpc_requests.submit_block_request(block.hex(), options=None, conn=conn)
@@ -24,9 +26,23 @@ def get_current_blocks(conn):
     raw_blocks, verbose_blocks = json_rpc_requests.get_blocks(requested_blocks_count=200, conn=conn)
     return raw_blocks
 
-def submit_saved_blocks(saved_blocks, conn):
-    for block in saved_blocks:
-        response, response_json = json_rpc_requests.submit_block_request(block, options=None, conn=conn)
+def save_current_blocks(file_name, conn, append=False):
+    """
+    Like get_current_blocks, but all the node blocks are streamed into a block cartridge file (see block_cartridge),
+    instead of being kept in memory.
+    :return: Number of blocks in the cartridge
+    """
+    return block_cartridge.save_blocks_cartridge(json_rpc_requests.iter_raw_blocks(conn=conn), file_name,
+                                                 append=append)
+
+def submit_saved_blocks(saved_blocks, conn, batch_size=json_rpc_requests.DEFAULT_BATCH_SIZE):
+    responses = json_rpc_requests.submit_blocks_batch(saved_blocks, conn=conn, batch_size=batch_size)
+    for response_json in responses:
+        # kaspad reports a rejected block in 'result', and a failed request in 'error'
+        error = response_json.get('error') or response_json.get('result')
+        if error is not None:
+            KT_logger.warning('Submit saved block: %s', str(error))
+    return responses
 
 def clean_blocks(*, dir_name='kaspad'):
     run_services.stop_and_remove_all_runners()
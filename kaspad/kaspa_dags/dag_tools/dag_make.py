@@ -1,25 +1,42 @@
+import asyncio
 import random
+import time
 from kaspy_tools.kaspad import kaspad_constants
 from kaspy_tools.logs import config_logger
 from kaspy_tools.kaspad.utilities import block_generator
 from kaspy_tools.kaspad.json_rpc import json_rpc_requests
+from kaspy_tools.kaspad.json_rpc.async_json_rpc_requests import AsyncJsonRpcClient
 
 KT_logger = config_logger.get_kaspy_tools_logger()
 
 
-def make_dag(floors=10, min_width=3, max_width=6, conn=None):
+def make_dag(floors=10, min_width=3, max_width=6, conn=None, mining_processes=1, submit_concurrency=1,
+             timings=None):
+    """
+    :param timings: A dictionary, to add the time (seconds) spent building the floors (template request and mining)
+                    to timings['build'], and the time spent submitting them to timings['submit']
+    """
     for f in range(floors):
-        floor_list = make_floor(min_width=min_width, max_width=max_width, conn=conn)
-        submit_floor(floor_list=floor_list, conn=conn)
+        build_start = time.perf_counter()
+        floor_list = make_floor(min_width=min_width, max_width=max_width, conn=conn,
+                                mining_processes=mining_processes)
+        submit_start = time.perf_counter()
+        if submit_concurrency > 1:
+            submit_floor_concurrently(floor_list=floor_list, conn=conn, concurrency=submit_concurrency)
+        else:
+            submit_floor(floor_list=floor_list, conn=conn)
+        if timings is not None:
+            timings['build'] = timings.get('build', 0.0) + submit_start - build_start
+            timings['submit'] = timings.get('submit', 0.0) + time.perf_counter() - submit_start
         KT_logger.debug('Floor # %d created.', f)
 
-def make_floor(*, min_width, max_width, conn):
+def make_floor(*, min_width, max_width, conn, mining_processes=1):
     floor_list=[]
     num_elements = random.randint(min_width,max_width)
     KT_logger.debug('Number of blocks in floor: %d.', num_elements)
-    for b in range(num_elements):
-        new_block, block_hash = block_generator.generate_valid_block_from_template(conn=conn, native_txs=[],
-                                                                                   netprefix='kaspasim')
+    # all the blocks of a floor have the same parents: they are built from a single template
+    for new_block, block_hash in block_generator.generate_sibling_blocks_from_template(
+            num_elements, conn=conn, native_txs=[], netprefix='kaspasim', mining_processes=mining_processes):
         KT_logger.debug('Created block hash: %s', block_hash.hex()[kaspad_constants.PARTIAL_HASH_SIZE:])
         floor_list.append(new_block)
     return floor_list
@@ -33,6 +50,24 @@ def submit_floor(*, floor_list=None, conn=None):
             raise ValueError
 
 
+def submit_floor_concurrently(*, floor_list=None, conn=None, concurrency=8):
+    """
+    Like submit_floor, but the blocks are submitted concurrently: the blocks of a floor are built from the
+    same template, so none of them is a parent of another.
+    """
+    async def submit_all(client):
+        return await asyncio.gather(*(client.submit_block_request(block.hex()) for block in floor_list or []))
+
+    client = AsyncJsonRpcClient(conn, concurrency=concurrency)
+    try:
+        responses = asyncio.run(submit_all(client))
+    finally:
+        client.close()
+    for response, response_json in responses:
+        if response_json['result'] is not None:
+            raise ValueError
+
+
 
 
 def try_make_dag():
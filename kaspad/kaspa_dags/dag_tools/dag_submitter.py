@@ -0,0 +1,126 @@
+"""
+A topology aware block submitter: submits a set of blocks with as many requests in flight as the DAG allows.
+
+The parent/child graph of the blocks is built from their parent hashes. A block is submitted as soon as all its
+parents (that are in the set) were accepted by the node, so the blocks of a floor (or of a level of a saved DAG)
+are submitted concurrently, up to concurrency requests in flight. Parents that are not in the set are expected
+to be known to the node already.
+
+- accepted:  submitBlock returned no error (a block the node already has counts as accepted)
+- orphan:    the node does not know a parent yet: the block is submitted again after retry_delay, up to max_retries
+- rejected:  any other error. The descendants of a rejected block are not submitted (skipped).
+
+    report = submit_dag('dag.cart', conn, concurrency=32)
+"""
+import asyncio
+import time
+from collections import deque
+from kaspy_tools.logs import config_logger
+from kaspy_tools.kaspad.json_rpc.async_json_rpc_requests import AsyncJsonRpcClient
+from kaspy_tools.kaspad.kaspa_dags.block_cartridge import BlockGraph
+from kaspy_tools.kaspad.kaspa_dags.dag_tools import block_replay
+
+KT_logger = config_logger.get_kaspy_tools_logger()
+
+DEFAULT_CONCURRENCY = 16
+MAX_RETRIES = 5
+RETRY_DELAY = 0.2               # seconds before an orphan is submitted again
+ORPHAN_MESSAGES = ('orphan', 'missing parent')
+DUPLICATE_MESSAGES = ('already have', 'already exists', 'duplicate')
+ACCEPTED = 'accepted'
+ORPHAN = 'orphan'
+REJECTED = 'rejected'
+
+
+def submit_outcome(response_json):
+    """
+    :param response_json: The response_json of a submitBlock request
+    :return: (ACCEPTED, ORPHAN or REJECTED, the error as a string or None)
+    """
+    error = response_json.get('error') or response_json.get('result')
+    if error is None:
+        return ACCEPTED, None
+    message = str(error)
+    lower_message = message.lower()
+    if any(duplicate_message in lower_message for duplicate_message in DUPLICATE_MESSAGES):
+        return ACCEPTED, None
+    if any(orphan_message in lower_message for orphan_message in ORPHAN_MESSAGES):
+        return ORPHAN, message
+    return REJECTED, message
+
+
+async def _submit(client, graph, index, delay):
+    if delay:
+        await asyncio.sleep(delay)
+    try:
+        response, response_json = await client.submit_block_request(graph.block_hex(index))
+        outcome, error = submit_outcome(response_json)
+    except Exception as exception:
+        outcome, error = REJECTED, f'{type(exception).__name__}: {exception}'
+    return index, outcome, error
+
+
+async def submit_dag_async(blocks, client, *, concurrency=DEFAULT_CONCURRENCY, max_retries=MAX_RETRIES,
+                           retry_delay=RETRY_DELAY):
+    """
+    Async version of submit_dag, with an AsyncJsonRpcClient.
+    :return: The submit report (see submit_dag)
+    """
+    with block_replay.open_block_graph(blocks) as graph:
+        return await _submit_graph(graph, client, concurrency=concurrency, max_retries=max_retries,
+                                   retry_delay=retry_delay)
+
+
+async def _submit_graph(graph, client, *, concurrency, max_retries, retry_delay):
+    start_time = time.perf_counter()
+    ready = deque(graph.roots())
+    retries = [0] * len(graph)
+    running = set()
+    skipped = set()
+    report = {'blocks': len(graph), 'accepted': 0, 'rejected': 0, 'skipped': 0, 'retries': 0,
+              'max_in_flight': 0, 'errors': {}}
+    while ready or running:
+        while ready and len(running) < concurrency:
+            running.add(asyncio.create_task(_submit(client, graph, ready.popleft(), 0)))
+        report['max_in_flight'] = max(report['max_in_flight'], len(running))
+        done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            index, outcome, error = task.result()
+            if outcome == ACCEPTED:
+                report['accepted'] += 1
+                ready.extend(graph.accept(index))
+            elif outcome == ORPHAN and retries[index] < max_retries:
+                retries[index] += 1
+                report['retries'] += 1
+                running.add(asyncio.create_task(_submit(client, graph, index, retry_delay * retries[index])))
+            else:
+                report['rejected'] += 1
+                report['errors'][graph.hashes[index].hex()] = error
+                skipped.update(graph.descendants(index))
+                KT_logger.warning('Submit block %s: %s', graph.hashes[index].hex(), error)
+    report['skipped'] = len(skipped)
+    report['elapsed'] = time.perf_counter() - start_time
+    KT_logger.info(f'submitted {report["accepted"]}/{report["blocks"]} blocks in {report["elapsed"]:.3f} s, '
+                   f'max in flight {report["max_in_flight"]}, {report["retries"]} retries, '
+                   f'{report["rejected"]} rejected, {report["skipped"]} skipped')
+    return report
+
+
+def submit_dag(blocks, conn, *, concurrency=DEFAULT_CONCURRENCY, max_retries=MAX_RETRIES, retry_delay=RETRY_DELAY):
+    """
+    Submit a set of blocks: every block whose parents were accepted is submitted concurrently, up to concurrency.
+    :param blocks: A saved blocks file name (see block_replay.iter_saved_blocks), an iterable of raw blocks
+                   (bytes or hex, in any order), or a BlockGraph
+    :param conn: The node connection
+    :param concurrency: Max number of submitBlock requests in flight
+    :param max_retries: Max number of times an orphan block is submitted again
+    :param retry_delay: Seconds before an orphan is submitted again (times the number of retries)
+    :return: A report dictionary: blocks, accepted, rejected, skipped (descendants of rejected blocks), retries,
+             max_in_flight, elapsed (seconds), errors (block hash -> error)
+    """
+    client = AsyncJsonRpcClient(conn, concurrency=concurrency)
+    try:
+        return asyncio.run(submit_dag_async(blocks, client, concurrency=concurrency, max_retries=max_retries,
+                                            retry_delay=retry_delay))
+    finally:
+        client.close()
@@ -0,0 +1,280 @@
+"""
+An offline DAG synthesizer: builds whole DAG topologies locally, without getBlockTemplate requests.
+
+The topology is a list of floors (number of blocks in each floor). The blocks of a floor choose their parents
+among the blocks of the previous floor (see all_parents, random_parents), the first floor is built on
+root_hashes (default: the genesis block). The synthesizer computes the parent hashes, coinbase txs, hash merkle
+roots, timestamps and the proof of work, floor by floor, and writes the blocks in topological order into a
+block stream file:
+
+    synthesize_dag_file('dag.blocks', make_floors(10000, 1, 4), mining_processes=4)
+
+Block stream file: BLOCK_STREAM_MAGIC, then for each block: length (u32 little endian) + the block bytes.
+
+The synthesized DAGs are for the tools that work on block topologies without a validating node: block
+cartridges, and the scheduling of dag_submitter and block_replay against a stand-in node (LocalTransport).
+They can't be submitted to kaspad (see below), so this module has no submit step: DAGs for a node are built
+with dag_make.
+
+Blue score: the coinbase payload holds the blue score of the block, computed as start_blue_score plus the number
+of synthesized blocks in its past. That is the GHOSTDAG blue score only when the whole past of the block is blue,
+so floors may not be wider than kaspad_constants.PHANTOM_K (checked). With all_parents every block has all the
+previous floors in its past, and the score is exact. With random_parents a block can have blocks of the
+neighbouring floors in its anticone, and the score may be too high for a validating node.
+
+Consensus fields: the id merkle root and the utxo commitment of a block depend on the node state (the txs
+accepted by the selected parent chain, and the utxo set), and the coinbase outputs pay the rewards of the blue
+blocks of the merge set. They are not computed here: the commitments function gives the first two (default: zero
+hashes), and block_reward the value of a single coinbase output (default: no outputs). A validating kaspad
+rejects the synthesized blocks.
+"""
+import os
+import random
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from kaspy_tools.logs import config_logger
+from kaspy_tools.kaspa_model.block import Block
+from kaspy_tools.kaspa_model.tx import Tx, CURRENT_VERSION, COINBASE_SUBNETWORK
+from kaspy_tools.kaspa_model.tx_out import TxOut
+from kaspy_tools.kaspa_model.tx_script import TxScript
+from kaspy_tools.kaspad import kaspad_constants
+from kaspy_tools.kaspad.utilities import nonce_miner
+from kaspy_tools.kaspad.utilities import updater
+from kaspy_tools.utils import general_utils
+
+KT_logger = config_logger.get_kaspy_tools_logger()
+
+BLOCK_STREAM_MAGIC = b'KTBLKST\x00'
+pack_length = struct.Struct('<I').pack
+unpack_length = struct.Struct('<I').unpack
+MAX_BLOCK_PARENTS = 10
+SIMNET_BITS = '207fffff'
+BLOCK_INTERVAL = 1000               # milliseconds between floors
+EXTRA_NONCE_SIZE = 8
+
+
+# ========== Topology ========== #
+
+def make_floors(floor_count, min_width, max_width, seed=None):
+    """
+    :return: A list of floor_count random floor widths, like dag_make.make_dag builds
+    """
+    rng = random.Random(seed)
+    return [rng.randint(min_width, max_width) for _ in range(floor_count)]
+
+
+def all_parents(previous_floor, rng):
+    """
+    Parent selection: all the blocks of the previous floor (a random sample of MAX_BLOCK_PARENTS if there are more).
+    """
+    if len(previous_floor) <= MAX_BLOCK_PARENTS:
+        return list(previous_floor)
+    return rng.sample(previous_floor, MAX_BLOCK_PARENTS)
+
+
+def random_parents(max_parents):
+    """
+    :return: A parent selection function: between 1 and max_parents random blocks of the previous floor
+    """
+    def select_parents(previous_floor, rng):
+        return rng.sample(previous_floor, rng.randint(1, min(max_parents, len(previous_floor))))
+    return select_parents
+
+
+def random_bytes(rng, size):
+    """
+    :return: size random bytes from rng (random.Random.randbytes needs python 3.9)
+    """
+    return rng.getrandbits(size * 8).to_bytes(size, byteorder='little')
+
+
+def zero_commitments(floor_index, parent_hashes):
+    """
+    The default commitments function.
+    :return: (id merkle root bytes, utxo commitment bytes)
+    """
+    return bytes(32), bytes(32)
+
+
+# ========== Blocks ========== #
+
+def make_coinbase_tx(blue_score, script_pub_key, extra_data, block_reward=0):
+    """
+    Build a coinbase tx locally. Its payload is: blue score, script pub key (length + script), extra data.
+    :param blue_score: The blue score of the block
+    :param script_pub_key: The script pub key (bytes) of the miner
+    :param extra_data: Extra data (bytes) for the payload
+    :param block_reward: The value of the coinbase output (0 for a coinbase tx without outputs)
+    :return: Tx object
+    """
+    payload = blue_score.to_bytes(8, byteorder='little') + general_utils.write_varint(len(script_pub_key)) + \
+        script_pub_key + extra_data
+    tx_out_list = []
+    if block_reward:
+        tx_out_list.append(TxOut.tx_out_factory(value=block_reward,
+                                                script_pub_key=TxScript.parse_tx_script(raw_script=script_pub_key)))
+    return Tx.tx_factory(version_bytes=CURRENT_VERSION, tx_in_list=[], tx_out_list=tx_out_list, locktime_int=0,
+                         subnetwork_id_bytes=bytes.fromhex(COINBASE_SUBNETWORK), gas_bytes=bytes(8),
+                         payload_hash=general_utils.hash_256(payload), payload=payload)
+
+
+def make_block(parent_hashes, *, coinbase_tx, timestamp, bits_bytes, id_merkle_root_bytes, utxo_commitment_bytes):
+    """
+    Build a block (not mined yet).
+    :param parent_hashes: The parent hashes (bytes, as displayed). They are sorted, like kaspad expects them
+    :return: Block object
+    """
+    parent_hashes = sorted(parent_hashes)
+    new_block = Block.block_factory(num_of_parent_blocks=len(parent_hashes),
+                                    parent_hashes=[parent_hash[::-1] for parent_hash in parent_hashes],
+                                    id_merkle_root_bytes=id_merkle_root_bytes,
+                                    utxo_commitment_bytes=utxo_commitment_bytes, timestamp_int=timestamp,
+                                    timestamp_bytes=timestamp.to_bytes(8, byteorder='little'),
+                                    bits_bytes=bits_bytes, coinbase_tx_obj=coinbase_tx)
+    updater.update_hash_merkle_root(new_block, None)
+    return new_block
+
+
+def _mine_floor(floor_blocks, rng, executor):
+    """
+    Find the nonces of the blocks of a floor (they don't depend on each other), in the process pool if given.
+    """
+    header_prefixes = [nonce_miner.split_header(new_block)[0] for new_block in floor_blocks]
+    start_nonces = [rng.randint(0, kaspad_constants.MAX_UINT64) for _ in floor_blocks]
+    targets = [new_block.target_int for new_block in floor_blocks]
+    if executor is None:
+        results = list(map(nonce_miner.search_nonce, header_prefixes, targets, start_nonces))
+    else:
+        futures = [executor.submit(nonce_miner.search_nonce, header_prefix, target, start_nonce)
+                   for header_prefix, target, start_nonce in zip(header_prefixes, targets, start_nonces)]
+        try:
+            results = [future.result() for future in futures]
+        finally:
+            nonce_miner.cancel_futures(futures)
+    for new_block, (nonce, hashes_done) in zip(floor_blocks, results):
+        if nonce is None:
+            raise RuntimeError('No nonce found in the whole nonce space')
+        new_block.nonce_int = nonce
+
+
+def synthesize_dag(floors, *, select_parents=all_parents, root_hashes=None, start_blue_score=1, bits=SIMNET_BITS,
+                   start_time=None, block_interval=BLOCK_INTERVAL, script_pub_key=None, block_reward=0,
+                   commitments=zero_commitments, mining_processes=1, seed=None):
+    """
+    Build a DAG locally, floor by floor.
+    :param floors: A list of floor widths (see make_floors)
+    :param select_parents: A function (previous floor block hashes, random.Random) -> parent hashes
+    :param root_hashes: Block hashes (hex) the first floor is built on (default: the genesis block)
+    :param start_blue_score: The blue score of a block whose parents are root_hashes: 1 on the genesis block.
+                             For other roots, take it from the coinbase payload of a getBlockTemplate built on them
+    :param bits: The difficulty bits (hex, as in a block template)
+    :param start_time: Timestamp (milliseconds) of the first floor (default: so that the last floor is now)
+    :param block_interval: Milliseconds between floors
+    :param script_pub_key: Script pub key (bytes) of the coinbase payload and output (default: p2pkh to a random key)
+    :param block_reward: Value of the coinbase output of each block (0: no coinbase outputs)
+    :param commitments: A function (floor index, parent hashes) -> (id merkle root bytes, utxo commitment bytes)
+    :param mining_processes: Number of mining processes (1 mines in this process)
+    :param seed: Random seed (parent selection, nonces, extra data), for reproducible topologies
+    :return: A generator of (block bytes, block hash bytes), in topological order
+    """
+    wide_floors = [width for width in floors if width > kaspad_constants.PHANTOM_K]
+    if wide_floors:
+        raise ValueError(f'Floors wider than K ({kaspad_constants.PHANTOM_K}) have red blocks: {wide_floors[:5]}')
+    rng = random.Random(seed)
+    if root_hashes is None:
+        root_hashes = [kaspad_constants.GENESIS_HASH]
+    if start_time is None:
+        start_time = time.time_ns() // 1000000 - len(floors) * block_interval
+    if script_pub_key is None:
+        script_pub_key = bytes(TxScript.script_pub_hush_factory(random_bytes(rng, 20)))
+    bits_bytes = bytes.fromhex(bits)[::-1]
+    previous_floor = [bytes.fromhex(root_hash) for root_hash in root_hashes]
+    # the past of each block of the previous floor, including the block itself, as a bit set of block numbers
+    # (the roots are not numbered: they are counted in start_blue_score)
+    past_with_self = dict.fromkeys(previous_floor, 0)
+    block_number = 0
+    executor = ProcessPoolExecutor(max_workers=mining_processes) if mining_processes != 1 else None
+    try:
+        for floor_index, width in enumerate(floors):
+            floor_blocks = []
+            floor_pasts = []
+            for _ in range(width):
+                parent_hashes = select_parents(previous_floor, rng)
+                block_past = 0
+                for parent_hash in parent_hashes:
+                    block_past |= past_with_self[parent_hash]
+                floor_pasts.append(block_past | 1 << block_number)
+                block_number += 1
+                id_merkle_root_bytes, utxo_commitment_bytes = commitments(floor_index, parent_hashes)
+                coinbase_tx = make_coinbase_tx(start_blue_score + bin(block_past).count('1'), script_pub_key,
+                                               random_bytes(rng, EXTRA_NONCE_SIZE), block_reward)
+                floor_blocks.append(make_block(parent_hashes, coinbase_tx=coinbase_tx,
+                                               timestamp=start_time + floor_index * block_interval,
+                                               bits_bytes=bits_bytes, id_merkle_root_bytes=id_merkle_root_bytes,
+                                               utxo_commitment_bytes=utxo_commitment_bytes))
+            _mine_floor(floor_blocks, rng, executor)
+            previous_floor = []
+            past_with_self = {}
+            for new_block, block_past in zip(floor_blocks, floor_pasts):
+                block_header = new_block.block_header_bytes
+                block_hash = general_utils.reverse_bytes(general_utils.hash_256(block_header))
+                previous_floor.append(block_hash)
+                past_with_self[block_hash] = block_past
+                yield Block.rebuild_block(block_header, new_block.get_block_body_bytes_array()), block_hash
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+# ========== Block stream files ========== #
+
+def write_block_stream(blocks, file_name):
+    """
+    Write blocks into a block stream file. The file is replaced atomically.
+    :param blocks: An iterable of blocks (bytes), or of (block bytes, block hash) tuples
+    :param file_name: The file to write
+    :return: Number of blocks written
+    """
+    block_count = 0
+    temp_file_name = file_name + '.tmp'
+    with open(temp_file_name, 'wb') as stream_file:
+        stream_file.write(BLOCK_STREAM_MAGIC)
+        for block in blocks:
+            block_bytes = block[0] if isinstance(block, tuple) else block
+            stream_file.write(pack_length(len(block_bytes)))
+            stream_file.write(block_bytes)
+            block_count += 1
+    os.replace(temp_file_name, file_name)
+    return block_count
+
+
+def iter_block_stream(file_name):
+    """
+    :param file_name: A block stream file
+    :return: A generator of the blocks (bytes), in the file order
+    """
+    with open(file_name, 'rb') as stream_file:
+        if stream_file.read(len(BLOCK_STREAM_MAGIC)) != BLOCK_STREAM_MAGIC:
+            raise ValueError(f'{file_name} is not a block stream file')
+        while True:
+            length_bytes = stream_file.read(4)
+            if not length_bytes:
+                return
+            block_length, = unpack_length(length_bytes)
+            block_bytes = stream_file.read(block_length)
+            if len(length_bytes) < 4 or len(block_bytes) < block_length:
+                raise ValueError(f'{file_name}: truncated block stream')
+            yield block_bytes
+
+
+def synthesize_dag_file(file_name, floors, **synthesize_options):
+    """
+    Build a DAG locally (see synthesize_dag) and write it into a block stream file.
+    :return: Number of blocks written
+    """
+    start_time = time.perf_counter()
+    block_count = write_block_stream(synthesize_dag(floors, **synthesize_options), file_name)
+    elapsed = time.perf_counter() - start_time
+    KT_logger.info(f'synthesized {block_count} blocks in {elapsed:.3f} s -> {file_name}')
+    return block_count
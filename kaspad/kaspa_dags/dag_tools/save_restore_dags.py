@@ -51,6 +51,20 @@ def restore_volume_files(*, dag_dir, work_dir='kaspad'):
 
     KT_logger.debug('Copied: "{}", to: "{}"'.format(dag_dir, work_dir))
 
+def move_volume_files(*, from_dir, to_dir):
+    """
+    Rename a directory under the volumes directory (to_dir must not exist).
+    :param from_dir: The directory to rename
+    :param to_dir: The new name
+    :return: None
+    """
+    cmd = ['sudo', '-S', 'mv', '-T', from_dir, to_dir]
+    completed_process = subprocess.run(cmd, capture_output=True, input=kaspy_tools_constants.SUDO_PASSWORD,
+                                       encoding='utf-8', cwd=VOLUMES_DIR_PATH)
+    completed_process.check_returncode()  # raise CalledProcessError if return code is not 0
+
+    KT_logger.debug('Moved: "{}", to: "{}"'.format(from_dir, to_dir))
+
 def unlock_volumes_dir():
     cmd = ['sudo', '-S', 'chown', '1000:1000', kaspy_tools_constants.VOLUMES_DIR_PATH]
     completed_process = subprocess.run(cmd, capture_output=True, input=kaspy_tools_constants.SUDO_PASSWORD,
@@ -2,19 +2,28 @@
 This module computes the utxo set.
 It does so by downloading blocks from a kaspad using json-rpc.
 It then uses the downloaded blocks, and computes the utxo set that matches those blocks.
-Call download_utxo_set to get the utxo set and the blocks.
+Call download_utxo_set to get the utxo set (a UtxoSet object) and the blocks.
+Call stream_utxo_set to get only the utxo set: blocks are processed while they are downloaded, and dropped.
+Call stream_utxo_set_from_raw_blocks to do the same with raw blocks only: the blocks are parsed locally and the
+tx ids are computed, so kaspad does not serialize verbose blocks.
 """
 from kaspy_tools.kaspad import kaspad_block_utils
 from kaspy_tools.kaspad.json_rpc import json_rpc_requests
 from kaspy_tools.kaspa_model import tx_out
 from kaspy_tools.kaspa_model import tx_script
+from kaspy_tools.kaspa_model.block import Block
+from kaspy_tools.kaspa_model.utxo_set import UtxoSet
 import kaspy_tools.kaspa_model.tx
 
+# the fields of the verbose blocks that are needed to compute the utxo set (see json_stream.project)
+UTXO_BLOCK_PROJECTION = {'hash': True, 'parentHashes': True,
+                         'rawRx': {'txId': True, 'subnetwork': True, 'vin': {'txId': True, 'vout': True},
+                                   'vout': {'value': True, 'scriptPubKey': {'hex': True}}}}
 
 def download_utxo_set(block_count, save_location=None, conn=None):
     raw_blocks, verbose_blocks = kaspad_block_utils.get_blocks(block_count, conn=conn)
-    utxo_list = collect_utxo(verbose_blocks=verbose_blocks, conn=conn)
-    return utxo_list, verbose_blocks, raw_blocks
+    utxo_set = collect_utxo(verbose_blocks=verbose_blocks, conn=conn)
+    return utxo_set, verbose_blocks, raw_blocks
 
 
 def collect_utxo(*, conn=None, verbose_blocks=None):
@@ -31,60 +40,176 @@ def collect_utxo(*, conn=None, verbose_blocks=None):
     return utxo_from_ordered_tx_list(tx_ordered_list)
 
 
-def utxo_from_ordered_tx_list(tx_ordered_list):
-    utxo_list = []
+def stream_utxo_set(conn=None):
+    """
+    Compute the utxo set without keeping the blocks: the blocks are streamed (json_rpc_requests.iter_blocks),
+    and each chain block is applied as soon as all the blocks it accepts were downloaded.
+    Only the accepted transactions of blocks that can't be applied yet are kept.
+    :param conn: A connection to the kaspad
+    :return: UtxoSet object
+    """
+    utxo_set = UtxoSet()
+    verbose_blocks = ((verbose_block['hash'], verbose_block)
+                      for verbose_block in json_rpc_requests.iter_verbose_blocks(conn=conn,
+                                                                                 projection=UTXO_BLOCK_PROJECTION))
+    for tx_list in accepted_txs_in_chain_order(verbose_blocks, accepted_verbose_txs, conn=conn):
+        apply_tx_list(tx_list, utxo_set)
+    return utxo_set
+
+
+def stream_utxo_set_from_raw_blocks(conn=None):
+    """
+    Like stream_utxo_set, but only raw blocks are downloaded (json_rpc_requests.iter_raw_blocks).
+    The blocks are parsed locally, the tx ids are computed (Tx.compute_txid), and the acceptance data of
+    getChainFromBlock selects the transactions, so the result is the same utxo set.
+    :param conn: A connection to the kaspad
+    :return: UtxoSet object
+    """
+    utxo_set = UtxoSet()
+    raw_blocks = ((block.block_header_hash_bytes.hex(), block)
+                  for block in (Block.parse_block(bytes.fromhex(raw_block), lazy=True)
+                                for raw_block in json_rpc_requests.iter_raw_blocks(conn=conn)))
+    for tx_list in accepted_txs_in_chain_order(raw_blocks, accepted_raw_txs, conn=conn):
+        apply_raw_tx_list(tx_list, utxo_set)
+    return utxo_set
+
+
+def accepted_txs_in_chain_order(blocks, accepted_txs_of, conn=None):
+    """
+    Order the accepted transactions of streamed blocks by the selected parent chain (getChainFromBlock).
+    Each chain block is yielded as soon as all the blocks it accepts were streamed.
+    Only the accepted transactions of blocks that can't be yielded yet are kept.
+    :param blocks: An iterable of (block hash, block) tuples, in any order
+    :param accepted_txs_of: A function (block, set of accepted tx ids) -> list of the accepted txs of the block
+    :param conn: A connection to the kaspad
+    :return: A generator of lists of txs, one per accepted block, in the order they should be applied
+    Raises RuntimeError if the stream ends while blocks accepted by the chain were not streamed.
+    """
+    result = json_rpc_requests.get_chain_from_block(start_hash=None, conn=conn, include_blocks=False)
+    added_blocks = result['result']['addedChainBlocks']
+    accepted_tx_ids = {}        # accepted block hash -> accepted tx ids
+    for chain_block in added_blocks:
+        for accepted_block in chain_block['acceptedBlocks']:
+            accepted_tx_ids[accepted_block['hash']] = set(accepted_block['acceptedTxIds'])
+
+    accepted_txs = {}           # accepted block hash -> its accepted txs (until its chain block is applied)
+    next_chain_index = 0
+    for block_hash, block in blocks:
+        block_tx_ids = accepted_tx_ids.pop(block_hash, None)
+        if block_tx_ids is None:      # not accepted by the chain
+            continue
+        accepted_txs[block_hash] = accepted_txs_of(block, block_tx_ids)
+        while next_chain_index < len(added_blocks) and \
+                all(accepted_block['hash'] in accepted_txs
+                    for accepted_block in added_blocks[next_chain_index]['acceptedBlocks']):
+            for accepted_block in added_blocks[next_chain_index]['acceptedBlocks']:
+                yield accepted_txs.pop(accepted_block['hash'])
+            next_chain_index += 1
+    if next_chain_index < len(added_blocks):
+        missing_hashes = [accepted_block['hash'] for accepted_block in added_blocks[next_chain_index]['acceptedBlocks']
+                          if accepted_block['hash'] not in accepted_txs]
+        raise RuntimeError(f'{len(added_blocks) - next_chain_index} chain blocks were not applied: '
+                           f'chain block {added_blocks[next_chain_index]["hash"]} accepts blocks that were not '
+                           f'streamed: {missing_hashes}')
+
+
+def accepted_verbose_txs(verbose_block, block_tx_ids):
+    """
+    :return: The json encoded txs of a verbose block, that are in block_tx_ids
+    """
+    return [tx for tx in verbose_block['rawRx'] if tx['txId'] in block_tx_ids]
+
+
+def accepted_raw_txs(block, block_tx_ids):
+    """
+    :param block: A Block object (parsed from a raw block)
+    :param block_tx_ids: A set of accepted tx ids (hex)
+    :return: A list of (tx id, Tx object, is coinbase) tuples, of the accepted txs of the block
+    """
+    txs = [(block.coinbase_tx_obj.compute_txid(coinbase=True), block.coinbase_tx_obj, True)]
+    txs.extend((tx.compute_txid(), tx, False) for tx in block.native_tx_list_of_objs)
+    return [tx_tuple for tx_tuple in txs if tx_tuple[0] in block_tx_ids]
+
+
+def apply_raw_tx_list(tx_ordered_list, utxo_set):
+    """
+    Apply parsed transactions (in order) to a utxo set.
+    :param tx_ordered_list: A list of (tx id, Tx object, is coinbase) tuples
+    :param utxo_set: UtxoSet object
+    :return: utxo_set
+    """
+    for tx_id, tx, is_coinbase in tx_ordered_list:
+        if not is_coinbase:
+            for tx_in in tx.tx_input_list:
+                # tx ids are serialized in reversed byte order
+                utxo_set.spend((tx_in.previous_tx_id_bytes[::-1].hex(),
+                                int.from_bytes(tx_in.previous_tx_out_index_bytes, 'little')))
+        for index, output in enumerate(tx.tx_output_list):
+            script_pub_key = tx_script.TxScript.parse_tx_script(raw_script=output.get_script_pub_key_bytes())
+            utxo_set.add(tx_out.TxOut.tx_out_factory(value=int.from_bytes(output.get_value_bytes(), 'little'),
+                                                     script_pub_key=script_pub_key, tx_id=tx_id, out_index=index))
+    return utxo_set
+
+
+def apply_tx_list(tx_ordered_list, utxo_set):
+    """
+    Apply json encoded transactions (in order) to a utxo set.
+    :param tx_ordered_list: A list of json encoded transactions
+    :param utxo_set: UtxoSet object
+    :return: utxo_set
+    """
     for tx in tx_ordered_list:
         if tx['subnetwork'] == kaspy_tools.kaspa_model.tx.COINBASE_SUBNETWORK:  # so this is a coinbase transaction
-            collect_coinbase_tx_utxo(tx, utxo_list)
+            collect_coinbase_tx_utxo(tx, utxo_set)
         else:
-            collect_native_tx_utxo(tx, utxo_list)
+            collect_native_tx_utxo(tx, utxo_set)
+    return utxo_set
 
-    return utxo_list
+
+def utxo_from_ordered_tx_list(tx_ordered_list):
+    return apply_tx_list(tx_ordered_list, UtxoSet())
 
 
-def collect_native_tx_utxo(tx, utxo_dict):
+def collect_native_tx_utxo(tx, utxo_set):
     """
     Go over the inputs and outputs of a non coinbase transaction.
     Use inputs to delete matching utxo
     :param tx: current transaction
-    :param utxo_set: The set of utxo collected
-    :return:
+    :param utxo_set: The set of utxo collected (UtxoSet)
+    :return: utxo_set
     """
-    # TODO: fix after changes
     # first, go over input, and remove matching utxo outputs
-    for index, vin in enumerate(tx['vin']):
-        referred_out = (vin['txId'], vin['vout'])
-        if referred_out in utxo_dict:
-            del (utxo_dict[referred_out])
+    for vin in tx['vin']:
+        utxo_set.spend((vin['txId'], vin['vout']))
 
     # ..then add outputs from transaction into utxo_set
-    for index, vout in enumerate(tx['vout']):
-        scriptPubKey = tx_script.TxScript.parse_tx_script(raw_script=vout['scriptPubKey']['hex'])
-        new_utxo = {
-            'output': tx_out.TxOut.tx_out_factory(value=vout['value'], script_pub_key=scriptPubKey,
-                                                  tx_id=tx['txId'], out_index=index),
-            'used': False
-        }
-        utxo_dict[(tx['txId'], index)] = new_utxo
-
-    return utxo_dict
+    add_tx_outputs(tx, utxo_set)
+    return utxo_set
 
 
-def collect_coinbase_tx_utxo(tx, utxo_list):
+def collect_coinbase_tx_utxo(tx, utxo_set):
     """
     This function gets a json encoded coinbase transaction from a block.
-    It convert these vin inputs into a utxo dictionary (encoded the same as in get_utxo_set)
-    :param utxo_set: The set of utxo collected
+    It adds its outputs into the utxo set.
+    :param tx: a json encoded transaction
+    :param utxo_set: The set of utxo collected (UtxoSet)
+    :return: utxo_set
+    """
+    add_tx_outputs(tx, utxo_set)
+    return utxo_set
+
+
+def add_tx_outputs(tx, utxo_set, journal=None):
+    """
+    Add the outputs of a json encoded transaction into the utxo set.
     :param tx: a json encoded transaction
-    :return: utxo_set created from coinbase vin inputs
+    :param utxo_set: The set of utxo collected (UtxoSet)
+    :param journal: A list to record the changes into (see UtxoSet.rollback), or None
+    :return: A list of the new entries
     """
+    new_entries = []
     for index, vout in enumerate(tx['vout']):
         scriptPubKey = tx_script.TxScript.parse_tx_script(raw_script=vout['scriptPubKey']['hex'])
-        new_utxo = {
-            'output': tx_out.TxOut.tx_out_factory(value=vout['value'], script_pub_key=scriptPubKey,
-                                                  tx_id=tx['txId'], out_index=index),
-            'used': False
-        }
-        utxo_list.append(new_utxo)
-
-    return utxo_list
+        new_entries.append(utxo_set.add(tx_out.TxOut.tx_out_factory(value=vout['value'], script_pub_key=scriptPubKey,
+                                                 tx_id=tx['txId'], out_index=index), journal))
+    return new_entries
@@ -4,6 +4,7 @@ from kaspy_tools.kaspad import kaspad_constants
 from kaspy_tools.logs import config_logger
 import pygraphviz as pgv
 from kaspy_tools import kaspy_tools_constants
+from kaspy_tools.kaspad.json_rpc import json_rpc_requests
 
 KT_logger = config_logger.get_kaspy_tools_logger()
 
@@ -17,6 +18,14 @@ def draw_graph_image(v_blocks, fname):
     os.chdir(pwd)  # Go back
 
 
+def draw_node_dag_image(fname, conn, block_count=None):
+    """
+    Draw the DAG of a node. The blocks are streamed into the graph (see json_rpc_requests.iter_blocks),
+    so only the graph is kept in memory, not the blocks.
+    """
+    draw_graph_image(json_rpc_requests.iter_verbose_blocks(block_count, conn=conn), fname)
+
+
 def make_dag_graph(v_blocks):
     graph = pgv.AGraph()
     add_nodes_and_edges(graph, v_blocks)
@@ -0,0 +1,221 @@
+"""
+A compact binary snapshot of a utxo set, read through mmap.
+Opening a snapshot does not read it: lookups binary search the sorted outpoints in the mapped file, so a
+multi-million entry utxo set opens instantly and with constant memory.
+
+File layout (all numbers little endian, except the outpoint index, see below):
+    header           HEADER_FORMAT: magic, version, reserved, entry count, script count
+    outpoints        entry count x 36 bytes: tx id (32 bytes) + out index (u32 big endian), sorted
+                     (the index is big endian so that sorting the records as bytes sorts them by (tx id, index))
+    values           entry count x u64
+    script ids       entry count x u32: index of the entry script in the script table
+    used flags       entry count x u8: 1 if the entry is marked used (see UtxoSet.mark_used), else 0
+    script offsets   (script count + 1) x u64: start of each script in the script data, plus the end
+    script data      the scripts (each distinct script is stored once)
+
+Tx ids are stored as bytes.fromhex(tx_id) of the hex tx ids used by UtxoSet (no byte reversal).
+"""
+import bisect
+import mmap
+import os
+import struct
+from kaspy_tools.logs import config_logger
+from kaspy_tools.kaspa_model import tx_out
+from kaspy_tools.kaspa_model import tx_script
+from kaspy_tools.kaspa_model.utxo_set import UtxoSet
+
+KT_logger = config_logger.get_kaspy_tools_logger()
+
+SNAPSHOT_MAGIC = b'KTUTXOS\x00'
+SNAPSHOT_VERSION = 2
+HEADER_FORMAT = struct.Struct('<8sIIQQ')      # magic, version, reserved, entry count, script count
+OUTPOINT_SIZE = 36
+VALUE_SIZE = 8
+SCRIPT_ID_SIZE = 4
+USED_FLAG_SIZE = 1
+SCRIPT_OFFSET_SIZE = 8
+pack_index = struct.Struct('>I').pack
+unpack_index = struct.Struct('>I').unpack_from
+unpack_value = struct.Struct('<Q').unpack_from
+unpack_script_id = struct.Struct('<I').unpack_from
+unpack_script_range = struct.Struct('<QQ').unpack_from     # (start, end) of a script in the script data
+
+
+def outpoint_key(tx_id, out_index):
+    """
+    :param tx_id: The tx id (hex string)
+    :param out_index: The output index
+    :return: The 36 bytes outpoint record, as stored in a snapshot
+    """
+    return bytes.fromhex(tx_id) + pack_index(out_index)
+
+
+def save_utxo_snapshot(utxo_set, file_name):
+    """
+    Write a utxo set as a binary snapshot. The file is replaced atomically.
+    :param utxo_set: A UtxoSet, or any iterable of utxo entries ({'output': TxOut, 'used': bool})
+    :param file_name: The snapshot file to write
+    :return: Number of entries written
+    """
+    records = []
+    script_ids = {}
+    for entry in utxo_set:
+        output = entry['output']
+        script_bytes = bytes(output.get_script_pub_key())
+        script_id = script_ids.setdefault(script_bytes, len(script_ids))
+        records.append((outpoint_key(output.get_tx_id(), output.get_out_index()), output.get_value(), script_id,
+                        1 if entry['used'] else 0))
+    records.sort()
+
+    script_offsets = [0]
+    for script_bytes in script_ids:     # dicts keep insertion order, i.e: the order of the script ids
+        script_offsets.append(script_offsets[-1] + len(script_bytes))
+
+    temp_file_name = file_name + '.tmp'
+    with open(temp_file_name, 'wb') as snapshot_file:
+        snapshot_file.write(HEADER_FORMAT.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, len(records), len(script_ids)))
+        snapshot_file.write(b''.join(record[0] for record in records))
+        snapshot_file.write(struct.pack(f'<{len(records)}Q', *(record[1] for record in records)))
+        snapshot_file.write(struct.pack(f'<{len(records)}I', *(record[2] for record in records)))
+        snapshot_file.write(bytes(record[3] for record in records))
+        snapshot_file.write(struct.pack(f'<{len(script_offsets)}Q', *script_offsets))
+        snapshot_file.write(b''.join(script_ids))
+    os.replace(temp_file_name, file_name)
+    KT_logger.debug(f'utxo snapshot: {len(records)} utxos, {len(script_ids)} distinct scripts -> {file_name}')
+    return len(records)
+
+
+class _OutpointColumn:
+    """
+    A read only sequence view of the outpoint records of a snapshot, for bisect.
+    Each item is read from the map when it is accessed (only log2(count) of them are read by a lookup).
+    """
+    __slots__ = ('_map', '_offset', '_count')
+
+    def __init__(self, snapshot_map, offset, count):
+        self._map = snapshot_map
+        self._offset = offset
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        start = self._offset + index * OUTPOINT_SIZE
+        return self._map[start:start + OUTPOINT_SIZE]
+
+
+class UtxoSnapshot:
+    """
+    Read a snapshot written by save_utxo_snapshot. Use as a context manager, or call close().
+    """
+
+    def __init__(self, file_name):
+        self._file = open(file_name, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self._count, self._script_count = HEADER_FORMAT.unpack_from(self._map, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            self.close()
+            raise ValueError(f'{file_name} is not a utxo snapshot (version {SNAPSHOT_VERSION})')
+        self._outpoints_offset = HEADER_FORMAT.size
+        self._values_offset = self._outpoints_offset + self._count * OUTPOINT_SIZE
+        self._script_ids_offset = self._values_offset + self._count * VALUE_SIZE
+        self._used_flags_offset = self._script_ids_offset + self._count * SCRIPT_ID_SIZE
+        self._script_offsets_offset = self._used_flags_offset + self._count * USED_FLAG_SIZE
+        self._script_data_offset = self._script_offsets_offset + (self._script_count + 1) * SCRIPT_OFFSET_SIZE
+        self._outpoints = _OutpointColumn(self._map, self._outpoints_offset, self._count)
+
+    def close(self):
+        self._outpoints = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # ========== Lookup Methods ========== #
+
+    def __len__(self):
+        return self._count
+
+    def find(self, tx_id, out_index):
+        """
+        Binary search an outpoint.
+        :param tx_id: The tx id (hex string)
+        :param out_index: The output index
+        :return: The position of the entry in the snapshot, or -1 if it is not there
+        """
+        key = outpoint_key(tx_id, out_index)
+        position = bisect.bisect_left(self._outpoints, key)
+        if position < self._count and self._outpoints[position] == key:
+            return position
+        return -1
+
+    def __contains__(self, outpoint):
+        return self.find(*outpoint) >= 0
+
+    def get(self, tx_id, out_index, default=None):
+        """
+        :return: (value, script pub key bytes) of an outpoint, or default if it is not in the snapshot
+        """
+        position = self.find(tx_id, out_index)
+        if position < 0:
+            return default
+        return self.value_at(position), self.script_at(position)
+
+    def outpoint_at(self, position):
+        """
+        :return: (tx id as hex string, out index) of the entry at position
+        """
+        record = self._outpoints[position]
+        return record[:32].hex(), unpack_index(record, 32)[0]
+
+    def value_at(self, position):
+        return unpack_value(self._map, self._values_offset + position * VALUE_SIZE)[0]
+
+    def script_at(self, position):
+        script_id = unpack_script_id(self._map, self._script_ids_offset + position * SCRIPT_ID_SIZE)[0]
+        script_start, script_end = unpack_script_range(self._map,
+                                                       self._script_offsets_offset + script_id * SCRIPT_OFFSET_SIZE)
+        return self._map[self._script_data_offset + script_start:self._script_data_offset + script_end]
+
+    def used_at(self, position):
+        """
+        :return: True if the entry at position was marked used when the snapshot was saved
+        """
+        return self._map[self._used_flags_offset + position] != 0
+
+    def tx_out_at(self, position):
+        """
+        :return: A TxOut object for the entry at position (with tx_id and out_index set)
+        """
+        tx_id, out_index = self.outpoint_at(position)
+        script_pub_key = tx_script.TxScript.parse_tx_script(raw_script=self.script_at(position))
+        return tx_out.TxOut.tx_out_factory(value=self.value_at(position), script_pub_key=script_pub_key,
+                                           tx_id=tx_id, out_index=out_index)
+
+    def __iter__(self):
+        """
+        :return: An iterator of (tx id, out index, value, script pub key bytes), in outpoint order
+        """
+        for position in range(self._count):
+            tx_id, out_index = self.outpoint_at(position)
+            yield tx_id, out_index, self.value_at(position), self.script_at(position)
+
+    def to_utxo_set(self):
+        """
+        Load the whole snapshot into a UtxoSet (for choosing inputs, see UtxoSet.take_unused).
+        Entries that were used when the snapshot was saved are marked used again, so they are not chosen twice.
+        :return: UtxoSet object
+        """
+        utxo_set = UtxoSet()
+        for position in range(self._count):
+            entry = utxo_set.add(self.tx_out_at(position))
+            if self.used_at(position):
+                utxo_set.mark_used(entry)
+        return utxo_set
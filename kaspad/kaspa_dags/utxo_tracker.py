@@ -0,0 +1,204 @@
+"""
+UtxoTracker keeps a utxo set in sync with a kaspad, incrementally.
+It records the last chain block it processed. On each sync it calls getChainFromBlock from that block, applies
+only the blocks in addedChainBlocks, and rolls back the blocks in removedChainBlockHashes using an undo journal.
+The state (utxo set, last chain block and journal) can be saved to a file, and loaded on the next run.
+
+Usage:
+    utxo_set = sync_utxo_set(state_file, conn=conn)
+"""
+import json
+import os
+from kaspy_tools.logs import config_logger
+from kaspy_tools.kaspad.json_rpc import json_rpc_requests
+from kaspy_tools.kaspad.kaspa_dags import dnld_utxo_set_command
+from kaspy_tools.kaspa_model import tx_out
+from kaspy_tools.kaspa_model import tx_script
+from kaspy_tools.kaspa_model.utxo_set import UtxoSet, JOURNAL_ADD
+import kaspy_tools.kaspa_model.tx
+
+KT_logger = config_logger.get_kaspy_tools_logger()
+
+DEFAULT_JOURNAL_DEPTH = 1000     # number of chain blocks that can be rolled back without a full resync
+
+
+class UtxoTracker:
+    def __init__(self, journal_depth=DEFAULT_JOURNAL_DEPTH):
+        """
+        :param journal_depth: How many of the last chain blocks keep undo data
+        """
+        self.utxo_set = UtxoSet()
+        self.last_chain_hash = None     # None: nothing was processed yet (sync starts from genesis)
+        self.journal_depth = journal_depth
+        # undo journal, oldest first: [chain block hash, UtxoSet journal records] for each applied block
+        self._journal = []
+        self._journal_base_hash = None     # the chain block right before the first journal entry
+
+    # ========== Sync Methods ========== #
+
+    def sync(self, conn=None):
+        """
+        Bring the utxo set up to date with the node selected parent chain.
+        :param conn: A connection to the kaspad
+        :return: (number of chain blocks added, number of chain blocks rolled back)
+        """
+        added_count = 0
+        removed_count = 0
+        while True:
+            result = json_rpc_requests.get_chain_from_block(start_hash=self.last_chain_hash, conn=conn,
+                                                            include_blocks=True)['result']
+            removed_hashes = result.get('removedChainBlockHashes') or []
+            added_chain_blocks = result.get('addedChainBlocks') or []
+            if removed_hashes:
+                if not self.rollback(removed_hashes):
+                    KT_logger.warning('utxo tracker: rollback deeper than the journal, doing a full resync')
+                    self.reset()
+                    continue
+                removed_count += len(removed_hashes)
+            if not added_chain_blocks:
+                break
+            verbose_blocks = {block['hash']: block for block in result.get('blocks') or [] if 'rawRx' in block}
+            for chain_block in added_chain_blocks:
+                self.apply_chain_block(chain_block, verbose_blocks, conn=conn)
+            added_count += len(added_chain_blocks)
+        KT_logger.debug(f'utxo tracker: {added_count} chain blocks added, {removed_count} rolled back, '
+                        f'{len(self.utxo_set)} utxos')
+        return added_count, removed_count
+
+    def apply_chain_block(self, chain_block, verbose_blocks, conn=None):
+        """
+        Apply the transactions accepted by a chain block, and journal what is needed to undo them.
+        :param chain_block: An element of addedChainBlocks: {'hash': ..., 'acceptedBlocks': [...]}
+        :param verbose_blocks: A dictionary of verbose blocks (by hash). Missing blocks are requested from the node
+        :param conn: A connection to the kaspad
+        :return: None
+        """
+        journal = []
+        for accepted_block in chain_block['acceptedBlocks']:
+            verbose_block = verbose_blocks.get(accepted_block['hash'])
+            if verbose_block is None:
+                verbose_block = json_rpc_requests.get_block_request(block_hash=accepted_block['hash'], conn=conn,
+                                                                    verbose_tx=True)['result']
+            accepted_tx_ids = set(accepted_block['acceptedTxIds'])
+            for tx in verbose_block['rawRx']:
+                if tx['txId'] not in accepted_tx_ids:
+                    continue
+                if tx['subnetwork'] != kaspy_tools.kaspa_model.tx.COINBASE_SUBNETWORK:
+                    for vin in tx['vin']:
+                        self.utxo_set.spend((vin['txId'], vin['vout']), journal)
+                dnld_utxo_set_command.add_tx_outputs(tx, self.utxo_set, journal)
+        self._journal.append([chain_block['hash'], journal])
+        if len(self._journal) > self.journal_depth:
+            self._journal_base_hash = self._journal.pop(0)[0]
+        self.last_chain_hash = chain_block['hash']
+
+    def rollback(self, removed_hashes):
+        """
+        Undo the chain blocks that left the selected parent chain.
+        :param removed_hashes: removedChainBlockHashes, as returned by getChainFromBlock
+        :return: True if all of them were undone, False if the journal is not deep enough
+        """
+        removed_hashes = set(removed_hashes)
+        journal_hashes = {journal_entry[0] for journal_entry in self._journal}
+        if not removed_hashes <= journal_hashes:
+            return False
+        while self._journal and self._journal[-1][0] in removed_hashes:
+            chain_hash, journal = self._journal.pop()
+            self.utxo_set.rollback(journal)
+            removed_hashes.discard(chain_hash)
+        if removed_hashes:      # the removed blocks were not the tip of the journal
+            return False
+        self.last_chain_hash = self._journal[-1][0] if self._journal else self._journal_base_hash
+        return True
+
+    def reset(self):
+        """
+        Forget everything: the next sync starts from genesis.
+        :return: None
+        """
+        self.utxo_set = UtxoSet()
+        self.last_chain_hash = None
+        self._journal = []
+        self._journal_base_hash = None
+
+    # ========== Save and Load ========== #
+
+    @staticmethod
+    def _entry_to_json(entry):
+        output = entry['output']
+        return [output.get_tx_id(), output.get_out_index(), output.get_value(),
+                bytes(output.get_script_pub_key()).hex(), entry['used']]
+
+    @staticmethod
+    def _entry_from_json(json_entry):
+        tx_id, out_index, value, script_hex, used = json_entry
+        script_pub_key = tx_script.TxScript.parse_tx_script(raw_script=script_hex)
+        output = tx_out.TxOut.tx_out_factory(value=value, script_pub_key=script_pub_key, tx_id=tx_id,
+                                             out_index=out_index)
+        return {'output': output, 'used': used}
+
+    @classmethod
+    def _journal_to_json(cls, journal):
+        return [[JOURNAL_ADD, list(record[1]), None if record[2] is None else cls._entry_to_json(record[2])]
+                if record[0] == JOURNAL_ADD else [record[0], cls._entry_to_json(record[1])]
+                for record in journal]
+
+    @classmethod
+    def _journal_from_json(cls, json_journal):
+        return [(JOURNAL_ADD, tuple(record[1]), None if record[2] is None else cls._entry_from_json(record[2]))
+                if record[0] == JOURNAL_ADD else (record[0], cls._entry_from_json(record[1]))
+                for record in json_journal]
+
+    def save(self, file_name):
+        """
+        Save the tracker state (utxo set, last chain block and journal) into a json file.
+        The file is replaced atomically, so an interrupted save keeps the previous state.
+        :param file_name: The file to write
+        :return: None
+        """
+        state = {
+            'last_chain_hash': self.last_chain_hash,
+            'journal_depth': self.journal_depth,
+            'journal_base_hash': self._journal_base_hash,
+            'utxos': [self._entry_to_json(entry) for entry in self.utxo_set],
+            'journal': [[chain_hash, self._journal_to_json(journal)] for chain_hash, journal in self._journal],
+        }
+        temp_file_name = file_name + '.tmp'
+        with open(temp_file_name, 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(temp_file_name, file_name)
+
+    @classmethod
+    def load(cls, file_name, journal_depth=DEFAULT_JOURNAL_DEPTH):
+        """
+        Load a tracker saved by save(). If the file does not exist, return a new (empty) tracker.
+        :param file_name: The file to read
+        :param journal_depth: Used only when the file does not exist
+        :return: UtxoTracker object
+        """
+        if not os.path.exists(file_name):
+            return cls(journal_depth)
+        with open(file_name, 'r') as state_file:
+            state = json.load(state_file)
+        tracker = cls(state['journal_depth'])
+        tracker.last_chain_hash = state['last_chain_hash']
+        tracker._journal_base_hash = state['journal_base_hash']
+        for json_entry in state['utxos']:
+            tracker.utxo_set.restore(cls._entry_from_json(json_entry))
+        for chain_hash, json_journal in state['journal']:
+            tracker._journal.append([chain_hash, cls._journal_from_json(json_journal)])
+        return tracker
+
+
+def sync_utxo_set(state_file, conn=None, journal_depth=DEFAULT_JOURNAL_DEPTH):
+    """
+    Load the tracker saved in state_file (if any), sync it with the node, and save it back.
+    :param state_file: The file that keeps the tracker state between runs
+    :param conn: A connection to the kaspad
+    :param journal_depth: How many of the last chain blocks keep undo data (for a new tracker)
+    :return: The up to date utxo set (UtxoSet)
+    """
+    tracker = UtxoTracker.load(state_file, journal_depth)
+    tracker.sync(conn=conn)
+    tracker.save(state_file)
+    return tracker.utxo_set
@@ -48,6 +48,30 @@ def check_if_in_mempool(tx_id, conn):
     :return: response_json or None
     """
     in_mempool = json_rpc_requests.get_mempool_entry_request(tx_id, conn)
+    return mempool_entry_from_response(in_mempool)
+
+
+def check_many_in_mempool(tx_ids, conn, batch_size=json_rpc_requests.DEFAULT_BATCH_SIZE):
+    """
+    Batch version of check_if_in_mempool: checks many txIDs with a few json-rpc batch requests.
+    Will raise if one of the txs is conflicting or invalid.
+
+    :param tx_ids: A list of txIDs as hex.
+    :param conn: the RPC connection.
+    :param batch_size: Number of txIDs checked per request
+    :return: A dictionary: txID -> tx json, or None if the tx is not in the mempool
+    """
+    responses = json_rpc_requests.get_mempool_entries_batch(tx_ids, conn=conn, batch_size=batch_size)
+    return {tx_id: mempool_entry_from_response(in_mempool) for tx_id, in_mempool in zip(tx_ids, responses)}
+
+
+def mempool_entry_from_response(in_mempool):
+    """
+    Checks a getMempoolEntry response (see check_if_in_mempool).
+
+    :param in_mempool: The response_json of a getMempoolEntry request
+    :return: The tx json, or None if the tx is not in the mempool
+    """
     if in_mempool['result']:
         if in_mempool['error']:
             raise ValueError(f'Got both result and error in the response: {in_mempool}')
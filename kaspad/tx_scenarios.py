@@ -2,7 +2,7 @@
 Some 'higher level' transaction scenarios.
 """
 from kaspy_tools.logs import config_logger
-from kaspy_tools.kaspad.kaspa_dags.dnld_utxo_set_command import download_utxo_set
+from kaspy_tools.kaspad.kaspa_dags.dnld_utxo_set_command import stream_utxo_set_from_raw_blocks
 from kaspy_tools.kaspad.utilities.make_transactions_command import make_new_transactions
 from kaspy_tools.kaspa_model.kaspa_address import make_addresses
 from kaspy_tools.kaspad.utilities.coinbase_info import CoinbaseInfo
@@ -10,29 +10,28 @@ from kaspy_tools.kaspad.kaspa_dags.dag_tools import find_in_dag
 
 KT_logger = config_logger.get_kaspy_tools_logger()
 
-def generate_transactions_from_dag(*, addr_count=100, tx_count=100, block_count=None, miner_address, conn=None):
+def generate_transactions_from_dag(*, addr_count=100, tx_count=100, miner_address, conn=None):
     """
     Generate transaction based on a DAG already submitted.
+    The utxo set of the whole DAG is computed while the blocks are streamed (the blocks are not kept).
     :param addr_count: How many new parivate addresses to create
     :param tx_count: How many transactions to create
-    :param block_count: How many blocks to use as a basis for the creation
     :param conn: A connection to the kaspad
-    :return: A tupple: (list of TXs, all vblocks used, list of addresses used)
+    :return: A tupple: (list of TXs, list of addresses used)
     """
     addresses = make_addresses(addr_count)          # make new addresses (dictionary)
     addresses[miner_address.get_address()] = miner_address
 
-    # download all blocks
-    utxo_list, v_blocks, r_blocks = download_utxo_set(block_count, conn=conn)
+    utxo_set = stream_utxo_set_from_raw_blocks(conn=conn)
 
-    tx_list = make_new_transactions(count=tx_count, utxo_list=utxo_list, addresses=addresses)
-    return tx_list, v_blocks, addresses
+    tx_list = make_new_transactions(count=tx_count, utxo_list=utxo_set, addresses=addresses)
+    return tx_list, addresses
 
 def generate_double_spend_tx_pair(*, conn=None, miner_address):
     addresses = make_addresses(5)
     addresses[miner_address.get_address()] = miner_address
-    # download all blocks
-    utxo_list, v_blocks, r_blocks = download_utxo_set(block_count=300, conn=conn)
+    utxo_set = stream_utxo_set_from_raw_blocks(conn=conn)
+    utxo_list = utxo_set.entries()
     utxo_list_a = utxo_list[1:3]                    # [0,1]
     utxo_list_b = [utxo_list[1], utxo_list[3]]    # [0,2]
 
@@ -40,7 +39,7 @@ def generate_double_spend_tx_pair(*, conn=None, miner_address):
     for utxo in utxo_list_a:
         utxo['used'] = False
     tx_list2 = make_new_transactions(count=1, utxo_list=utxo_list_b, addresses = addresses, in_count=2)
-    return tx_list1+tx_list2, v_blocks
+    return tx_list1+tx_list2
 
 
 def validate_coinbase_of_three(conn=None):
@@ -1,21 +1,30 @@
 """
 This module holds the methods that handle the process of generating valid and invalid blocks for the automation project.
 """
-
+import os
 from kaspy_tools.kaspa_model.block import Block
 from kaspy_tools.utils import general_utils
 from kaspy_tools.kaspad.utilities import updater
 from kaspy_tools.kaspad.json_rpc import json_rpc_requests
 
+EXTRA_NONCE_SIZE = 8    # bytes appended to the coinbase payload of sibling blocks
+
 
 # ========== Block generator methods ========== #
 
-def generate_valid_block_from_template(*, pay_address=None, conn, native_txs=None, netprefix='kaspadev'):
+def generate_valid_block_from_template(*, pay_address=None, conn, native_txs=None, netprefix='kaspadev',
+                                       mining_processes=1):
+    """
+    Builds a valid block from a block template received from the node.
+    :param mining_processes: Number of processes used to find the nonce (see updater.update_nonce).
+                             Use more than 1 (or None for one per CPU) on devnet difficulty.
+    :return: The block (bytes) & block hash (bytes)
+    """
     new_block = Block.block_factory()
     block_template = json_rpc_requests.get_block_template_request(conn=conn, pay_address=pay_address,
                                                                   netprefix=netprefix)['result']
     updater.update_all_valid_block_variables(new_block, block_template, conn=conn, native_txs=native_txs,
-                                             netprefix=netprefix)
+                                             netprefix=netprefix, mining_processes=mining_processes)
     block_header = new_block.block_header_bytes
     block_hash = general_utils.hash_256(block_header)
     reversed_block_hash = general_utils.reverse_bytes(block_hash)
@@ -24,6 +33,34 @@ def generate_valid_block_from_template(*, pay_address=None, conn, native_txs=Non
     return valid_block, reversed_block_hash
 
 
+def generate_sibling_blocks_from_template(block_count, *, pay_address=None, conn, native_txs=None,
+                                          netprefix='kaspadev', mining_processes=1):
+    """
+    Builds block_count valid blocks from a single block template: all of them have the template tips as parents.
+    The blocks differ by the extra data of their coinbase payload (a random extra nonce) and by their nonce, and
+    only the hash merkle root is computed again for each of them, so there is one getBlockTemplate request for
+    all the blocks.
+    :param block_count: Number of blocks to build
+    :param native_txs: A list of native transactions to include (in every block)
+    :param mining_processes: Number of processes used to find the nonce (see updater.update_nonce)
+    :return: A list of (block (bytes), block hash (bytes)) tuples
+    """
+    new_block = Block.block_factory()
+    block_template = json_rpc_requests.get_block_template_request(conn=conn, pay_address=pay_address,
+                                                                  netprefix=netprefix)['result']
+    updater.update_all_valid_block_variables_but_nonce(new_block, block_template, native_txs=native_txs)
+    coinbase_tx_bytes = bytes.fromhex(block_template['transactions'][0]['data'])
+    sibling_blocks = []
+    for _ in range(block_count):
+        updater.update_coinbase_extra_nonce(new_block, coinbase_tx_bytes, os.urandom(EXTRA_NONCE_SIZE))
+        updater.update_nonce(new_block, mining_processes=mining_processes)
+        block_header = new_block.block_header_bytes
+        reversed_block_hash = general_utils.reverse_bytes(general_utils.hash_256(block_header))
+        sibling_blocks.append((Block.rebuild_block(block_header, new_block.get_block_body_bytes_array()),
+                               reversed_block_hash))
+    return sibling_blocks
+
+
 def generate_modified_block_and_hash(*, variable_str, options=None, invalid_arg_type=None, netprefix='kaspadev',
                                      conn=None):
     """
@@ -0,0 +1,288 @@
+"""
+A pipelined block producer: template fetching, mining and submission run at the same time.
+
+    template stage (thread)  ->  build stage (thread)  ->  mining (process pool)  ->  submit stage (thread)
+
+- Every stage is connected to the next one by a bounded queue: a stage that gets ahead of the next one blocks
+  on the full queue (back-pressure), so the pipeline runs at the speed of its slowest stage.
+- The build stage builds siblings_per_template blocks from each template (see
+  block_generator.generate_sibling_blocks_from_template), and hands their header prefixes to the process pool.
+  At most max_mining_blocks blocks are being mined (or are waiting to be submitted) at any time.
+- Blocks are built on the tips of their template. A template may be a little behind the node (by the blocks
+  that are still in the pipeline), so the DAG is a bit wider than with the sequential generator.
+- Each stage counts its blocks and their latency (see StageCounters), get them with BlockPipeline.stats().
+  The counters (and the accepted hashes) are those of the last run: they are reset when run starts.
+
+    pipeline = BlockPipeline(conn, mining_processes=4)
+    pipeline.run(10000)
+    print(pipeline.stats())
+"""
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from kaspy_tools.logs import config_logger
+from kaspy_tools.kaspa_model.block import Block
+from kaspy_tools.kaspad import kaspad_constants
+from kaspy_tools.kaspad.json_rpc import json_rpc_requests
+from kaspy_tools.kaspad.utilities import block_generator
+from kaspy_tools.kaspad.utilities import nonce_miner
+from kaspy_tools.kaspad.utilities import updater
+
+KT_logger = config_logger.get_kaspy_tools_logger()
+
+TEMPLATE_QUEUE_SIZE = 2         # templates fetched ahead of the build stage
+SIBLINGS_PER_TEMPLATE = 1
+STAGE_NAMES = ('template', 'build', 'mine', 'submit')
+_STOP = object()                # end of stream marker, passed from stage to stage
+
+
+class StageCounters:
+    """
+    Counters of a pipeline stage: number of items, and their latency (time spent on each item).
+    Updated by the stage thread only, read by any thread.
+    """
+    __slots__ = ('name', 'count', 'errors', 'total_latency', 'max_latency')
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency, error=False):
+        """
+        :param latency: Time spent on one item (seconds)
+        :param error: True if the item failed
+        """
+        self.count += 1
+        self.errors += error
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def as_dict(self, elapsed):
+        """
+        :param elapsed: Time since the pipeline started (seconds)
+        :return: A dictionary of the counters, with the throughput (items per second) and mean latency
+        """
+        return {'count': self.count, 'errors': self.errors,
+                'throughput': self.count / elapsed if elapsed > 0 else 0.0,
+                'mean_latency': self.total_latency / self.count if self.count else 0.0,
+                'max_latency': self.max_latency, 'total_latency': self.total_latency}
+
+
+class BlockPipeline:
+    def __init__(self, conn, *, mining_processes=None, siblings_per_template=SIBLINGS_PER_TEMPLATE,
+                 max_mining_blocks=None, template_queue_size=TEMPLATE_QUEUE_SIZE, pay_address=None,
+                 netprefix='kaspasim', native_txs=None):
+        """
+        :param conn: The node connection
+        :param mining_processes: Number of mining processes (default: number of CPUs)
+        :param siblings_per_template: Number of blocks built from each template
+        :param max_mining_blocks: Max number of blocks between the build stage and the submit stage
+                                  (default: 2 per mining process)
+        :param template_queue_size: Max number of templates fetched ahead
+        :param pay_address: A KaspaAddress for the coinbase (None for a random one)
+        :param native_txs: A list of native transactions to include in every block
+        """
+        self._conn = conn
+        self._mining_processes = mining_processes or os.cpu_count() or 1
+        self._siblings_per_template = siblings_per_template
+        self._max_mining_blocks = max_mining_blocks or 2 * self._mining_processes
+        self._template_queue_size = template_queue_size
+        self._pay_address = pay_address
+        self._netprefix = netprefix
+        self._native_txs = native_txs
+        self._start_time = None
+        self._end_time = None
+        self._stop_event = threading.Event()
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self._counters = {name: StageCounters(name) for name in STAGE_NAMES}
+        self._errors = []
+        self.submitted_hashes = []
+
+    # ========== Stages ========== #
+
+    def _template_stage(self, template_count, template_queue):
+        counters = self._counters['template']
+        for _ in range(template_count):
+            if self._stop_event.is_set():
+                break
+            stage_start = time.perf_counter()
+            response_json = json_rpc_requests.get_block_template_request(conn=self._conn,
+                                                                         pay_address=self._pay_address,
+                                                                         netprefix=self._netprefix)
+            counters.record(time.perf_counter() - stage_start, error=response_json['result'] is None)
+            if response_json['result'] is None:
+                raise RuntimeError(f'getBlockTemplate failed: {response_json["error"]}')
+            self._put(template_queue, response_json['result'])
+
+    def _build_stage(self, block_count, template_queue, mined_queue, executor):
+        counters = self._counters['build']
+        while block_count > 0:
+            block_template = self._get(template_queue)
+            if block_template is _STOP:
+                break
+            coinbase_tx_bytes = bytes.fromhex(block_template['transactions'][0]['data'])
+            for _ in range(min(self._siblings_per_template, block_count)):
+                stage_start = time.perf_counter()
+                # a new block object for each sibling (the previous ones are still being mined). The extra nonce
+                # keeps the coinbase txs distinct, also between templates that have the same tips
+                new_block = Block.block_factory()
+                updater.update_all_valid_block_variables_but_nonce(new_block, block_template,
+                                                                   native_txs=self._native_txs)
+                updater.update_coinbase_extra_nonce(new_block, coinbase_tx_bytes,
+                                                    os.urandom(block_generator.EXTRA_NONCE_SIZE))
+                header_prefix, _ = nonce_miner.split_header(new_block)
+                mining_future = executor.submit(nonce_miner.search_nonce, header_prefix, new_block.target_int,
+                                                random.randint(0, kaspad_constants.MAX_UINT64))
+                counters.record(time.perf_counter() - stage_start)
+                self._put(mined_queue, (new_block, mining_future, time.perf_counter()))
+                block_count -= 1
+
+    def _submit_stage(self, mined_queue):
+        mine_counters = self._counters['mine']
+        submit_counters = self._counters['submit']
+        while True:
+            item = self._get(mined_queue)
+            if item is _STOP:
+                break
+            new_block, mining_future, mining_start = item
+            nonce, hashes_done = mining_future.result()
+            mine_counters.record(time.perf_counter() - mining_start, error=nonce is None)
+            if nonce is None:
+                raise RuntimeError('No nonce found in the whole nonce space')
+            new_block.nonce_int = nonce
+
+            stage_start = time.perf_counter()
+            block_header = new_block.block_header_bytes
+            block_bytes = Block.rebuild_block(block_header, new_block.get_block_body_bytes_array())
+            response, response_json = json_rpc_requests.submit_block_request(block_bytes.hex(), conn=self._conn)
+            failed = response_json['result'] is not None or response_json.get('error') is not None
+            submit_counters.record(time.perf_counter() - stage_start, error=failed)
+            if failed:
+                KT_logger.error('Block submit failed: %s %s', response_json['result'], response_json.get('error'))
+            else:
+                self.submitted_hashes.append(new_block.block_header_hash_bytes.hex())
+
+    # ========== Queues & threads ========== #
+
+    def _put(self, stage_queue, item):
+        """
+        Put with back-pressure: blocks while the queue is full, unless the pipeline is stopped.
+        """
+        while not self._stop_event.is_set():
+            try:
+                stage_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _get(self, stage_queue):
+        """
+        :return: The next item, or _STOP when the previous stage ended (or the pipeline is stopped)
+        """
+        while not self._stop_event.is_set():
+            try:
+                return stage_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _STOP
+
+    @staticmethod
+    def _cancel_mining(mined_queue):
+        """
+        Cancel the mining futures of the blocks left in mined_queue, so that the executor does not run them.
+        """
+        while True:
+            try:
+                item = mined_queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _STOP:
+                item[1].cancel()
+
+    def _run_stage(self, stage, output_queue, *args):
+        """
+        The body of a stage thread: run the stage, then pass _STOP to the next stage.
+        An exception stops the whole pipeline (it is raised again by run).
+        """
+        try:
+            stage(*args)
+        except Exception as error:
+            KT_logger.error('Block pipeline stage %s failed: %s', stage.__name__, error)
+            self._errors.append(error)
+            self._stop_event.set()
+        finally:
+            if output_queue is not None:
+                self._put(output_queue, _STOP)
+
+    def run(self, block_count):
+        """
+        Produce block_count blocks: build, mine and submit them.
+        :param block_count: Number of blocks
+        :return: A list of the hashes (hex) of the blocks of this run that were accepted by the node
+        """
+        template_queue = queue.Queue(maxsize=self._template_queue_size)
+        mined_queue = queue.Queue(maxsize=self._max_mining_blocks)
+        template_count = -(-block_count // self._siblings_per_template)
+        self._stop_event.clear()
+        self._reset_counters()
+        self._start_time = time.perf_counter()
+        self._end_time = None
+        with ProcessPoolExecutor(max_workers=self._mining_processes) as executor:
+            threads = [threading.Thread(target=self._run_stage, name='pipeline_template', daemon=True,
+                                        args=(self._template_stage, template_queue, template_count,
+                                              template_queue)),
+                       threading.Thread(target=self._run_stage, name='pipeline_build', daemon=True,
+                                        args=(self._build_stage, mined_queue, block_count, template_queue,
+                                              mined_queue, executor)),
+                       threading.Thread(target=self._run_stage, name='pipeline_submit', daemon=True,
+                                        args=(self._submit_stage, None, mined_queue))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            if self._errors:
+                self._cancel_mining(mined_queue)
+        self._end_time = time.perf_counter()
+        KT_logger.info('Block pipeline: %s', self.stats())
+        if self._errors:
+            raise self._errors[0]
+        return self.submitted_hashes
+
+    def stop(self):
+        """
+        Stop the pipeline (from another thread). Blocks that are in the pipeline are dropped.
+        """
+        self._stop_event.set()
+
+    # ========== Counters ========== #
+
+    def stats(self):
+        """
+        :return: A dictionary: stage name -> its counters (see StageCounters.as_dict), of the last (or current) run
+        """
+        if self._start_time is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self._end_time or time.perf_counter()) - self._start_time
+        return {name: counters.as_dict(elapsed) for name, counters in self._counters.items()}
+
+
+def run_block_pipeline(block_count, conn, **pipeline_options):
+    """
+    Build, mine and submit block_count blocks with a BlockPipeline.
+    :param block_count: Number of blocks
+    :param conn: The node connection
+    :param pipeline_options: BlockPipeline options (mining_processes, siblings_per_template, ...)
+    :return: (hashes of the accepted blocks, the stage counters)
+    """
+    pipeline = BlockPipeline(conn, **pipeline_options)
+    block_hashes = pipeline.run(block_count)
+    return block_hashes, pipeline.stats()
@@ -26,8 +26,21 @@ class CoinbaseInfo:
                 self._paid_blocks[accepted_block['hash']] = PaidBlockInfo(accepted_block['hash'],
                                                 accepted_tx_hash_list=accepted_block['acceptedTxIds'],
                                                 conn=self.conn)
+            self.fetch_paid_blocks_transactions()
         return self._paid_blocks
 
+    def fetch_paid_blocks_transactions(self):
+        """
+        Get the transactions of all the paid blocks with one batch request (instead of a request per block).
+        :return: None
+        """
+        paid_blocks = list(self._paid_blocks.values())
+        responses = json_rpc_requests.get_blocks_batch([paid_block.block_hash for paid_block in paid_blocks],
+                                                       conn=self.conn, verbose_tx=True)
+        for paid_block, response_json in zip(paid_blocks, responses):
+            if response_json['result'] is not None:
+                paid_block.set_fields_from_block(response_json['result'])
+
     @paid_blocks.setter
     def paid_blocks(self, paid_blocks):
         self._paid_blocks = paid_blocks
@@ -61,9 +74,17 @@ class PaidBlockInfo:
     def update_fields(self):
         my_block = json_rpc_requests.get_block_request(block_hash=self.block_hash, conn=self.conn,
                                                        verbose_tx=True)['result']
+        return self.set_fields_from_block(my_block)
+
+    def set_fields_from_block(self, my_block):
+        """
+        :param my_block: The verbose block (with verbose txs) of this paid block
+        :return: The accepted transactions (dictionary: tx hex -> tx json)
+        """
         self._accepted_transactions = {}
         for tx in my_block['rawRx']:
             if tx['hex'] not in self._accepted_transactions:
                 self._accepted_transactions[tx['hex']] = tx
+        return self._accepted_transactions
 
         
@@ -12,6 +12,7 @@ from kaspy_tools.kaspa_model import tx_in
 import kaspy_tools.kaspa_model.tx_out
 from kaspy_tools.kaspa_model import tx_script
 from kaspy_tools.kaspa_model import kaspa_address
+from kaspy_tools.kaspa_model.utxo_set import UtxoSet
 from kaspy_tools.kaspa_crypto.kaspa_keys import KaspaKeys
 from kaspy_tools.kaspa_crypto import format_conversions
 from kaspy_tools.kaspa_crypto.schnorr_sing_key import ECKey
@@ -169,12 +170,14 @@ def find_utoxs_with_known_private_keys(in_count, utxo_list, addresses):
     """
     Search for in_count unused utxo to be used as inputs, and mark them as used.
     :param in_count:     Count of utxo to look for
-    :param utxo_list:    A dictionary with all utxo
+    :param utxo_list:    A UtxoSet, or a list of utxo entries
     :return:             chosem unused_utxos, total_value (for theswe utxo)
     """
+    hashed_public_keys = {addr.get_public_key_hash() for addr in addresses.values()}
+    if isinstance(utxo_list, UtxoSet):     # use the per owner free lists
+        return utxo_list.take_unused(in_count, hashed_public_keys)
     utxo_list_with_known_keys = []
     total_value = 0
-    hashed_public_keys = [addr.get_public_key_hash() for addr in addresses.values()]
     #for utxo_key, utxo_val in utxo_list.items():
     for utxo_val in utxo_list:
         pub_hash_bytes = utxo_val['output'].get_script_pub_key().get_pubhash_bytes()
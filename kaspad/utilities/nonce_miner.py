@@ -0,0 +1,219 @@
+"""
+This module holds the nonce search (mining) engine used by the updater.
+The block header is serialized once. The nonce is the last field of the header, so everything before it is a
+constant prefix: its SHA-256 state (the "midstate") is computed once, and for each nonce the state is copied
+(hashlib copy()) and only the 8 nonce bytes are hashed. The hash is compared against a precomputed target.
+
+mine_block_parallel splits the nonce space into chunks, searched by a persistent pool of worker processes
+(a ProcessPoolExecutor that is started on first use and kept for the next blocks, so a block does not pay for
+starting processes). Chunks are handed out in order from start_nonce, with at most one chunk per worker in
+flight: as soon as a chunk finds a nonce, no more chunks are handed out, and the chunks still waiting are
+cancelled. A worker that dies breaks the pool: the search raises (and the next search starts a new pool).
+"""
+
+import hashlib
+import os
+import random
+import struct
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from kaspy_tools.logs import config_logger
+from kaspy_tools.kaspad import kaspad_constants
+
+KT_logger = config_logger.get_kaspy_tools_logger()
+
+NONCE_SIZE = 8
+PARALLEL_CHUNK_SIZE = 2 ** 15    # nonces per chunk: how long a worker may run after another one found a nonce
+NONCE_SPACE = 2 ** 64
+MAX_HASH = 2 ** 256 - 1
+pack_nonce = struct.Struct('<Q').pack
+
+_mining_pool = None             # the persistent pool of mine_block_parallel (see get_mining_pool)
+_mining_pool_processes = 0
+_mining_pool_lock = threading.Lock()
+
+
+def split_header(block_object):
+    """
+    Serialize the block header once, and split it into the constant prefix and the nonce.
+    :param block_object: A Block object
+    :return: (header prefix as bytes, nonce as bytes)
+    """
+    header = block_object.block_header_bytes
+    return header[:-NONCE_SIZE], header[-NONCE_SIZE:]
+
+
+def search_nonce(header_prefix, target, start_nonce=0, count=NONCE_SPACE, below_target=True):
+    """
+    Look for a nonce in [start_nonce, start_nonce + count) (wrapping around the 64 bit nonce space).
+    :param header_prefix: The block header without the nonce (bytes)
+    :param target: The target (int). The block hash is read as a little endian number, like Block.block_header_hash
+    :param start_nonce: The first nonce to try
+    :param count: How many nonces to try
+    :param below_target: True to look for a valid hash (hash < target), False for an invalid one (hash >= target)
+    :return: (nonce found or None, number of hashes computed)
+    """
+    midstate = hashlib.sha256(header_prefix)
+    sha256 = hashlib.sha256
+    # the hash as a little endian number is smaller than target exactly when the reversed digest is
+    # smaller than target as big endian bytes, so bytes are compared without building an int
+    target_bytes = min(max(target, 0), MAX_HASH).to_bytes(32, 'big')
+    end_nonce = start_nonce + count
+    nonce_ranges = [range(start_nonce, min(end_nonce, NONCE_SPACE))]
+    if end_nonce > NONCE_SPACE:
+        nonce_ranges.append(range(0, min(end_nonce - NONCE_SPACE, start_nonce)))
+
+    hashes_done = 0
+    for nonce_range in nonce_ranges:
+        if below_target:
+            for nonce in nonce_range:
+                header_hash = midstate.copy()
+                header_hash.update(pack_nonce(nonce))
+                if sha256(header_hash.digest()).digest()[::-1] < target_bytes:
+                    return nonce, hashes_done + nonce - nonce_range.start + 1
+        else:
+            for nonce in nonce_range:
+                header_hash = midstate.copy()
+                header_hash.update(pack_nonce(nonce))
+                if sha256(header_hash.digest()).digest()[::-1] >= target_bytes:
+                    return nonce, hashes_done + nonce - nonce_range.start + 1
+        hashes_done += len(nonce_range)
+    return None, hashes_done
+
+
+def mine_block(block_object, start_nonce=None, below_target=True):
+    """
+    Find a nonce for block_object and set it.
+    :param block_object: The block to mine (all fields but the nonce must be final)
+    :param start_nonce: The first nonce to try (random if None)
+    :param below_target: True to look for a valid hash, False to look for an invalid one
+    :return: New nonce as bytes
+    """
+    if start_nonce is None:
+        start_nonce = random.randint(0, kaspad_constants.MAX_UINT64)
+    header_prefix, _ = split_header(block_object)
+    start_time = time.perf_counter()
+    nonce, hashes_done = search_nonce(header_prefix, block_object.target_int, start_nonce,
+                                      below_target=below_target)
+    if nonce is None:
+        raise RuntimeError('No nonce found in the whole nonce space')
+    elapsed = time.perf_counter() - start_time
+    KT_logger.debug(f'mining loop:{hashes_done} ({hashes_per_second(hashes_done, elapsed):.0f} H/s)')
+    block_object.nonce_int = nonce
+    return block_object.nonce_bytes
+
+
+def get_mining_pool(processes=None):
+    """
+    :param processes: Number of worker processes (default: number of CPUs)
+    :return: The persistent mining pool (ProcessPoolExecutor), started (or restarted with the new number of
+             processes) if needed
+    """
+    global _mining_pool, _mining_pool_processes
+    processes = processes or os.cpu_count() or 1
+    with _mining_pool_lock:
+        if _mining_pool is None or _mining_pool_processes != processes:
+            if _mining_pool is not None:
+                _mining_pool.shutdown(wait=False)
+            _mining_pool = ProcessPoolExecutor(max_workers=processes)
+            _mining_pool_processes = processes
+        return _mining_pool
+
+
+def shutdown_mining_pool():
+    """
+    Stop the worker processes of the persistent mining pool (a new pool is started on the next use).
+    Callers cancel their own pending futures first (see search_nonce_parallel).
+    """
+    global _mining_pool, _mining_pool_processes
+    with _mining_pool_lock:
+        if _mining_pool is not None:
+            _mining_pool.shutdown(wait=True)
+        _mining_pool = None
+        _mining_pool_processes = 0
+
+
+def cancel_futures(futures):
+    """
+    Cancel the futures that did not start yet (running ones are left to complete).
+    """
+    for future in futures:
+        future.cancel()
+
+
+def search_nonce_parallel(header_prefix, target, start_nonce=0, processes=None, below_target=True,
+                          chunk_size=PARALLEL_CHUNK_SIZE):
+    """
+    Parallel version of search_nonce: chunks of the nonce space are searched by the persistent mining pool.
+    :param header_prefix: The block header without the nonce (bytes)
+    :param target: The target (int)
+    :param start_nonce: The first nonce to try
+    :param processes: Number of worker processes (default: number of CPUs)
+    :param below_target: True to look for a valid hash, False for an invalid one
+    :param chunk_size: Number of nonces in a chunk
+    :return: (nonce found or None, number of hashes computed by the completed chunks, elapsed time in seconds)
+    """
+    processes = processes or os.cpu_count() or 1
+    pool = get_mining_pool(processes)
+    start_time = time.perf_counter()
+    chunk_count = -(-NONCE_SPACE // chunk_size)
+    next_chunk = 0
+    running = set()
+    found_nonce = None
+    hashes_done = 0
+    try:
+        while found_nonce is None and (running or next_chunk < chunk_count):
+            while next_chunk < chunk_count and len(running) < processes:
+                chunk_start = (start_nonce + next_chunk * chunk_size) % NONCE_SPACE
+                running.add(pool.submit(search_nonce, header_prefix, target, chunk_start,
+                                        min(chunk_size, NONCE_SPACE - next_chunk * chunk_size), below_target))
+                next_chunk += 1
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                nonce, chunk_hashes = future.result()     # raises BrokenProcessPool if a worker died
+                hashes_done += chunk_hashes
+                if nonce is not None and found_nonce is None:
+                    found_nonce = nonce
+    except BrokenProcessPool:
+        cancel_futures(running)
+        shutdown_mining_pool()
+        raise RuntimeError('A mining worker process died')
+    finally:
+        cancel_futures(running)
+    return found_nonce, hashes_done, time.perf_counter() - start_time
+
+
+def mine_block_parallel(block_object, processes=None, start_nonce=None, below_target=True):
+    """
+    Find a nonce for block_object using several processes, and set it.
+    The aggregate hashrate of the workers is reported in the log.
+    :param block_object: The block to mine (all fields but the nonce must be final)
+    :param processes: Number of worker processes (default: number of CPUs)
+    :param start_nonce: The first nonce to try (random if None)
+    :param below_target: True to look for a valid hash, False to look for an invalid one
+    :return: New nonce as bytes
+    """
+    if start_nonce is None:
+        start_nonce = random.randint(0, kaspad_constants.MAX_UINT64)
+    header_prefix, _ = split_header(block_object)
+    nonce, hashes_done, elapsed = search_nonce_parallel(header_prefix, block_object.target_int, start_nonce,
+                                                        processes=processes, below_target=below_target)
+    if nonce is None:
+        raise RuntimeError('No nonce found in the whole nonce space')
+    KT_logger.info(f'parallel mining: {hashes_done} hashes in {elapsed:.3f} s, '
+                   f'{hashes_per_second(hashes_done, elapsed):.0f} H/s')
+    block_object.nonce_int = nonce
+    return block_object.nonce_bytes
+
+
+def hashes_per_second(hashes_done, elapsed):
+    """
+    :param hashes_done: Number of hashes computed
+    :param elapsed: Time it took (in seconds)
+    :return: The hashrate (float)
+    """
+    if elapsed <= 0:
+        return 0.0
+    return hashes_done / elapsed
@@ -2,13 +2,13 @@
 This module holds all the UPDATE methods for the automation project.
 """
 
-import random
 from io import BytesIO
 import time
 from kaspy_tools.logs import config_logger
 from kaspy_tools.kaspa_crypto.merkle_root import MerkleTree
 from kaspy_tools.kaspad import kaspad_constants
 from kaspy_tools.kaspad.json_rpc import json_rpc_requests
+from kaspy_tools.kaspad.utilities import nonce_miner
 from kaspy_tools.kaspa_model.tx import Tx
 from kaspy_tools.utils import general_utils
 
@@ -16,7 +16,8 @@ KT_logger = config_logger.get_kaspy_tools_logger()
 
 # ========== Update Block Methods ========== #
 
-def update_all_valid_block_variables(block_object, block_template, conn=None, native_txs=None, netprefix='kaspadev'):
+def update_all_valid_block_variables(block_object, block_template, conn=None, native_txs=None, netprefix='kaspadev',
+                                     mining_processes=1):
     """
     Initiates the VALID updating process for the entire block
 
@@ -24,6 +25,20 @@ def update_all_valid_block_variables(block_object, block_template, conn=None, na
     :param block_template: Template from getBlockTemplate request
     :param conn: connection details
     :param native_txs: A list of native transactions to include
+    :param mining_processes: Number of processes used to find the nonce (see update_nonce)
+    """
+    update_all_valid_block_variables_but_nonce(block_object, block_template, native_txs=native_txs)
+    update_nonce(block_object, mining_processes=mining_processes)
+
+
+def update_all_valid_block_variables_but_nonce(block_object, block_template, native_txs=None):
+    """
+    Like update_all_valid_block_variables, without mining: the nonce is left for the caller (e.g: to build
+    several sibling blocks from one template, see update_coinbase_extra_nonce).
+
+    :param block_object: The block object that holds the variables to update
+    :param block_template: Template from getBlockTemplate request
+    :param native_txs: A list of native transactions to include
     """
     update_block_version(block_object, block_template)
     update_parent_blocks_data(block_object, block_template)
@@ -33,7 +48,6 @@ def update_all_valid_block_variables(block_object, block_template, conn=None, na
     update_utxo_commitment(block_object, block_template)
     update_timestamp(block_object, block_template)
     update_bits(block_object, block_template)
-    update_nonce(block_object)
 
 
 def update_block_variables_using_invalid_version_data(block_object, version_int, conn, netprefix='kaspadev',
@@ -311,10 +325,8 @@ def update_hash_merkle_root(block_object, block_template):
 
     :param block_object: The block object that holds the variable to update
     """
-    # txs_list = block_object.get_block_txs_list_for_hash_merkle_root()
-    txs_list = block_object.block_txs_list_as_bytes
-    hash_merkle_root_bytes = calculate_hash_merkle_root(txs_list)
-    block_object.hash_merkle_root_bytes = hash_merkle_root_bytes
+    # the block keeps its Merkle tree, so txs added later update the root incrementally
+    block_object.hash_merkle_root_bytes = block_object.hash_merkle_tree.root
 
 
 def update_id_merkle_root(block_object, block_template):
@@ -392,14 +404,16 @@ def update_bits_invalid(block_object, bits_value):
     block_object.bits_bytes = updated_bits_bytes
 
 
-def update_nonce(block_object):
+def update_nonce(block_object, mining_processes=1):
     """
     Updates the block object variable "nonce" based on the calculations required for find the correct block hash.
 
     :param block_object: The block object that holds the variable to update
+    :param mining_processes: Number of processes used to find the nonce. More than 1 mines with a pool of
+                             processes (see nonce_miner.mine_block_parallel), None uses one process per CPU.
     """
 
-    nonce = calculate_nonce(block_object)
+    nonce = calculate_nonce(block_object, processes=mining_processes)
     block_object.nonce_bytes = nonce
 
 
@@ -442,54 +456,49 @@ def update_coinbase_tx(block_template):
     return new_coinbase_tx
 
 
+def update_coinbase_extra_nonce(block_object, coinbase_tx_bytes, extra_nonce):
+    """
+    Replaces the coinbase tx of the block with a copy of coinbase_tx_bytes, with extra_nonce appended to the extra
+    data of its payload, and updates the hash merkle root (incrementally, only the coinbase leaf changes).
+    Blocks built from the same template get distinct coinbase txs (and tx ids) this way.
+
+    :param block_object: The block object that holds the variables to update
+    :param coinbase_tx_bytes: The template coinbase tx (bytes)
+    :param extra_nonce: Bytes to append to the coinbase payload
+    """
+    coinbase_tx_object = Tx.parse_tx_at(memoryview(coinbase_tx_bytes), 0)[0]
+    coinbase_tx_object.payload_bytes = coinbase_tx_object.payload_bytes + extra_nonce
+    block_object.coinbase_tx_obj = coinbase_tx_object
+    update_hash_merkle_root(block_object, None)
+
+
 def update_native_txs(tx_object):
     pass
 
 
 # ========== Calculate Nonce method ========== #
 
-def calculate_nonce(block_object):
+def calculate_nonce(block_object, processes=1):
     """
-    Looks for a hash that will be smaller than the target.
+    Looks for a hash that will be smaller than the target (see nonce_miner).
 
     :param block_object: The block header bytes parsed as a list
+    :param processes: Number of mining processes (1 mines in this process, None uses one process per CPU)
     :return: New nonce as bytes
     """
-    block_target = block_object.target_int
-    hash = block_object.block_header_hash
-    block_object.nonce_int = random.randint(0, kaspad_constants.MAX_UINT64)
-
-    small_target = block_target-1
-    loop_counter = 0
-    while hash > small_target:
-        block_object.nonce_int = (block_object.nonce_int + 1) % kaspad_constants.MAX_UINT64
-        hash = block_object.block_header_hash
-        loop_counter += 1
-
-    KT_logger.debug(f'mining loop:{loop_counter}')
-    return block_object.nonce_bytes
+    if processes == 1:
+        return nonce_miner.mine_block(block_object)
+    return nonce_miner.mine_block_parallel(block_object, processes=processes)
 
 
 def calculate_invalid_nonce(block_object):
     """
-    Looks for a hash that will be higher or equal to the target.
+    Looks for a hash that will be higher or equal to the target (see nonce_miner).
 
     :param block_object: The block header bytes parsed as a list
     :return: New nonce as bytes
     """
-    block_target = block_object.target_int
-    hash = block_object.block_header_hash
-    block_object.nonce_int = random.randint(0, kaspad_constants.MAX_UINT64)
-
-    small_target = block_target-1
-    loop_counter = 0
-    while hash < small_target:
-        block_object.nonce_int = (block_object.nonce_int + 1) % kaspad_constants.MAX_UINT64
-        hash = block_object.block_header_hash
-        loop_counter += 1
-
-    KT_logger.debug(f'mining loop:{loop_counter}')
-    return block_object.nonce_bytes
+    return nonce_miner.mine_block(block_object, below_target=False)
 
 # ========== Calculate Hash Merkle Root methods ========== #
 
@@ -0,0 +1,123 @@
+"""
+Scheduling of submit_dag_async, against a local stand-in for kaspad (LocalTransport).
+"""
+import asyncio
+from kaspy_tools.kaspa_model.block import Block
+from kaspy_tools.kaspa_model.tx import Tx, VERSION_1
+from kaspy_tools.kaspad.json_rpc.async_json_rpc_requests import AsyncJsonRpcClient, LocalTransport
+from kaspy_tools.kaspad.kaspa_dags.block_cartridge import block_hash_and_parents, save_blocks_cartridge
+from kaspy_tools.kaspad.kaspa_dags.dag_tools.dag_submitter import submit_dag_async
+from kaspy_tools.utils import general_utils
+
+COINBASE_SUBNETWORK_BYTES = b'\x00' * 19 + b'\x01'
+GENESIS_HASH = b'\x11' * 32       # a parent that the node already has
+
+
+def make_block(parent_hashes, tag):
+    """
+    :param parent_hashes: The parent hashes (bytes, as displayed)
+    :return: (block bytes, block hash bytes, as displayed)
+    """
+    payload = tag.encode()
+    coinbase_tx = Tx.tx_factory(version_bytes=VERSION_1, tx_in_list=[], tx_out_list=[], locktime_int=0,
+                                subnetwork_id_bytes=COINBASE_SUBNETWORK_BYTES, gas_bytes=bytes(8),
+                                payload_hash=general_utils.hash_256(payload), payload=payload)
+    # parent hashes are serialized in reversed byte order. The tag goes into the header too, so that sibling
+    # blocks have different hashes
+    block = Block.block_factory(num_of_parent_blocks=len(parent_hashes),
+                                parent_hashes=[parent_hash[::-1] for parent_hash in parent_hashes],
+                                hash_merkle_root_bytes=general_utils.hash_256(payload), id_merkle_root_bytes=bytes(32),
+                                utxo_commitment_bytes=bytes(32), timestamp_int=1600000000000,
+                                bits_bytes=bytes.fromhex('ffff7f20'), nonce_bytes=bytes(8),
+                                coinbase_tx_obj=coinbase_tx)
+    block_bytes = bytes(block)
+    return block_bytes, block_hash_and_parents(block_bytes)[0]
+
+
+def make_dag(width):
+    """
+    root -> width siblings -> merge (parents: all siblings) -> tip
+    :return: (dictionary: name -> (block bytes, hash), list of the block bytes, in reverse order)
+    """
+    blocks = {'root': make_block([GENESIS_HASH], 'root')}
+    for index in range(width):
+        blocks[f'sibling{index}'] = make_block([blocks['root'][1]], f'sibling{index}')
+    blocks['merge'] = make_block([blocks[f'sibling{index}'][1] for index in range(width)], 'merge')
+    blocks['tip'] = make_block([blocks['merge'][1]], 'tip')
+    return blocks, [block_bytes for block_bytes, _ in reversed(list(blocks.values()))]
+
+
+class FakeNode:
+    """
+    Accepts a block only when all its parents were accepted, records the submit order and the max number of
+    requests in flight.
+    """
+
+    def __init__(self, reject=(), orphan_once=()):
+        self.accepted = [GENESIS_HASH]
+        self.reject = set(reject)
+        self.orphan_once = set(orphan_once)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def handle(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.in_flight -= 1
+        block_hash, parent_hashes = block_hash_and_parents(bytes.fromhex(request['params'][0]))
+        error = None
+        if block_hash in self.orphan_once:
+            self.orphan_once.discard(block_hash)
+            error = {'code': -1, 'message': 'Block has missing parents'}
+        elif not all(parent_hash in self.accepted for parent_hash in parent_hashes):
+            error = {'code': -1, 'message': 'submitted before its parents'}
+        elif block_hash in self.reject:
+            error = {'code': -1, 'message': 'bad block'}
+        else:
+            self.accepted.append(block_hash)
+        return {'result': None, 'error': error, 'id': request['id']}
+
+
+def submit(blocks, node, concurrency):
+    client = AsyncJsonRpcClient(transport=LocalTransport(node.handle), concurrency=concurrency)
+    return asyncio.run(submit_dag_async(blocks, client, concurrency=concurrency, retry_delay=0.001))
+
+
+def test_parents_are_submitted_before_children_within_the_in_flight_bound():
+    named_blocks, blocks = make_dag(width=6)
+    node = FakeNode()
+    report = submit(blocks, node, concurrency=3)
+    assert report['accepted'] == report['blocks'] == len(named_blocks)
+    assert report['rejected'] == report['skipped'] == 0
+    assert node.accepted[1] == named_blocks['root'][1]
+    assert node.accepted[-2:] == [named_blocks['merge'][1], named_blocks['tip'][1]]
+    assert report['max_in_flight'] == node.max_in_flight == 3
+
+
+def test_orphans_are_submitted_again():
+    named_blocks, blocks = make_dag(width=2)
+    node = FakeNode(orphan_once={named_blocks['sibling1'][1]})
+    report = submit(blocks, node, concurrency=4)
+    assert report['accepted'] == len(named_blocks)
+    assert report['retries'] == 1
+
+
+def test_descendants_of_a_rejected_block_are_skipped():
+    named_blocks, blocks = make_dag(width=3)
+    node = FakeNode(reject={named_blocks['sibling1'][1]})
+    report = submit(blocks, node, concurrency=4)
+    assert report['rejected'] == 1
+    assert report['skipped'] == 2            # merge and tip
+    assert list(report['errors']) == [named_blocks['sibling1'][1].hex()]
+    assert set(node.accepted) == {GENESIS_HASH} | {named_blocks[name][1] for name in ('root', 'sibling0', 'sibling2')}
+
+
+def test_cartridge_blocks_are_read_when_submitted(tmp_path):
+    named_blocks, blocks = make_dag(width=4)
+    file_name = str(tmp_path / 'dag.cart')
+    save_blocks_cartridge(blocks, file_name)
+    node = FakeNode()
+    report = submit(file_name, node, concurrency=2)
+    assert report['accepted'] == report['blocks'] == len(named_blocks)
+    assert node.accepted[-1] == named_blocks['tip'][1]
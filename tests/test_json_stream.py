@@ -0,0 +1,30 @@
+"""
+Incremental decoding of json documents split into chunks at every position.
+"""
+import json
+import pytest
+from kaspy_tools.utils.json_stream import iter_json_arrays
+
+DOCUMENT = {'result': {'verboseBlocks': [{'hash': 'ab' * 4, 'difficulty': 1.5e3, 'bits': '207fffff'},
+                                         {'hash': 'cd' * 4, 'difficulty': 0.000123, 'blueScore': 12}],
+                       'floats': [1.5e3, -2.25, 12.0, 7, 1e-07, 3.0e+10, -0.5]},
+            'error': 12e5, 'id': 0}
+ENCODED = json.dumps(DOCUMENT).encode()
+
+
+def split(data, chunk_size):
+    return [data[start:start + chunk_size] for start in range(0, len(data), chunk_size)]
+
+
+@pytest.mark.parametrize('chunk_size', range(1, len(ENCODED) + 1))
+def test_floats_split_across_chunks(chunk_size):
+    decoded = list(iter_json_arrays(split(ENCODED, chunk_size),
+                                    {('result', 'verboseBlocks'), ('result', 'floats')}, {('error',)}))
+    assert decoded == [(('result', 'verboseBlocks'), block) for block in DOCUMENT['result']['verboseBlocks']] + \
+        [(('result', 'floats'), number) for number in DOCUMENT['result']['floats']] + [(('error',), 12e5)]
+
+
+def test_numbers_cut_before_a_dot_or_an_exponent():
+    assert list(iter_json_arrays([b'{"error": 12e', b'5}'], set(), {('error',)})) == [(('error',), 12e5)]
+    assert list(iter_json_arrays([b'{"a": [1.5e', b'3, 2]}'], {('a',)})) == [(('a',), 1.5e3), (('a',), 2)]
+    assert list(iter_json_arrays([b'{"a": [12.', b'5]}'], {('a',)})) == [(('a',), 12.5)]
@@ -0,0 +1,52 @@
+"""
+The incremental MerkleTree against the original (level by level) Merkle root computation.
+"""
+import pytest
+from kaspy_tools.kaspa_crypto.merkle_root import MerkleTree
+from kaspy_tools.utils.general_utils import hash_256
+
+
+def reference_merkle_root(elements):
+    """ The Merkle root computation that MerkleTree replaced """
+    current_level = list(elements)
+    while len(current_level) > 1:
+        if len(current_level) % 2 == 1:
+            current_level.append(current_level[-1])
+        current_level = [hash_256(current_level[i] + current_level[i + 1]) for i in range(0, len(current_level), 2)]
+    return current_level[0]
+
+
+def make_leaves(count, salt=b''):
+    return [hash_256(salt + index.to_bytes(4, 'little')) for index in range(count)]
+
+
+def assert_proofs(tree, leaves):
+    for index, leaf in enumerate(leaves):
+        assert MerkleTree.verify_proof(leaf, tree.proof(index), tree.root)
+        assert not MerkleTree.verify_proof(hash_256(leaf), tree.proof(index), tree.root)
+
+
+@pytest.mark.parametrize('count', range(1, 71))
+def test_built_tree_matches_reference(count):
+    leaves = make_leaves(count)
+    tree = MerkleTree(leaves)
+    assert tree.root == reference_merkle_root(leaves) == MerkleTree.merkle_root(leaves)
+    assert_proofs(tree, leaves)
+
+
+def test_appended_tree_matches_reference():
+    leaves = make_leaves(70)
+    tree = MerkleTree()
+    for count, leaf in enumerate(leaves, start=1):
+        assert tree.append(leaf) == reference_merkle_root(leaves[:count])
+        assert_proofs(tree, leaves[:count])
+
+
+@pytest.mark.parametrize('count', range(1, 71))
+def test_updated_tree_matches_reference(count):
+    leaves = make_leaves(count)
+    tree = MerkleTree(leaves)
+    for index, new_leaf in enumerate(make_leaves(count, salt=b'updated')):
+        leaves[index] = new_leaf
+        assert tree.update(index, new_leaf) == reference_merkle_root(leaves)
+    assert_proofs(tree, leaves)
@@ -0,0 +1,31 @@
+"""
+Serialization of transactions built with Tx.tx_factory.
+"""
+from kaspy_tools.kaspa_model.tx import Tx, NATIVE_SUBNETWORK, VERSION_1
+from kaspy_tools.kaspa_model.tx_out import TxOut
+from kaspy_tools.kaspa_model.tx_script import TxScript
+from kaspy_tools.utils import general_utils
+
+OWNER = b'\x01' * 20
+COINBASE_SUBNETWORK_BYTES = b'\x00' * 19 + b'\x01'
+
+
+def make_tx(subnetwork_id_bytes, **payload_kwargs):
+    tx_out = TxOut.tx_out_factory(value=50, script_pub_key=TxScript.script_pub_hush_factory(OWNER))
+    return Tx.tx_factory(version_bytes=VERSION_1, tx_in_list=[], tx_out_list=[tx_out], locktime_int=0,
+                         subnetwork_id_bytes=subnetwork_id_bytes, gas_bytes=bytes(8), **payload_kwargs)
+
+
+def test_native_tx_ignores_payload_arguments():
+    plain = bytes(make_tx(NATIVE_SUBNETWORK))
+    with_payload = bytes(make_tx(NATIVE_SUBNETWORK, payload_hash=general_utils.hash_256(b'abc'), payload=b'abc'))
+    assert plain == with_payload
+    assert plain.endswith(NATIVE_SUBNETWORK)
+
+
+def test_non_native_tx_serializes_its_payload():
+    payload = b'\x07' * 10
+    payload_hash = general_utils.hash_256(payload)
+    tx = make_tx(COINBASE_SUBNETWORK_BYTES, payload_hash=payload_hash, payload=payload)
+    assert bytes(tx).endswith(bytes(8) + payload_hash + general_utils.write_varint(len(payload)) + payload)
+    assert tx.payload_length_int == len(payload)
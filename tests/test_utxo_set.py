@@ -0,0 +1,56 @@
+"""
+Apply / rollback round trips of UtxoSet journals (the undo data of utxo_tracker).
+"""
+from kaspy_tools.kaspa_model.tx_out import TxOut
+from kaspy_tools.kaspa_model.tx_script import TxScript
+from kaspy_tools.kaspa_model.utxo_set import UtxoSet
+
+OWNER = b'\x01' * 20
+
+
+def make_tx_out(tx_id, out_index, value=50):
+    return TxOut.tx_out_factory(value=value, script_pub_key=TxScript.script_pub_hush_factory(OWNER),
+                                tx_id=tx_id, out_index=out_index)
+
+
+def utxo_state(utxo_set):
+    return sorted((UtxoSet.outpoint_of(entry), entry['output'].get_value(), entry['used']) for entry in utxo_set)
+
+
+def test_rollback_of_output_created_and_spent_in_the_same_block():
+    utxo_set = UtxoSet()
+    utxo_set.add(make_tx_out('cb1', 0))
+    before = utxo_state(utxo_set)
+    journal = []
+    utxo_set.spend(('cb1', 0), journal)           # tx A spends cb1:0
+    utxo_set.add(make_tx_out('A', 0), journal)
+    utxo_set.spend(('A', 0), journal)             # tx B spends A:0
+    utxo_set.add(make_tx_out('B', 0), journal)
+    assert [UtxoSet.outpoint_of(entry) for entry in utxo_set] == [('B', 0)]
+    utxo_set.rollback(journal)
+    assert utxo_state(utxo_set) == before
+    assert utxo_set.utxos_of(OWNER)[0] is utxo_set[('cb1', 0)]
+
+
+def test_rollback_restores_an_overwritten_output():
+    utxo_set = UtxoSet()
+    utxo_set.add(make_tx_out('dup', 0, value=10))
+    before = utxo_state(utxo_set)
+    journal = []
+    utxo_set.add(make_tx_out('dup', 0, value=20), journal)
+    assert utxo_set[('dup', 0)]['output'].get_value() == 20
+    utxo_set.rollback(journal)
+    assert utxo_state(utxo_set) == before
+
+
+def test_rollback_keeps_the_used_flag():
+    utxo_set = UtxoSet()
+    utxo_set.add(make_tx_out('cb1', 0))
+    utxo_set.add(make_tx_out('cb2', 0))
+    chosen, _ = utxo_set.take_unused(1, [OWNER])
+    journal = []
+    utxo_set.spend(UtxoSet.outpoint_of(chosen[0]), journal)
+    utxo_set.rollback(journal)
+    assert utxo_set[UtxoSet.outpoint_of(chosen[0])]['used']
+    still_free, _ = utxo_set.take_unused(2, [OWNER])
+    assert [UtxoSet.outpoint_of(entry) for entry in still_free] == [('cb2', 0)]
@@ -0,0 +1,32 @@
+"""
+Save / load round trips of utxo snapshots.
+"""
+from kaspy_tools.kaspa_model.tx_out import TxOut
+from kaspy_tools.kaspa_model.tx_script import TxScript
+from kaspy_tools.kaspa_model.utxo_set import UtxoSet
+from kaspy_tools.kaspad.kaspa_dags.utxo_snapshot import UtxoSnapshot, save_utxo_snapshot
+
+OWNER = b'\x01' * 20
+
+
+def make_tx_out(tx_id, out_index, value=50):
+    return TxOut.tx_out_factory(value=value, script_pub_key=TxScript.script_pub_hush_factory(OWNER),
+                                tx_id=tx_id, out_index=out_index)
+
+
+def test_snapshot_keeps_the_used_flag(tmp_path):
+    utxo_set = UtxoSet()
+    for tx_id in ('aa' * 32, 'bb' * 32, 'cc' * 32):
+        utxo_set.add(make_tx_out(tx_id, 0))
+    chosen, _ = utxo_set.take_unused(2, [OWNER])
+    file_name = str(tmp_path / 'utxos.snapshot')
+    assert save_utxo_snapshot(utxo_set, file_name) == 3
+
+    with UtxoSnapshot(file_name) as snapshot:
+        loaded = snapshot.to_utxo_set()
+    assert sorted((UtxoSet.outpoint_of(entry), entry['used']) for entry in loaded) == \
+        sorted((UtxoSet.outpoint_of(entry), entry['used']) for entry in utxo_set)
+    still_free, _ = loaded.take_unused(3, [OWNER])
+    assert [UtxoSet.outpoint_of(entry) for entry in still_free] == \
+        [outpoint for outpoint in (('aa' * 32, 0), ('bb' * 32, 0), ('cc' * 32, 0))
+         if outpoint not in [UtxoSet.outpoint_of(entry) for entry in chosen]]
@@ -98,19 +98,41 @@ def read_varint(bytes_stream):
     if first_byte == 0xfd:  # 0xfd means the next 2 bytes are the number
         next_2_bytes = bytes_stream.read(2)
         int_value = int_from_little_endian(next_2_bytes)
-        return int_value, bytes(first_byte) + next_2_bytes
+        return int_value, bytes([first_byte]) + next_2_bytes
     elif first_byte == 0xfe:  # 0xfe means the next 4 bytes are the number
         next_4_bytes = bytes_stream.read(4)
         int_value = int_from_little_endian(next_4_bytes)
-        return int_value, bytes(first_byte) + next_4_bytes
+        return int_value, bytes([first_byte]) + next_4_bytes
     elif first_byte == 0xff:  # 0xff means the next 8 bytes are the number
         next_8_bytes = bytes_stream.read(8)
         int_value = int_from_little_endian(next_8_bytes)
-        return int_value, bytes(first_byte) + next_8_bytes
+        return int_value, bytes([first_byte]) + next_8_bytes
     else:  # everything else is just the integer
         return first_byte, bytes([first_byte])
 
 
+VARINT_PREFIX_SIZES = {0xfd: 2, 0xfe: 4, 0xff: 8}
+
+
+def read_varint_at(buffer_view, offset):
+    """
+    Reads a variable integer at a given offset of a memoryview, without copying.
+
+    :param buffer_view: A memoryview of the buffer to read from
+    :param offset: The offset of the varint in the buffer
+    :return: Returns 3 variables:
+            1. int_value = the int value of the varint
+            2. varint_view = a memoryview slice holding the varint bytes
+            3. next_offset = the offset right after the varint
+    """
+    first_byte = buffer_view[offset]
+    if first_byte < 0xfd:
+        return first_byte, buffer_view[offset:offset + 1], offset + 1
+    next_offset = offset + 1 + VARINT_PREFIX_SIZES[first_byte]
+    int_value = int.from_bytes(buffer_view[offset + 1:next_offset], "little")
+    return int_value, buffer_view[offset:next_offset], next_offset
+
+
 def write_varint(value):
     """
     write_varint creates a bytes object that encodes a value based on the bitcoin varint.
@@ -127,6 +149,99 @@ def write_varint(value):
         return b'\xff' + value.to_bytes(8, byteorder='little')
 
 
+def varint_size(value):
+    """
+    Returns the number of bytes that write_varint(value) produces, without encoding it.
+    :param value: value to encode (int)
+    :return: The size (int) of the varint encoding
+    """
+    if value < 0xfd:
+        return 1
+    elif value <= 0xffff:
+        return 3
+    elif value <= 0xffffffff:
+        return 5
+    else:
+        return 9
+
+
+def write_varint_into(buffer, offset, value):
+    """
+    Encodes a varint directly into a preallocated buffer (see write_into() of the kaspa_model classes).
+    :param buffer: A bytearray (or writable memoryview) to write into
+    :param offset: The offset to write at
+    :param value: value to encode (int)
+    :return: The offset right after the varint
+    """
+    if value < 0xfd:
+        buffer[offset] = value
+        return offset + 1
+    varint_bytes = write_varint(value)
+    end = offset + len(varint_bytes)
+    buffer[offset:end] = varint_bytes
+    return end
+
+
+def write_bytes_into(buffer, offset, element_bytes):
+    """
+    Copies a bytes object (or memoryview) into a preallocated buffer.
+    :param buffer: A bytearray (or writable memoryview) to write into
+    :param offset: The offset to write at
+    :param element_bytes: The bytes to copy
+    :return: The offset right after the copied bytes
+    """
+    end = offset + len(element_bytes)
+    buffer[offset:end] = element_bytes
+    return end
+
+
+def serialize_into_bytearray(element):
+    """
+    Serializes a model object (Block, Tx, TxIn, TxOut, TxScript) in a single pass:
+    the exact size is computed first, so the buffer is allocated once, and then each object writes its
+    fields directly into it (the write_into() protocol).
+    :param element: An object with serialized_size() and write_into(buffer, offset) methods
+    :return: The serialized element as a bytearray
+    """
+    buffer = bytearray(element.serialized_size())
+    element.write_into(buffer, 0)
+    return buffer
+
+
+def serialize_into_stream(element, bytes_stream):
+    """
+    Serializes a model object into a BytesIO at its current position, without building intermediate bytes.
+    The stream is grown once to the exact size, and the object writes directly into the stream's buffer.
+    :param element: An object with serialized_size() and write_into(buffer, offset) methods
+    :param bytes_stream: A BytesIO object
+    :return: The number of bytes written
+    """
+    size = element.serialized_size()
+    start = bytes_stream.tell()
+    if size:
+        bytes_stream.seek(start + size - 1)
+        if not bytes_stream.read(1):   # grow the stream (it must not be resized while its buffer is exported)
+            bytes_stream.write(b'\x00')
+        with bytes_stream.getbuffer() as stream_view:
+            element.write_into(stream_view, start)
+    bytes_stream.seek(start + size)
+    return size
+
+
+def materialize_bytes(element):
+    """
+    Returns element as a bytes object.
+    The zero-copy parser (Block.parse_block) stores fields as memoryview slices of the parsed buffer.
+    Those are copied into a new bytes object here, anything else is returned as is.
+
+    :param element: A memoryview, bytes object or None
+    :return: The element as bytes (or None)
+    """
+    if type(element) is memoryview:
+        return element.tobytes()
+    return element
+
+
 # ========== Misc element related methods ========== #
 
 
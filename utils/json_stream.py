@@ -0,0 +1,155 @@
+"""
+This module decodes big json documents incrementally, from an iterator of bytes chunks (e.g: an http body).
+Only the elements of selected arrays are decoded, one at a time, so a response of any size is decoded
+with the memory of a single element.
+
+Example: the getBlocks response {"result": {"rawBlocks": [...], "verboseBlocks": [...]}, "error": null, "id": 0}
+    for path, element in iter_json_arrays(chunks, {('result', 'rawBlocks'), ('result', 'verboseBlocks')}):
+        ...
+"""
+import codecs
+import json
+
+DEFAULT_CHUNK_SIZE = 2 ** 16
+COMPACT_SIZE = 2 ** 20      # drop the consumed part of the buffer when it is bigger than this
+WHITESPACE = ' \t\n\r'
+NUMBER_CHARACTERS = '0123456789.eE+-'
+
+
+class _JsonStream:
+    """
+    A text buffer over an iterator of bytes chunks, with a position, that is filled on demand.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json_decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._position = 0
+        self._eof = False
+
+    def _fill(self):
+        """
+        :return: False if there is no more input
+        """
+        if self._eof:
+            return False
+        for chunk in self._chunks:
+            text = self._decoder.decode(chunk)
+            if text:
+                if self._position > COMPACT_SIZE:
+                    self._buffer = self._buffer[self._position:]
+                    self._position = 0
+                self._buffer += text
+                return True
+        self._buffer += self._decoder.decode(b'', final=True)
+        self._eof = True
+        return False
+
+    def peek(self):
+        """
+        :return: The next non whitespace character (not consumed), or '' at the end of input
+        """
+        while True:
+            while self._position < len(self._buffer) and self._buffer[self._position] in WHITESPACE:
+                self._position += 1
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._fill():
+                return ''
+
+    def expect(self, characters):
+        """
+        Consume the next non whitespace character, which must be one of characters.
+        :return: The character
+        """
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError(f'json stream: expected one of {characters!r} at {self._position}, found {character!r}')
+        self._position += 1
+        return character
+
+    def read_value(self):
+        """
+        Decode the next json value (more input is read until the value is complete).
+        :return: The value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number may continue in the next chunk (raw_decode stops before a trailing '.' or 'e' too):
+            # make sure the character after it was read, and is not part of a number
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and \
+                    (end == len(self._buffer) or self._buffer[end] in NUMBER_CHARACTERS):
+                if self._fill():
+                    continue
+            self._position = end
+            return value
+
+
+def iter_json_arrays(chunks, array_paths, value_paths=()):
+    """
+    Incrementally decode a json document, and yield the elements of the arrays at array_paths, one at a time.
+    Values that are not on a path to one of the arrays (or in value_paths) are decoded and dropped.
+    :param chunks: An iterator of bytes chunks (e.g: response.iter_content(chunk_size))
+    :param array_paths: A set of paths (tuples of object keys) of arrays, e.g: {('result', 'verboseBlocks')}
+    :param value_paths: A set of paths of values that are yielded whole, e.g: {('error',)}
+    :return: A generator of (path, element or value) tuples, in document order
+    """
+    array_paths = set(array_paths)
+    value_paths = set(value_paths)
+    prefixes = {path[:length] for path in array_paths | value_paths for length in range(len(path))}
+    stream = _JsonStream(chunks)
+    yield from _iter_value(stream, (), array_paths, value_paths, prefixes)
+
+
+def _iter_value(stream, path, array_paths, value_paths, prefixes):
+    if path in value_paths:
+        yield path, stream.read_value()
+    elif path in array_paths and stream.peek() == '[':
+        stream.expect('[')
+        if stream.peek() == ']':
+            stream.expect(']')
+            return
+        while True:
+            yield path, stream.read_value()
+            if stream.expect(',]') == ']':
+                return
+    elif path in prefixes and stream.peek() == '{':
+        stream.expect('{')
+        if stream.peek() == '}':
+            stream.expect('}')
+            return
+        while True:
+            key = stream.read_value()
+            stream.expect(':')
+            yield from _iter_value(stream, path + (key,), array_paths, value_paths, prefixes)
+            if stream.expect(',}') == '}':
+                return
+    else:
+        stream.read_value()
+
+
+def project(element, projection):
+    """
+    Keep only some of the fields of a decoded json element.
+    :param element: A decoded json value
+    :param projection: True to keep the whole element, or a dictionary: key -> projection of its value.
+                       Lists are projected element by element.
+                       Example: {'hash': True, 'rawRx': {'txId': True, 'vout': True}}
+    :return: The projected element
+    """
+    if projection is True:
+        return element
+    if isinstance(element, list):
+        return [project(item, projection) for item in element]
+    if isinstance(element, dict):
+        return {key: project(element[key], key_projection) for key, key_projection in projection.items()
+                if key in element}
+    return element